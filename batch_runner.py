@@ -0,0 +1,367 @@
+#batch_runner.py
+
+'''
+Пакетный запуск endoscope_motion для множества деталей.
+
+Пример:
+    python batch_runner.py src/json/ --result-dir result --workers 8
+'''
+
+import argparse
+import functools
+import glob
+import os
+import sys
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+
+from calibration_scheduler import parse_policy
+from collision_check import DEFAULT_DIAMETER, check_part, unreachable_holes
+from delay_planner import DelayPlanner
+from endoscope_motion import process_part, regenerate_part, result_paths
+from hole_stream import read_header
+from hole_table import HoleTable
+from machine_model import MachineModel
+from post_processor import DEFAULT_OUTPUTS, POST_PROCESSORS
+from solution_cache import SolutionCache
+from solver_diagnostics import SolverDiagnostics, configure_logging
+
+
+def is_part_file(path: str) -> bool:
+    '''
+    Признак JSON файла детали: объект верхнего уровня с параметром endoscope_length.
+    '''
+    try:
+        return 'endoscope_length' in read_header(path, ('endoscope_length',))
+    except ValueError:
+        return False
+
+
+def collect_part_files(paths: list) -> list:
+    '''
+    Формирует список JSON файлов деталей. Папки раскрываются в отсортированный список
+    *.json файлов деталей (is_part_file), остальные JSON файлы папки пропускаются; файлы
+    передаются как есть. Повторы исключаются.
+
+    Parameters:
+    - paths: list.
+        Пути до JSON файлов и/или папок с JSON файлами.
+
+    Returns:
+    - list.
+        Пути до JSON файлов.
+    '''
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(file for file in sorted(glob.glob(os.path.join(path, '*.json')))
+                         if is_part_file(file))
+        else:
+            files.append(path)
+
+    return list(dict.fromkeys(files))
+
+
+def run_part(json_path: str, result_dir: str, *, cache_path: str = None,
+             incremental: bool = False, binary: bool = False, model_path: str = None,
+             diameter: float = DEFAULT_DIAMETER, optimize_order: bool = False,
+             machine_path: str = None, adaptive_delays: bool = False,
+             calibration: str = 'legacy', diagnostics: bool = False, log_level: str = None,
+             profile: str = None, profile_with: tuple = (), precision: int = None,
+             outputs: tuple = DEFAULT_OUTPUTS, optimize: bool = False) -> dict:
+    '''
+    Обработка одной детали в рабочем процессе. Параметры после result_dir передаются
+    только по имени. Исключения не пробрасываются, а записываются в отчет.
+
+    Parameters:
+    - json_path: str.
+        Путь до JSON файла детали.
+    - result_dir: str.
+        Папка для записи результатов.
+    - cache_path: str.
+        Путь до базы кэша решений (процесс открывает собственное соединение) или None.
+    - incremental: bool.
+        Пересчет только измененных отверстий (endoscope_motion.regenerate_part).
+    - binary: bool.
+        Дополнительная запись таблицы .holetab.
+    - model_path: str.
+        STL модель детали для проверки столкновений эндоскопа (collision_check) или None.
+    - diameter: float.
+        Диаметр эндоскопа для проверки столкновений.
+    - optimize_order: bool.
+        Перестановка отверстий в порядок с наименьшим временем цикла (hole_order), в том
+        числе при инкрементальном пересчете.
+    - machine_path: str.
+        JSON файл параметров осей станка (machine_model.MachineModel.from_json) или None.
+    - adaptive_delays: bool.
+        Расчет пауз Delay по перемещениям (delay_planner).
+    - calibration: str.
+        Политика калибровки (calibration_scheduler.parse_policy).
+    - diagnostics: bool.
+        Запись диагностики решателей в solver_diagnostics_for_<name>.csv.
+    - log_level: str.
+        Уровень журнала рабочего процесса (solver_diagnostics.configure_logging) или None.
+    - profile: str.
+        Папка для замеров этапов (instrumentation) <name>.report.json и <name>.trace.json
+        или None.
+    - profile_with: tuple.
+        Дополнительные замеры: 'cprofile', 'tracemalloc'.
+    - precision: int.
+        Количество знаков после запятой в командах или None для вывода чисел без изменения.
+    - outputs: tuple.
+        Форматы результатов (post_processor.POST_PROCESSORS).
+    - optimize: bool.
+        Удаление избыточных команд программ (program_optimizer).
+
+    Returns:
+    - dict.
+        Отчет {'path', 'holes', 'seconds', 'error', 'cache', 'unreachable', 'solver', 'profile'}.
+    '''
+    report = {'path': json_path, 'holes': 0, 'seconds': 0.0, 'error': None, 'cache': None,
+              'unreachable': None, 'solver': None, 'profile': None}
+
+    name = os.path.splitext(os.path.basename(json_path))[0]
+
+    if log_level is not None:
+        configure_logging(log_level)
+
+    if profile is not None:
+        instrumentation.enable('cprofile' in profile_with, 'tracemalloc' in profile_with)
+        instrumentation.reset()
+
+    model = MachineModel.from_json(machine_path) if machine_path else None
+    planner = DelayPlanner(model) if adaptive_delays else None
+    scheduler = parse_policy(calibration, model)
+    solver = SolverDiagnostics() if diagnostics else None
+
+    if incremental:
+        process = functools.partial(regenerate_part, planner=planner, scheduler=scheduler,
+                                    diagnostics=solver, precision=precision, outputs=outputs,
+                                    optimize=optimize, optimize_order=optimize_order)
+    else:
+        process = functools.partial(process_part, optimize_order=optimize_order, planner=planner,
+                                    scheduler=scheduler, diagnostics=solver, precision=precision,
+                                    outputs=outputs, optimize=optimize)
+
+    begin = time.perf_counter()
+    try:
+        if not is_part_file(json_path):
+            raise ValueError('файл не является деталью (нет параметра endoscope_length)')
+
+        if cache_path is None:
+            report['holes'] = process(json_path, result_dir, binary=binary)
+        else:
+            with SolutionCache(cache_path) as cache:
+                report['holes'] = process(json_path, result_dir, cache, binary)
+                report['cache'] = cache.stats()
+
+        if solver is not None:
+            solver.save(result_paths(result_dir, name)['diagnostics'])
+            report['solver'] = solver.summary()
+
+        if model_path is not None:
+            table = HoleTable.from_json(json_path, poses_path=result_paths(result_dir, name)['coordinates'])
+            report['unreachable'] = unreachable_holes(check_part(model_path, table, diameter))
+    except Exception as error:
+        report['error'] = f'{type(error).__name__}: {error}'
+        report['traceback'] = traceback.format_exc()
+    report['seconds'] = time.perf_counter() - begin
+
+    if profile is not None:
+        report['profile'] = instrumentation.write_run(profile, name)['stages']
+        instrumentation.disable()
+
+    return report
+
+
+def run_batch(paths: list, result_dir: str = 'result', workers: int = None, *,
+              cache_path: str = None, incremental: bool = False, binary: bool = False,
+              model_path: str = None, diameter: float = DEFAULT_DIAMETER,
+              optimize_order: bool = False, machine_path: str = None,
+              adaptive_delays: bool = False, calibration: str = 'legacy',
+              diagnostics: bool = False, log_level: str = None, profile: str = None,
+              profile_with: tuple = (), precision: int = None,
+              outputs: tuple = DEFAULT_OUTPUTS, optimize: bool = False) -> list:
+    '''
+    Распределяет детали по пулу процессов. Для каждой детали записываются собственные
+    файлы .tsc и endoscope_coordinates_for_*.json. Параметры после workers передаются 
+    только по имени и так же передаются в run_part.
+
+    Parameters:
+    - paths: list.
+        Пути до JSON файлов и/или папок с JSON файлами.
+    - result_dir: str.
+        Папка для записи результатов.
+    - workers: int.
+        Количество процессов (по умолчанию os.cpu_count()).
+    - cache_path: str.
+        Путь до базы кэша решений solution_cache.SolutionCache или None.
+    - incremental: bool.
+        Пересчет только измененных отверстий относительно предыдущего запуска.
+    - binary: bool.
+        Запись двоичной таблицы .holetab рядом с JSON результатом.
+    - model_path: str.
+        STL модель детали для проверки столкновений эндоскопа или None.
+    - diameter: float.
+        Диаметр эндоскопа для проверки столкновений.
+    - optimize_order: bool.
+        Оптимизация порядка обхода отверстий (также при incremental).
+    - machine_path: str.
+        JSON файл параметров осей станка (machine_model.MachineModel.from_json) или None.
+    - adaptive_delays: bool.
+        Расчет пауз Delay по перемещениям вместо фиксированных значений.
+    - calibration: str.
+        Политика калибровки (calibration_scheduler.parse_policy).
+    - diagnostics: bool.
+        Запись диагностики решателей для каждой детали.
+    - log_level: str.
+        Уровень журнала рабочих процессов или None (без вывода).
+    - profile: str.
+        Папка для замеров этапов по деталям (instrumentation) или None.
+    - profile_with: tuple.
+        Дополнительные замеры: 'cprofile', 'tracemalloc'.
+    - precision: int.
+        Количество знаков после запятой в командах .tsc или None.
+    - outputs: tuple.
+        Форматы результатов: 'terminal', 'gcode', 'json', 'csv', 'binary'.
+    - optimize: bool.
+        Удаление избыточных команд программ .tsc и G-code.
+
+    Returns:
+    - list.
+        Отчеты run_part в порядке входных файлов.
+    '''
+    files = collect_part_files(paths)
+    os.makedirs(result_dir, exist_ok=True)
+
+    options = dict(cache_path=cache_path, incremental=incremental, binary=binary,
+                   model_path=model_path, diameter=diameter, optimize_order=optimize_order,
+                   machine_path=machine_path, adaptive_delays=adaptive_delays,
+                   calibration=calibration, diagnostics=diagnostics, log_level=log_level,
+                   profile=profile, profile_with=tuple(profile_with), precision=precision,
+                   outputs=tuple(outputs), optimize=optimize)
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_part, path, result_dir, **options): path for path in files}
+        for future in as_completed(futures):
+            reports[futures[future]] = future.result()
+
+    return [reports[path] for path in files]
+
+
+def format_summary(reports: list, wall_time: float) -> str:
+    '''
+    Текстовая сводка по времени обработки и ошибкам для каждого файла.
+    '''
+    width = max([len(report['path']) for report in reports] + [4])
+
+    lines = [f"{'Файл':<{width}}  {'Отверстий':>9}  {'Время, с':>9}  Статус"]
+    for report in reports:
+        status = 'OK' if report['error'] is None else report['error']
+        lines.append(f"{report['path']:<{width}}  {report['holes']:>9}  "
+                     f"{report['seconds']:>9.3f}  {status}")
+
+    cached = [report['cache'] for report in reports if report['cache'] is not None]
+    if cached:
+        hits = sum(stats['hits'] for stats in cached)
+        misses = sum(stats['misses'] for stats in cached)
+        lines.append(f'Кэш решений: попаданий {hits}, промахов {misses}')
+
+    checked = [report for report in reports if report['unreachable'] is not None]
+    for report in checked:
+        if report['unreachable']:
+            lines.append(f"{report['path']}: недостижимые отверстия - {', '.join(report['unreachable'])}")
+    if checked:
+        unreachable = sum(len(report['unreachable']) for report in checked)
+        lines.append(f'Проверка столкновений: недостижимых отверстий {unreachable}')
+
+    solved = [report['solver'] for report in reports if report.get('solver') is not None]
+    if solved:
+        solutions = sum(summary['solutions'] for summary in solved)
+        failures = sum(summary['failed'] for summary in solved)
+        residual = max(summary['max_residual'] for summary in solved)
+        lines.append(f'Диагностика решателей: решений {solutions}, неудачных {failures}, '
+                     f'наибольшая невязка {residual:.3g}')
+
+    profiled = [report['profile'] for report in reports if report.get('profile')]
+    if profiled:
+        stages = {}
+        for profile in profiled:
+            for name, row in profile.items():
+                stages[name] = stages.get(name, 0.0) + row['self_seconds']
+        lines.append('Время этапов (собственное): ' + ', '.join(
+            f'{name} {seconds:.3f} с' for name, seconds in sorted(stages.items(), key=lambda item: -item[1])))
+
+    failed = sum(report['error'] is not None for report in reports)
+    lines.append(f'Всего файлов: {len(reports)}, ошибок: {failed}, '
+                 f'общее время: {wall_time:.3f} с')
+
+    return '\n'.join(lines)
+
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(description='Пакетный расчет положений эндоскопа.')
+    parser.add_argument('paths', nargs='+',
+                        help='JSON файлы с координатами отверстий или папки с ними')
+    parser.add_argument('--result-dir', default='result',
+                        help='папка для записи результатов')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='количество процессов (по умолчанию - число ядер)')
+    parser.add_argument('--cache', default=None,
+                        help='файл SQLite кэша решений (по умолчанию кэш не используется)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='пересчитывать только измененные отверстия')
+    parser.add_argument('--binary', action='store_true',
+                        help='записывать также двоичную таблицу .holetab')
+    parser.add_argument('--model', default=None,
+                        help='STL модель детали для проверки столкновений эндоскопа')
+    parser.add_argument('--diameter', type=float, default=DEFAULT_DIAMETER,
+                        help='диаметр эндоскопа для проверки столкновений')
+    parser.add_argument('--optimize-order', action='store_true',
+                        help='переставить отверстия для сокращения времени цикла')
+    parser.add_argument('--adaptive-delays', action='store_true',
+                        help='рассчитывать паузы Delay по перемещениям')
+    parser.add_argument('--machine', default=None,
+                        help='JSON файл параметров осей станка')
+    parser.add_argument('--calibration', default='legacy',
+                        help="политика калибровки: legacy, holes:N:N, travel:MM:MM, time:S:S, angle:DEG:DEG")
+    parser.add_argument('--diagnostics', action='store_true',
+                        help='записывать диагностику решателей solver_diagnostics_for_*.csv')
+    parser.add_argument('--log-level', default=None,
+                        help='уровень журнала (DEBUG, INFO, WARNING), по умолчанию без вывода')
+    parser.add_argument('--profile', default=None,
+                        help='папка для замеров времени этапов по деталям (Chrome trace)')
+    parser.add_argument('--profile-with', nargs='*', default=[], choices=('cprofile', 'tracemalloc'),
+                        help='дополнительные замеры при --profile')
+    parser.add_argument('--precision', type=int, default=None,
+                        help='знаков после запятой в командах .tsc (по умолчанию без изменения)')
+    parser.add_argument('--outputs', nargs='+', choices=list(POST_PROCESSORS), default=list(DEFAULT_OUTPUTS),
+                        help='форматы результатов, записываемые за один проход')
+    parser.add_argument('--optimize', action='store_true',
+                        help='удалить избыточные команды программ .tsc и G-code')
+    args = parser.parse_args(argv)
+
+    begin = time.perf_counter()
+    reports = run_batch(args.paths, args.result_dir, args.workers, cache_path=args.cache,
+                        incremental=args.incremental, binary=args.binary, model_path=args.model,
+                        diameter=args.diameter, optimize_order=args.optimize_order,
+                        machine_path=args.machine, adaptive_delays=args.adaptive_delays,
+                        calibration=args.calibration, diagnostics=args.diagnostics,
+                        log_level=args.log_level, profile=args.profile,
+                        profile_with=tuple(args.profile_with), precision=args.precision,
+                        outputs=tuple(args.outputs), optimize=args.optimize)
+
+    print(format_summary(reports, time.perf_counter() - begin))
+
+    return 1 if any(report['error'] is not None for report in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
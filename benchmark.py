@@ -0,0 +1,322 @@
+#benchmark.py
+
+'''
+Измерение производительности расчета положений эндоскопа и записи результатов на
+синтетических наборах отверстий (от 10 до 1 000 000 отверстий). Этапы измеряются
+отдельно:
+- root - Endoscope_Root.find_point для каждого отверстия (итерационный решатель);
+- angles - Endoscope_Batch.find_angles (начальное положение и углы);
+- solve - Endoscope_Batch.solve (начальное и конечное положения);
+- emit - запись блоков команд в буфер по шаблону GCodeMaker (render_hole_blocks);
+- write_json - запись координат endoscope_coordinates_for_*.json;
+- write_tsc - запись последовательности команд .tsc с калибровками.
+
+Этапы, выполняемые по одному отверстию (root, emit, write_*), измеряются на первых
+sample отверстиях. Для каждого этапа сохраняется производительность (отверстий в секунду)
+и пиковый расход памяти (tracemalloc, отдельным проходом). Результаты сравниваются с
+сохраненной базой: снижение производительности больше threshold считается регрессией.
+
+Пример:
+    python benchmark.py --sizes 10 1000 100000 --save-baseline result/benchmark.json
+    python benchmark.py --sizes 10 1000 100000 --baseline result/benchmark.json
+'''
+
+import gc
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# scipy.optimize импортируется при первом вызове решателя: импорт до измерений исключает
+# его из времени первого этапа.
+import scipy.optimize
+
+from endoscope_motion import (Endoscope_Batch, Endoscope_Root, hole_solution, render_hole_blocks,
+                              write_command_sequence)
+from hole_stream import JsonObjectWriter
+
+
+KINDS = ('axis', 'oblique', 'degenerate', 'mixed')
+STAGES = ('root', 'angles', 'solve', 'emit', 'write_json', 'write_tsc')
+
+DEFAULT_SIZES = (10, 1000, 100000)
+DEFAULT_LENGTH = 250.0
+
+
+def generate_holes(count: int, kind: str = 'mixed', seed: int = 0) -> tuple:
+    '''
+    Синтетический набор отверстий.
+
+    Parameters:
+    - count: int.
+        Количество отверстий.
+    - kind: str.
+        Вид отверстий:
+        - 'axis' - оси параллельны осям X, Y или Z;
+        - 'oblique' - оси произвольного направления;
+        - 'degenerate' - оси параллельны Z (угол phi не определен), каждое сотое
+        отверстие нулевой глубины (решается итерационно);
+        - 'mixed' - отверстия всех трех видов поровну.
+    - seed: int.
+        Начальное значение генератора случайных чисел.
+
+    Returns:
+    - tuple.
+        Массивы N x 3 координат входных и выходных отверстий.
+    '''
+    rng = np.random.default_rng(seed)
+
+    if kind == 'mixed':
+        parts = [generate_holes(n, part, seed + i)
+                 for i, (part, n) in enumerate(zip(KINDS[:3], np.diff(np.linspace(0, count, 4).astype(int))))]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    inputs = rng.uniform(-200, 200, (count, 3))
+    depth = rng.uniform(5, 50, count)
+
+    if kind == 'axis':
+        directions = np.concatenate([np.eye(3), -np.eye(3)])[rng.integers(0, 6, count)]
+    elif kind == 'oblique':
+        directions = rng.normal(size=(count, 3))
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    elif kind == 'degenerate':
+        directions = np.zeros((count, 3))
+        directions[:, 2] = rng.choice([-1.0, 1.0], count)
+        depth[::100] = 0
+    else:
+        raise ValueError(f'Неизвестный вид отверстий: {kind}')
+
+    return inputs, inputs + directions * depth[:, None]
+
+
+def write_part(path: str, inputs: np.ndarray, outputs: np.ndarray, e_len: float = DEFAULT_LENGTH,
+               starting_height: float = 0):
+    '''
+    Запись синтетического набора отверстий в JSON файл детали (формат src/json).
+    '''
+    with open(path, 'w') as file:
+        file.write('{\n' f'    "endoscope_length": {json.dumps(e_len)},\n'
+                   f'    "starting_height": {json.dumps(starting_height)},\n    "holes": ')
+
+        holes = JsonObjectWriter(file, indent=4)
+        for i, (start, end) in enumerate(zip(inputs.tolist(), outputs.tolist()), start=1):
+            holes.write_member(f'hole_{i}', {'start': dict(zip('XYZ', start)),
+                                            'end': dict(zip('XYZ', end))})
+        holes.close()
+
+        file.write('\n}')
+
+
+def stage_functions(inputs: np.ndarray, outputs: np.ndarray, e_len: float, sample: int,
+                    directory: str) -> dict:
+    '''
+    Функции этапов без аргументов. Каждая возвращает количество обработанных отверстий.
+    '''
+    count = min(len(inputs), sample)
+    start, stop = Endoscope_Batch(inputs[:count], outputs[:count], e_len).solve()
+
+    names = [str(i) for i in range(1, count + 1)]
+    start, stop = np.round(start, 3), np.round(stop, 3)
+    starts, stops = start.tolist(), stop.tolist()
+    blocks = render_hole_blocks(names, start, stop, 0)
+
+    def root():
+        for i in range(count):
+            endoscope = Endoscope_Root(inputs[i], outputs[i], e_len)
+            endoscope.find_point(e_len, e_len + endoscope.hole_depth)
+        return count
+
+    def angles():
+        batch = Endoscope_Batch(inputs, outputs, e_len)
+        batch.find_angles(e_len, e_len + batch.hole_depth)
+        return len(inputs)
+
+    def solve():
+        Endoscope_Batch(inputs, outputs, e_len).solve()
+        return len(inputs)
+
+    def emit():
+        return render_hole_blocks(names, start, stop, 0, file=io.StringIO())
+
+    def write_json():
+        with open(os.path.join(directory, 'coordinates.json'), 'w') as file:
+            points = JsonObjectWriter(file)
+            for name, a, b in zip(names, starts, stops):
+                points.write_member('hole_' + name, hole_solution(a, b))
+            points.close()
+        return count
+
+    def write_tsc():
+        write_command_sequence(os.path.join(directory, 'commands.tsc'), blocks)
+        return count
+
+    return {'root': root, 'angles': angles, 'solve': solve, 'emit': emit,
+            'write_json': write_json, 'write_tsc': write_tsc}
+
+
+def measure(function, repeat: int = 3, memory: bool = True) -> dict:
+    '''
+    Лучшее время из repeat запусков и пиковый расход памяти (отдельный запуск под tracemalloc).
+
+    Returns:
+    - dict.
+        {'items', 'seconds', 'throughput', 'peak_mb'}.
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        begin = time.perf_counter()
+        items = function()
+        best = min(best, time.perf_counter() - begin)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+
+    return {'items': items, 'seconds': best, 'throughput': items / best if best > 0 else float('inf'),
+            'peak_mb': peak}
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, kinds=KINDS, stages=STAGES, sample: int = 10000,
+                  repeat: int = 3, memory: bool = True, e_len: float = DEFAULT_LENGTH,
+                  seed: int = 0) -> list:
+    '''
+    Измерение этапов для всех размеров и видов наборов отверстий.
+
+    Parameters:
+    - sizes: iterable.
+        Количество отверстий в наборах.
+    - kinds: iterable.
+        Виды наборов (generate_holes).
+    - stages: iterable.
+        Измеряемые этапы (STAGES).
+    - sample: int.
+        Количество отверстий для этапов, выполняемых по одному отверстию.
+    - repeat: int.
+        Количество запусков этапа (сохраняется лучшее время).
+    - memory: bool.
+        Измерять пиковый расход памяти.
+    - e_len: float.
+        Длина эндоскопа.
+    - seed: int.
+        Начальное значение генератора отверстий.
+
+    Returns:
+    - list.
+        Строки {'kind', 'holes', 'stage', 'items', 'seconds', 'throughput', 'peak_mb'}.
+    '''
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in kinds:
+            for size in sizes:
+                inputs, outputs = generate_holes(size, kind, seed)
+                functions = stage_functions(inputs, outputs, e_len, sample, directory)
+
+                for stage in stages:
+                    row = measure(functions[stage], repeat, memory)
+                    results.append(dict(kind=kind, holes=size, stage=stage, **row))
+
+    return results
+
+
+def result_key(row: dict) -> str:
+
+    return f"{row['kind']}/{row['holes']}/{row['stage']}"
+
+
+def save_baseline(path: str, results: list):
+
+    with open(path, 'w') as file:
+        json.dump({result_key(row): row for row in results}, file, indent=4)
+
+
+def compare_baseline(results: list, baseline_path: str, threshold: float = 0.2) -> list:
+    '''
+    Сравнение производительности с сохраненной базой. В каждую строку results добавляется
+    отношение производительности к базе 'ratio' (None, если этапа нет в базе).
+
+    Returns:
+    - list.
+        Строки с регрессией: производительность ниже базы больше чем на threshold.
+    '''
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+
+    regressions = []
+    for row in results:
+        reference = baseline.get(result_key(row))
+        row['ratio'] = row['throughput'] / reference['throughput'] if reference else None
+
+        if row['ratio'] is not None and row['ratio'] < 1 - threshold:
+            regressions.append(row)
+
+    return regressions
+
+
+def format_results(results: list) -> str:
+
+    lines = [f"{'Набор':<20}  {'Этап':<10}  {'Отверстий':>9}  {'Время, с':>9}  "
+             f"{'Отв./с':>11}  {'Память, МБ':>10}  База"]
+
+    for row in results:
+        peak = f"{row['peak_mb']:.1f}" if row['peak_mb'] is not None else '-'
+        ratio = f"{row['ratio']:.2f}x" if row.get('ratio') is not None else '-'
+        lines.append(f"{row['kind'] + '/' + str(row['holes']):<20}  {row['stage']:<10}  "
+                     f"{row['items']:>9}  {row['seconds']:>9.4f}  {row['throughput']:>11.0f}  "
+                     f"{peak:>10}  {ratio}")
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Измерение производительности расчета и записи команд.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='количество отверстий в наборах (до 1000000)')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS), help='виды наборов')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='этапы')
+    parser.add_argument('--sample', type=int, default=10000,
+                        help='отверстий для этапов, выполняемых по одному отверстию')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='количество запусков этапа (сохраняется лучшее время)')
+    parser.add_argument('--no-memory', action='store_true', help='не измерять расход памяти')
+    parser.add_argument('--baseline', default=None, help='JSON файл базы для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимое относительное снижение производительности')
+    parser.add_argument('--save-baseline', default=None, help='записать результаты как базу')
+    parser.add_argument('--write-part', default=None,
+                        help='записать первый набор в JSON файл детали и завершить работу')
+    args = parser.parse_args()
+
+    if args.write_part:
+        write_part(args.write_part, *generate_holes(args.sizes[0], args.kinds[0]))
+        sys.exit(0)
+
+    results = run_benchmark(args.sizes, args.kinds, args.stages, args.sample, args.repeat,
+                            not args.no_memory)
+
+    regressions = compare_baseline(results, args.baseline, args.threshold) if args.baseline else []
+
+    print(format_results(results))
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+
+    for row in regressions:
+        print(f"Регрессия: {result_key(row)} - {row['ratio']:.2f} от базы")
+
+    sys.exit(1 if regressions else 0)
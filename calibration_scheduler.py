@@ -0,0 +1,399 @@
+#calibration_scheduler.py
+
+'''
+Расстановка калибровок в последовательности команд для терминала. Калибровка по X Y Z
+(FULL_CALIBRATION) и калибровка по Q W (LIGHT_CALIBRATION) назначаются независимо
+условиями (Trigger): через каждые N отверстий, по пройденному пути осей, по оценочному
+времени или по суммарному повороту Q W после предыдущей калибровки того же вида. Перед
+первым отверстием выполняются обе калибровки.
+
+Условия оцениваются по записанному тексту программы (cycle_time.CycleSimulator), поэтому
+планировщику не требуются координаты отверстий.
+
+Пример сравнения политик для готовой программы:
+    python calibration_scheduler.py result/commands_sequence_for_cube.tsc
+'''
+
+from cycle_time import COMSEND_PATTERN, DELAY_PATTERN, CycleSimulator
+from machine_model import LINEAR_AXES, ROTARY_AXES, MachineModel
+
+
+class Trigger():
+    '''
+    Условие калибровки. Метод due получает показатели, накопленные после предыдущей
+    калибровки того же вида: {'holes': отверстий, 'travel': {ось: путь}, 'seconds': время}.
+    Условия с uses_motion = False используют только количество отверстий.
+    '''
+    uses_motion = False
+
+    def due(self, since: dict) -> bool:
+
+        return False
+
+    def start(self):
+        '''
+        Вызывается в начале новой программы.
+        '''
+
+    def reset(self):
+        '''
+        Вызывается после выполнения калибровки.
+        '''
+
+    def __repr__(self):
+
+        return f'{type(self).__name__}()'
+
+
+class Never(Trigger):
+    '''
+    Калибровка только перед первым отверстием.
+    '''
+
+
+class EveryHoles(Trigger):
+    '''
+    Калибровка через каждые count отверстий.
+    '''
+    def __init__(self, count: int):
+
+        self.count = count
+
+    def due(self, since: dict) -> bool:
+
+        return since['holes'] >= self.count
+
+    def __repr__(self):
+
+        return f'EveryHoles({self.count})'
+
+
+class LegacyCadence(Trigger):
+    '''
+    Периодичность исходного цикла: счетчик n сбрасывается в 1 при n == period, поэтому
+    первая калибровка повторяется через period отверстий, следующие - через period - 1.
+    '''
+    def __init__(self, period: int = 10):
+
+        self.period = period
+        self.calibrations = 0
+
+    def due(self, since: dict) -> bool:
+
+        return since['holes'] >= (self.period if self.calibrations <= 1 else self.period - 1)
+
+    def start(self):
+
+        self.calibrations = 0
+
+    def reset(self):
+
+        self.calibrations += 1
+
+    def __repr__(self):
+
+        return f'LegacyCadence({self.period})'
+
+
+class TravelDistance(Trigger):
+    '''
+    Калибровка после суммарного перемещения осей axes на distance (мм или градусы).
+    '''
+    uses_motion = True
+
+    def __init__(self, distance: float, axes: str = LINEAR_AXES):
+
+        self.distance = distance
+        self.axes = axes
+
+    def due(self, since: dict) -> bool:
+
+        return sum(since['travel'][axis] for axis in self.axes) >= self.distance
+
+    def __repr__(self):
+
+        return f'TravelDistance({self.distance}, {self.axes!r})'
+
+
+class AngleChange(TravelDistance):
+    '''
+    Калибровка после суммарного поворота осей Q W на angle градусов.
+    '''
+    def __init__(self, angle: float):
+
+        TravelDistance.__init__(self, angle, ROTARY_AXES)
+
+    def __repr__(self):
+
+        return f'AngleChange({self.distance})'
+
+
+class ElapsedTime(Trigger):
+    '''
+    Калибровка через seconds секунд оценочного времени программы.
+    '''
+    uses_motion = True
+
+    def __init__(self, seconds: float):
+
+        self.seconds = seconds
+
+    def due(self, since: dict) -> bool:
+
+        return since['seconds'] >= self.seconds
+
+    def __repr__(self):
+
+        return f'ElapsedTime({self.seconds})'
+
+
+class AnyOf(Trigger):
+    '''
+    Калибровка при выполнении любого из условий.
+    '''
+    def __init__(self, *triggers):
+
+        self.triggers = triggers
+        self.uses_motion = any(trigger.uses_motion for trigger in triggers)
+
+    def due(self, since: dict) -> bool:
+
+        return any(trigger.due(since) for trigger in self.triggers)
+
+    def start(self):
+
+        for trigger in self.triggers:
+            trigger.start()
+
+    def reset(self):
+
+        for trigger in self.triggers:
+            trigger.reset()
+
+    def __repr__(self):
+
+        return f"AnyOf({', '.join(map(repr, self.triggers))})"
+
+
+class CalibrationScheduler():
+    '''
+    Планировщик калибровок. По умолчанию воспроизводит исходный цикл
+    write_command_sequence: калибровка по X Y Z в начале и через 10 (затем 9) отверстий,
+    калибровка по Q W перед каждым отверстием.
+
+    Пример:
+        scheduler = CalibrationScheduler(full=EveryHoles(50), light=AngleChange(720))
+        write_command_sequence(path, blocks, scheduler=scheduler)
+    '''
+    def __init__(self, full: Trigger = None, light: Trigger = None, model: MachineModel = None):
+        '''
+        Parameters:
+        - full: Trigger.
+            Условие калибровки по X Y Z.
+        - light: Trigger.
+            Условие калибровки по Q W.
+        - model: MachineModel.
+            Модель осей для оценки времени (ElapsedTime).
+        '''
+        self.triggers = {'full': full or LegacyCadence(10), 'light': light or EveryHoles(1)}
+        self.model = model
+
+        # Разбор текста программы нужен только условиям по перемещениям и времени.
+        self.uses_motion = any(trigger.uses_motion for trigger in self.triggers.values())
+
+        self.reset()
+
+    @property
+    def light_each_hole(self) -> bool:
+        '''
+        Калибровка по Q W выполняется перед каждым отверстием.
+        '''
+        light = self.triggers['light']
+
+        return isinstance(light, EveryHoles) and light.count <= 1
+
+    def reset(self):
+        '''
+        Начало новой программы.
+        '''
+        self.simulator = CycleSimulator(self.model)
+        self.holes = 0
+        self.counts = {'full': 0, 'light': 0}
+        self.marks = {'full': None, 'light': None}
+
+        for trigger in self.triggers.values():
+            trigger.start()
+
+    def snapshot(self) -> dict:
+
+        return {'holes': self.holes, 'travel': dict(self.simulator.travel),
+                'seconds': self.simulator.clock}
+
+    def since(self, kind: str) -> dict:
+
+        now, mark = self.snapshot(), self.marks[kind]
+
+        return {'holes': now['holes'] - mark['holes'],
+                'travel': {axis: now['travel'][axis] - mark['travel'][axis] for axis in now['travel']},
+                'seconds': now['seconds'] - mark['seconds']}
+
+    def due(self) -> list:
+        '''
+        Калибровки, которые нужно выполнить перед очередным отверстием, в порядке записи.
+        '''
+        return [kind for kind in ('full', 'light')
+                if self.marks[kind] is None or self.triggers[kind].due(self.since(kind))]
+
+    def record(self, kind: str, text: str):
+        '''
+        Учет записанного текста: калибровки ('full', 'light') или блока отверстия ('hole').
+        '''
+        for line in text.splitlines() if self.uses_motion else ():
+            for command in COMSEND_PATTERN.findall(line):
+                self.simulator.execute(command)
+            for ms in DELAY_PATTERN.findall(line):
+                self.simulator.wait(int(ms) / 1000)
+
+        if kind == 'hole':
+            self.holes += 1
+        else:
+            self.counts[kind] += 1
+            self.marks[kind] = self.snapshot()
+            self.triggers[kind].reset()
+
+    def __repr__(self):
+
+        return f"CalibrationScheduler(full={self.triggers['full']!r}, light={self.triggers['light']!r})"
+
+
+def parse_trigger(kind: str, value: str) -> Trigger:
+    '''
+    Условие по виду политики и значению (0 - без повторной калибровки).
+    '''
+    value = float(value)
+    if value <= 0:
+        return Never()
+
+    if kind == 'holes':
+        return EveryHoles(int(value))
+    if kind == 'travel':
+        return TravelDistance(value)
+    if kind == 'time':
+        return ElapsedTime(value)
+    if kind == 'angle':
+        return AngleChange(value)
+
+    raise ValueError(f'Неизвестная политика калибровки: {kind}')
+
+
+def parse_policy(spec: str, model: MachineModel = None) -> CalibrationScheduler:
+    '''
+    Планировщик по строке политики:
+    - 'legacy' - исходный цикл;
+    - 'holes:N_FULL:N_LIGHT' - через N отверстий;
+    - 'travel:MM_FULL:MM_LIGHT' - по пути осей X Y Z;
+    - 'time:S_FULL:S_LIGHT' - по оценочному времени;
+    - 'angle:DEG_FULL:DEG_LIGHT' - по суммарному повороту Q W.
+    '''
+    if spec == 'legacy':
+        return CalibrationScheduler(model=model)
+
+    kind, full, light = spec.split(':')
+
+    return CalibrationScheduler(parse_trigger(kind, full), parse_trigger(kind, light), model)
+
+
+def schedule_program(blocks, scheduler: CalibrationScheduler) -> list:
+    '''
+    Текст программы с калибровками по планировщику (без записи в файл).
+
+    Returns:
+    - list.
+        Фрагменты текста программы.
+    '''
+    # Тексты калибровок - те же, что записывает TscWriter.
+    from endoscope_motion import TscWriter
+
+    texts = {'full': TscWriter.FULL_CALIBRATION_TEXT, 'light': TscWriter.LIGHT_CALIBRATION_TEXT}
+
+    scheduler.reset()
+    program = []
+
+    for block in blocks:
+        for kind in scheduler.due():
+            program.append(texts[kind])
+            scheduler.record(kind, texts[kind])
+        program.append(block)
+        scheduler.record('hole', block)
+
+    return program
+
+
+def calibration_report(blocks, policies: dict, model: MachineModel = None) -> dict:
+    '''
+    Сравнение политик калибровки для одной последовательности блоков отверстий.
+
+    Parameters:
+    - blocks: list.
+        Тексты блоков отверстий (render_hole_block).
+    - policies: dict.
+        {название: CalibrationScheduler}.
+    - model: MachineModel.
+        Модель осей для моделирования времени.
+
+    Returns:
+    - dict.
+        {название: {'full', 'light', 'calibration', 'total', 'share'}}: количество
+        калибровок, их время и общее время программы в секундах, доля калибровок.
+    '''
+    from cycle_time import simulate_terminal
+
+    report = {}
+    for name, scheduler in policies.items():
+        program = ''.join(schedule_program(blocks, scheduler))
+        simulation = simulate_terminal(program.splitlines(), model)
+
+        report[name] = {'full': scheduler.counts['full'],
+                        'light': scheduler.counts['light'],
+                        'calibration': simulation['calibration'],
+                        'total': simulation['total'],
+                        'share': simulation['calibration'] / simulation['total'] if simulation['total'] else 0.0}
+
+    return report
+
+
+def format_calibration_report(report: dict) -> str:
+
+    width = max([len(name) for name in report] + [8])
+
+    lines = [f"{'Политика':<{width}}  {'X Y Z':>6}  {'Q W':>6}  {'Калибровки, с':>14}  "
+             f"{'Всего, с':>10}  Доля"]
+    for name, row in report.items():
+        lines.append(f"{name:<{width}}  {row['full']:>6}  {row['light']:>6}  "
+                     f"{row['calibration']:>14.1f}  {row['total']:>10.1f}  {row['share'] * 100:.1f} %")
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    from endoscope_motion import split_command_sequence
+
+    parser = argparse.ArgumentParser(description='Сравнение политик калибровки для программы .tsc.')
+    parser.add_argument('program', help='программа .tsc (используются блоки отверстий)')
+    parser.add_argument('--policy', action='append', default=None,
+                        help="политика (см. parse_policy), можно указать несколько раз")
+    parser.add_argument('--machine', default=None,
+                        help='JSON файл параметров осей (machine_model.MachineModel.from_json)')
+    args = parser.parse_args()
+
+    model = MachineModel.from_json(args.machine) if args.machine else None
+    specs = args.policy or ['legacy', 'holes:10:1', 'holes:50:10', 'travel:20000:2000',
+                            'time:3600:600', 'angle:0:720']
+
+    blocks = list(split_command_sequence(args.program).values())
+    report = calibration_report(blocks, {spec: parse_policy(spec, model) for spec in specs}, model)
+
+    print(format_calibration_report(report))
@@ -0,0 +1,468 @@
+#collision_check.py
+
+'''
+Проверка столкновений эндоскопа с деталью. Корпус эндоскопа моделируется цилиндром
+(капсулой) радиуса diameter / 2 вдоль отрезка от точки крепления до конца эндоскопа,
+как в Endoscope.create_endoscope. Треугольники STL модели детали один раз раскладываются
+по равномерной сетке ячеек, после чего отрезки всех отверстий проверяются пакетами NumPy:
+ближайшие треугольники выбираются по сетке, расстояние от отрезка до треугольника
+вычисляется точно.
+
+Координаты отверстий и STL модели должны быть заданы в одной системе координат
+(как в visualization_script).
+
+Пример:
+    python collision_check.py src/stl/part.stl result/endoscope_coordinates_for_cube.holetab
+'''
+
+import functools
+import json
+
+import numpy as np
+
+from hole_table import HoleTable
+from stl_loader import load_stl
+
+
+# Диаметр эндоскопа по умолчанию (Endoscope.create_endoscope).
+DEFAULT_DIAMETER = 5.0
+
+# Ограничение количества ячеек сетки по одной оси.
+_MAX_CELLS_PER_AXIS = 512
+
+
+def _dot(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+
+    return np.einsum('ij,ij->i', u, v)
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    '''
+    Деление с нулем вместо деления на ноль.
+    '''
+    safe = np.where(denominator != 0, denominator, 1)
+
+    return np.where(denominator != 0, numerator / safe, 0)
+
+
+def point_triangle_distance(p: np.ndarray, a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    '''
+    Расстояние от точек p до треугольников (a, b, c) по областям Вороного треугольника.
+    Все массивы N x 3.
+    '''
+    ab, ac = b - a, c - a
+    ap, bp, cp = p - a, p - b, p - c
+
+    d1, d2 = _dot(ab, ap), _dot(ac, ap)
+    d3, d4 = _dot(ab, bp), _dot(ac, bp)
+    d5, d6 = _dot(ab, cp), _dot(ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    denom = va + vb + vc
+    v_inner, w_inner = _divide(vb, denom), _divide(vc, denom)
+    v_ab = _divide(d1, d1 - d3)
+    w_ac = _divide(d2, d2 - d6)
+    w_bc = _divide(d4 - d3, (d4 - d3) + (d5 - d6))
+
+    # Области проверяются в порядке приоритета: вершины, ребра, внутренность.
+    conditions = [(d1 <= 0) & (d2 <= 0),
+                  (d3 >= 0) & (d4 <= d3),
+                  (vc <= 0) & (d1 >= 0) & (d3 <= 0),
+                  (d6 >= 0) & (d5 <= d6),
+                  (vb <= 0) & (d2 >= 0) & (d6 <= 0),
+                  (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)]
+    choices = [a, b, a + v_ab[:, None] * ab, c, a + w_ac[:, None] * ac, b + w_bc[:, None] * (c - b)]
+
+    closest = a + v_inner[:, None] * ab + w_inner[:, None] * ac
+    for condition, choice in zip(reversed(conditions), reversed(choices)):
+        closest = np.where(condition[:, None], choice, closest)
+
+    return np.linalg.norm(p - closest, axis=1)
+
+
+def segment_segment_distance(p1: np.ndarray, q1: np.ndarray, p2: np.ndarray, q2: np.ndarray) -> np.ndarray:
+    '''
+    Расстояние между отрезками [p1, q1] и [p2, q2]. Все массивы N x 3.
+    '''
+    d1, d2, r = q1 - p1, q2 - p2, p1 - p2
+
+    a, e = _dot(d1, d1), _dot(d2, d2)
+    b, c, f = _dot(d1, d2), _dot(d1, r), _dot(d2, r)
+
+    denom = a * e - b * b
+
+    # Параметр на первом отрезке для ближайших точек прямых (0 для параллельных).
+    s = np.clip(_divide(b * f - c * e, denom), 0, 1)
+    t = _divide(b * s + f, e)
+
+    # Ограничение параметра на втором отрезке с пересчетом параметра на первом.
+    s = np.where(t < 0, np.clip(_divide(-c, a), 0, 1), np.where(t > 1, np.clip(_divide(b - c, a), 0, 1), s))
+    t = np.clip(t, 0, 1)
+
+    return np.linalg.norm((p1 + s[:, None] * d1) - (p2 + t[:, None] * d2), axis=1)
+
+
+def segment_intersects_triangle(p: np.ndarray, q: np.ndarray, a: np.ndarray, b: np.ndarray,
+                                c: np.ndarray, eps: float = 1e-12) -> np.ndarray:
+    '''
+    Пересечение отрезков [p, q] с треугольниками (a, b, c) (алгоритм Моллера - Трумбора).
+    Отрезки, лежащие в плоскости треугольника, не считаются пересекающими.
+    '''
+    e1, e2 = b - a, c - a
+    direction = q - p
+
+    h = np.cross(direction, e2)
+    det = _dot(e1, h)
+    inv = _divide(1.0, np.where(np.abs(det) > eps, det, 0))
+
+    s = p - a
+    u = _dot(s, h) * inv
+    k = np.cross(s, e1)
+    v = _dot(direction, k) * inv
+    t = _dot(e2, k) * inv
+
+    return (np.abs(det) > eps) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
+
+
+def segment_triangle_distance(p: np.ndarray, q: np.ndarray, a: np.ndarray, b: np.ndarray,
+                              c: np.ndarray) -> np.ndarray:
+    '''
+    Точное расстояние от отрезков [p, q] до треугольников (a, b, c). Без пересечения
+    минимум достигается на конце отрезка или на ребре треугольника.
+    '''
+    distance = np.minimum.reduce([point_triangle_distance(p, a, b, c),
+                                  point_triangle_distance(q, a, b, c),
+                                  segment_segment_distance(p, q, a, b),
+                                  segment_segment_distance(p, q, b, c),
+                                  segment_segment_distance(p, q, c, a)])
+
+    return np.where(segment_intersects_triangle(p, q, a, b, c), 0.0, distance)
+
+
+class TriangleGrid():
+    '''
+    Равномерная сетка ячеек над треугольниками модели. Каждый треугольник записывается во
+    все ячейки, пересекающие его габарит, расширенный на радиус эндоскопа и половину шага
+    выборки отрезка. Поэтому для поиска треугольников ближе radius к отрезку достаточно
+    перебрать ячейки точек отрезка, взятых с шагом step = cell_size / 2.
+    '''
+    def __init__(self, vertices: np.ndarray, triangles: np.ndarray, radius: float,
+                 cell_size: float = None):
+        '''
+        Parameters:
+        - vertices: np.ndarray.
+            Массив вершин V x 3.
+        - triangles: np.ndarray.
+            Массив индексов треугольников T x 3.
+        - radius: float.
+            Радиус эндоскопа.
+        - cell_size: float.
+            Размер ячейки (по умолчанию - не меньше диаметра эндоскопа и типичного
+            размера треугольника).
+        '''
+        corners = np.asarray(vertices, dtype=float)[np.asarray(triangles)]
+        self.a, self.b, self.c = corners[:, 0], corners[:, 1], corners[:, 2]
+        self.radius = radius
+
+        extent = corners.max(axis=1) - corners.min(axis=1)
+        size = (corners.reshape(-1, 3).max(axis=0) - corners.reshape(-1, 3).min(axis=0)).max()
+
+        if cell_size is None:
+            cell_size = max(2 * radius, float(np.median(extent.max(axis=1))) if len(corners) else 0)
+        self.cell_size = max(cell_size, size / _MAX_CELLS_PER_AXIS, 1e-9)
+        self.step = self.cell_size / 2
+
+        margin = radius + self.step / 2
+        lower = corners.min(axis=1) - margin
+        upper = corners.max(axis=1) + margin
+
+        self.origin = lower.min(axis=0) if len(corners) else np.zeros(3)
+        low = self.cells(lower)
+        high = self.cells(upper)
+        self.shape = high.max(axis=0) + 1 if len(corners) else np.ones(3, dtype=np.int64)
+
+        # Перечисление ячеек габарита каждого треугольника.
+        spans = high - low + 1
+        counts = spans.prod(axis=1)
+        owner = np.repeat(np.arange(len(corners)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        span = spans[owner]
+        offset = np.column_stack([local % span[:, 0],
+                                  (local // span[:, 0]) % span[:, 1],
+                                  local // (span[:, 0] * span[:, 1])])
+        keys = self.linear(low[owner] + offset)
+
+        # Хранение в формате CSR: отсортированные ключи ячеек и списки треугольников.
+        order = np.argsort(keys, kind='stable')
+        keys, self.items = keys[order], owner[order]
+        self.keys, self.offsets = np.unique(keys, return_index=True)
+        self.offsets = np.append(self.offsets, len(keys))
+
+    @classmethod
+    def from_stl(cls, path: str, diameter: float = DEFAULT_DIAMETER, cell_size: float = None):
+        '''
+        Построение сетки по STL файлу (загрузка через кэш stl_loader).
+        '''
+        vertices, triangles, _ = load_stl(path)
+
+        return cls(vertices, triangles, diameter / 2, cell_size)
+
+    def __len__(self):
+
+        return len(self.a)
+
+    def cells(self, points: np.ndarray) -> np.ndarray:
+
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def linear(self, cells: np.ndarray) -> np.ndarray:
+        '''
+        Линейный ключ ячейки. Ячейки вне сетки получают ключ -1.
+        '''
+        inside = ((cells >= 0) & (cells < self.shape)).all(axis=1)
+        keys = (cells[:, 2] * self.shape[1] + cells[:, 1]) * self.shape[0] + cells[:, 0]
+
+        return np.where(inside, keys, -1)
+
+    def candidates(self, starts: np.ndarray, ends: np.ndarray) -> tuple:
+        '''
+        Пары (отрезок, треугольник), которые могут находиться ближе radius друг к другу.
+
+        Returns:
+        - tuple.
+            Индексы отрезков и индексы треугольников пар (без повторов).
+        '''
+        lengths = np.linalg.norm(ends - starts, axis=1)
+        samples = np.ceil(lengths / self.step).astype(np.int64) + 1
+
+        owner = np.repeat(np.arange(len(starts)), samples)
+        local = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+        fraction = local / np.maximum(samples - 1, 1)[owner]
+
+        points = starts[owner] + fraction[:, None] * (ends - starts)[owner]
+        keys = self.linear(self.cells(points))
+
+        # Ячейки каждого отрезка без повторов.
+        pairs = np.unique(np.column_stack([owner, keys])[keys >= 0], axis=0)
+        slot = np.searchsorted(self.keys, pairs[:, 1])
+        found = (slot < len(self.keys)) & (self.keys[np.minimum(slot, len(self.keys) - 1)] == pairs[:, 1])
+        pairs, slot = pairs[found], slot[found]
+
+        counts = self.offsets[slot + 1] - self.offsets[slot]
+        segment = np.repeat(pairs[:, 0], counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        triangle = self.items[np.repeat(self.offsets[slot], counts) + local]
+
+        unique = np.unique(segment * len(self) + triangle)
+
+        return unique // len(self), unique % len(self)
+
+    def clearance(self, starts: np.ndarray, ends: np.ndarray, batch_size: int = 256,
+                  pair_batch: int = 1 << 20) -> tuple:
+        '''
+        Расстояние от отрезков до модели.
+
+        Parameters:
+        - starts: np.ndarray.
+            Массив N x 3 начальных точек отрезков.
+        - ends: np.ndarray.
+            Массив N x 3 конечных точек отрезков.
+        - batch_size: int.
+            Количество отрезков в пакете.
+        - pair_batch: int.
+            Количество пар (отрезок, треугольник) в пакете точного расчета.
+
+        Returns:
+        - tuple.
+            Массив N расстояний (точных, если меньше radius, иначе не меньше radius, inf -
+            рядом с отрезком нет треугольников) и массив N индексов ближайших треугольников
+            (-1 - нет треугольников).
+        '''
+        starts = np.asarray(starts, dtype=float).reshape(-1, 3)
+        ends = np.asarray(ends, dtype=float).reshape(-1, 3)
+
+        distance = np.full(len(starts), np.inf)
+        nearest = np.full(len(starts), -1, dtype=np.int64)
+
+        for begin in range(0, len(starts), batch_size):
+            batch = slice(begin, begin + batch_size)
+            segments, triangles = self.candidates(starts[batch], ends[batch])
+
+            for first in range(0, len(segments), pair_batch):
+                s = segments[first:first + pair_batch]
+                t = triangles[first:first + pair_batch]
+
+                d = segment_triangle_distance(starts[batch][s], ends[batch][s],
+                                              self.a[t], self.b[t], self.c[t])
+
+                # Минимум по отрезку: пары отсортированы по отрезку.
+                order = np.lexsort((d, s))
+                s, t, d = s[order], t[order], d[order]
+                first_of_segment = np.ones(len(s), dtype=bool)
+                first_of_segment[1:] = s[1:] != s[:-1]
+
+                index = s[first_of_segment] + begin
+                better = d[first_of_segment] < distance[index]
+                distance[index[better]] = d[first_of_segment][better]
+                nearest[index[better]] = t[first_of_segment][better]
+
+        return distance, nearest
+
+
+def endoscope_segments(table: HoleTable, entry_clearance: float) -> tuple:
+    '''
+    Отрезки корпуса эндоскопа для отверстий таблицы: в начальном положении (от точки
+    крепления до входного отверстия) и заметаемый при вводе в отверстие (от начальной
+    точки крепления до выходного отверстия). Концы со стороны отверстия укорачиваются
+    на entry_clearance, так как конец эндоскопа касается поверхности детали по построению.
+
+    Returns:
+    - tuple.
+        Начала и концы отрезков начального положения, начала и концы отрезков ввода.
+    '''
+    axis = table.start - table.mount_start
+    length = np.linalg.norm(axis, axis=1, keepdims=True)
+    direction = axis / np.where(length > 0, length, 1)
+
+    start_end = table.start - entry_clearance * direction
+    insertion_end = table.end - entry_clearance * direction
+
+    return table.mount_start, start_end, table.mount_start, insertion_end
+
+
+def check_hole_table(table: HoleTable, grid: TriangleGrid, entry_clearance: float = None,
+                     tolerance: float = 1e-6) -> dict:
+    '''
+    Проверка столкновений эндоскопа с деталью для всех отверстий таблицы с заполненными
+    положениями эндоскопа (endoscope_motion.solve_hole_table).
+
+    Parameters:
+    - table: HoleTable.
+        Таблица отверстий и положений эндоскопа.
+    - grid: TriangleGrid.
+        Сетка треугольников модели детали.
+    - entry_clearance: float.
+        Длина участка у конца эндоскопа, не проверяемого на столкновение (по умолчанию -
+        диаметр эндоскопа).
+    - tolerance: float.
+        Допуск касания.
+
+    Returns:
+    - dict.
+        {'names', 'start_clearance', 'insertion_clearance', 'start_triangle',
+        'insertion_triangle', 'start_collision', 'insertion_collision', 'reachable'}:
+        зазоры до модели, ближайшие треугольники и признаки столкновений по отверстиям.
+    '''
+    if entry_clearance is None:
+        entry_clearance = 2 * grid.radius
+
+    start_from, start_to, insertion_from, insertion_to = endoscope_segments(table, entry_clearance)
+
+    start_clearance, start_triangle = grid.clearance(start_from, start_to)
+    insertion_clearance, insertion_triangle = grid.clearance(insertion_from, insertion_to)
+
+    start_collision = start_clearance < grid.radius - tolerance
+    insertion_collision = insertion_clearance < grid.radius - tolerance
+
+    return {'names': table.names,
+            'start_clearance': start_clearance,
+            'insertion_clearance': insertion_clearance,
+            'start_triangle': start_triangle,
+            'insertion_triangle': insertion_triangle,
+            'start_collision': start_collision,
+            'insertion_collision': insertion_collision,
+            'reachable': ~(start_collision | insertion_collision)}
+
+
+@functools.lru_cache(maxsize=4)
+def load_grid(model_path: str, diameter: float = DEFAULT_DIAMETER) -> TriangleGrid:
+    '''
+    Сетка модели с кэшированием в пределах процесса: при пакетной обработке деталей с
+    общей моделью сетка строится один раз.
+    '''
+    return TriangleGrid.from_stl(model_path, diameter)
+
+
+def check_part(model_path: str, table: HoleTable, diameter: float = DEFAULT_DIAMETER,
+               entry_clearance: float = None) -> dict:
+    '''
+    Проверка столкновений для детали (см. check_hole_table).
+    '''
+    return check_hole_table(table, load_grid(model_path, diameter), entry_clearance)
+
+
+def unreachable_holes(report: dict) -> list:
+    '''
+    Имена недостижимых отверстий отчета check_hole_table.
+    '''
+    return [name for name, reachable in zip(report['names'], report['reachable']) if not reachable]
+
+
+def format_report(report: dict) -> str:
+    '''
+    Текстовая сводка по недостижимым отверстиям.
+    '''
+    lines = []
+    for i in np.flatnonzero(~report['reachable']):
+        stages = []
+        if report['start_collision'][i]:
+            stages.append(f"начальное положение (зазор {report['start_clearance'][i]:.3f})")
+        if report['insertion_collision'][i]:
+            stages.append(f"ввод (зазор {report['insertion_clearance'][i]:.3f})")
+        lines.append(f"{report['names'][i]}: столкновение - " + ', '.join(stages))
+
+    lines.append(f"Всего отверстий: {len(report['names'])}, "
+                 f"недостижимых: {int((~report['reachable']).sum())}")
+
+    return '\n'.join(lines)
+
+
+def report_to_json(report: dict) -> dict:
+    '''
+    Отчет в виде, пригодном для json.dump ({имя отверстия: {...}}).
+    '''
+    def value(x):
+        return None if np.isinf(x) else round(float(x), 6)
+
+    return {name: {'reachable': bool(report['reachable'][i]),
+                   'start_collision': bool(report['start_collision'][i]),
+                   'insertion_collision': bool(report['insertion_collision'][i]),
+                   'start_clearance': value(report['start_clearance'][i]),
+                   'insertion_clearance': value(report['insertion_clearance'][i])}
+            for i, name in enumerate(report['names'])}
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Проверка столкновений эндоскопа с деталью.')
+    parser.add_argument('model', help='STL модель детали')
+    parser.add_argument('holes', help='таблица отверстий с положениями эндоскопа (.holetab или JSON)')
+    parser.add_argument('--poses', default=None,
+                        help='JSON файл с положениями эндоскопа, если holes - входной JSON')
+    parser.add_argument('--diameter', type=float, default=DEFAULT_DIAMETER,
+                        help='диаметр эндоскопа')
+    parser.add_argument('--entry-clearance', type=float, default=None,
+                        help='непроверяемый участок у конца эндоскопа (по умолчанию - диаметр)')
+    parser.add_argument('--report', default=None, help='JSON файл для записи отчета')
+    args = parser.parse_args()
+
+    if args.poses is None:
+        table = HoleTable.open(args.holes)
+    else:
+        table = HoleTable.from_json(args.holes, poses_path=args.poses)
+
+    report = check_part(args.model, table, args.diameter, args.entry_clearance)
+    print(format_report(report))
+
+    if args.report is not None:
+        with open(args.report, 'w') as file:
+            json.dump(report_to_json(report), file, indent=4)
+
+    sys.exit(1 if not report['reachable'].all() else 0)
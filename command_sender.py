@@ -0,0 +1,436 @@
+#command_sender.py
+
+'''
+Потоковая передача команд станку по последовательному порту или TCP. Команды берутся из
+программы для терминала (.tsc, ComSendmacro) или G-code и отправляются с управлением
+потоком вместо пауз Delay:
+- 'ack': в очереди контроллера не больше window строк без ответа 'ok';
+- 'chars': суммарный размер строк без ответа не превышает rx_buffer байт (подсчет
+символов, как у контроллеров grbl).
+
+Ответ, начинающийся с 'error' или 'alarm', прерывает передачу.
+
+Для последовательного порта нужен пакет pyserial-asyncio (необязательная зависимость).
+
+Пример:
+    python command_sender.py result/commands_sequence_for_cube.tsc --tcp 192.168.0.10:23
+    python command_sender.py result/commands_sequence_for_cube.tsc --mock
+'''
+
+import asyncio
+import re
+import time
+
+from collections import deque
+
+from cycle_time import COMSEND_PATTERN, DELAY_PATTERN, read_program
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+
+class ControllerError(Exception):
+    '''
+    Ошибка, полученная от контроллера.
+    '''
+
+
+def program_commands(lines, delay_mode: str = 'drop', dwell: str = 'G4 P{ms}'):
+    '''
+    Генератор команд программы. Для .tsc используются команды ComSendmacro (без
+    завершающего $0A), для G-code - строки без комментариев.
+
+    Parameters:
+    - lines: iterable.
+        Строки программы.
+    - delay_mode: str.
+        Обработка пауз Delay: 'drop' - пропускать (ожидание обеспечивает очередь
+        контроллера), 'dwell' - заменять командой паузы dwell, 'sleep' - выдавать кортеж
+        ('sleep', секунды) для ожидания на стороне отправителя.
+    - dwell: str.
+        Шаблон команды паузы контроллера ({ms} - миллисекунды, {s} - секунды).
+
+    Yields:
+    - str | tuple.
+        Команда или ('sleep', секунды).
+    '''
+    for line in lines:
+        commands = COMSEND_PATTERN.findall(line)
+        delays = DELAY_PATTERN.findall(line)
+
+        if not commands and not delays:
+            if line.lstrip().startswith('//'):
+                continue
+            command = re.sub(r'\(.*?\)|;.*', '', line).strip()
+            if command:
+                yield command
+            continue
+
+        yield from commands
+
+        for ms in delays:
+            if delay_mode == 'dwell':
+                yield dwell.format(ms=int(ms), s=int(ms) / 1000)
+            elif delay_mode == 'sleep':
+                yield ('sleep', int(ms) / 1000)
+
+
+class FlowWindow():
+    '''
+    Окно управления потоком: строки, отправленные без ответа, и их размер.
+    '''
+    def __init__(self, max_lines: float = float('inf'), max_bytes: float = float('inf')):
+
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.peak = 0
+
+        self.changed = asyncio.Condition()
+
+    def fits(self, size: int) -> bool:
+
+        if not self.pending:
+            return True
+
+        return len(self.pending) < self.max_lines and self.pending_bytes + size <= self.max_bytes
+
+    async def acquire(self, command: str, size: int):
+
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.fits(size))
+            self.pending.append((command, size))
+            self.pending_bytes += size
+            self.peak = max(self.peak, len(self.pending))
+
+    async def release(self) -> str:
+
+        async with self.changed:
+            command, size = self.pending.popleft()
+            self.pending_bytes -= size
+            self.changed.notify_all()
+
+        return command
+
+    async def drain(self):
+
+        async with self.changed:
+            await self.changed.wait_for(lambda: not self.pending)
+
+
+class CommandSender():
+    '''
+    Отправка команд в открытое соединение asyncio (StreamReader, StreamWriter).
+    Отправка и чтение ответов выполняются параллельными задачами.
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 flow: str = 'chars', window: int = 4, rx_buffer: int = 128,
+                 timeout: float = 120.0, encoding: str = 'ascii'):
+        '''
+        Parameters:
+        - reader: asyncio.StreamReader.
+        - writer: asyncio.StreamWriter.
+        - flow: str.
+            Управление потоком: 'ack' или 'chars'.
+        - window: int.
+            Наибольшее количество строк без ответа (flow='ack').
+        - rx_buffer: int.
+            Размер приемного буфера контроллера в байтах (flow='chars').
+        - timeout: float.
+            Наибольшее время ожидания места в окне (ответа 'ok' на отправленную строку) в
+            секундах. При превышении передача прерывается исключением TimeoutError.
+        - encoding: str.
+            Кодировка команд.
+        '''
+        if flow == 'ack':
+            self.window = FlowWindow(max_lines=window)
+        elif flow == 'chars':
+            self.window = FlowWindow(max_bytes=rx_buffer)
+        else:
+            raise ValueError(f'Неизвестный режим управления потоком: {flow}')
+
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.encoding = encoding
+
+        self.sent = 0
+        self.acknowledged = 0
+        self.responses = []
+
+    async def read_responses(self):
+        '''
+        Чтение ответов контроллера. Каждый ответ 'ok' освобождает самую старую строку окна.
+        '''
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('Соединение с контроллером закрыто')
+
+            response = line.decode(self.encoding, errors='replace').strip()
+            if not response:
+                continue
+
+            lowered = response.lower()
+            if lowered.startswith('ok'):
+                await self.window.release()
+                self.acknowledged += 1
+            elif lowered.startswith(('error', 'alarm')):
+                command = self.window.pending[0][0] if self.window.pending else None
+                raise ControllerError(f'{response} (команда {command!r})')
+            else:
+                # Сообщения состояния контроллера сохраняются без изменения окна.
+                self.responses.append(response)
+
+    async def wait_window(self, awaitable):
+        '''
+        Ожидание окна (acquire, drain) не дольше timeout секунд.
+        '''
+        try:
+            await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.TimeoutError:
+            command = self.window.pending[0][0] if self.window.pending else None
+            raise TimeoutError(f'Нет ответа контроллера за {self.timeout} с '
+                               f'(команда {command!r})') from None
+
+    async def send_commands(self, commands):
+
+        for command in commands:
+            if isinstance(command, tuple):
+                # Пауза отправителя: после выполнения всех отправленных команд.
+                await self.wait_window(self.window.drain())
+                await asyncio.sleep(command[1])
+                continue
+
+            data = (command + '\n').encode(self.encoding)
+            await self.wait_window(self.window.acquire(command, len(data)))
+
+            self.writer.write(data)
+            await self.writer.drain()
+            self.sent += 1
+
+        await self.wait_window(self.window.drain())
+
+    async def run(self, commands) -> dict:
+        '''
+        Отправка всех команд с ожиданием ответов на них.
+
+        Returns:
+        - dict.
+            {'sent', 'acknowledged', 'peak_window', 'seconds', 'messages'}.
+        '''
+        begin = time.perf_counter()
+
+        reader = asyncio.ensure_future(self.read_responses())
+        sender = asyncio.ensure_future(self.send_commands(commands))
+
+        try:
+            # Ожидание ответов ограничено в send_commands (wait_window).
+            done, _ = await asyncio.wait([reader, sender], return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                # Чтение завершается только ошибкой.
+                reader.result()
+            sender.result()
+        finally:
+            for task in (reader, sender):
+                task.cancel()
+            await asyncio.gather(reader, sender, return_exceptions=True)
+
+        return {'sent': self.sent,
+                'acknowledged': self.acknowledged,
+                'peak_window': self.window.peak,
+                'seconds': time.perf_counter() - begin,
+                'messages': list(self.responses)}
+
+
+async def open_tcp(host: str, port: int) -> tuple:
+
+    return await asyncio.open_connection(host, port)
+
+
+async def open_serial(port: str, baudrate: int = 115200) -> tuple:
+
+    if serial_asyncio is None:
+        raise ImportError('Для передачи по последовательному порту установите pyserial-asyncio')
+
+    return await serial_asyncio.open_serial_connection(url=port, baudrate=baudrate)
+
+
+async def stream_program(path: str, connect, flow: str = 'chars', window: int = 4,
+                         rx_buffer: int = 128, delay_mode: str = 'drop',
+                         timeout: float = 120.0) -> dict:
+    '''
+    Передача программы .tsc или G-code станку.
+
+    Parameters:
+    - path: str.
+        Путь до программы.
+    - connect: coroutine function.
+        Функция открытия соединения без аргументов, возвращающая (reader, writer),
+        например functools.partial(open_tcp, host, port).
+    - flow, window, rx_buffer, timeout.
+        См. CommandSender.
+    - delay_mode: str.
+        См. program_commands.
+
+    Returns:
+    - dict.
+        Отчет CommandSender.run.
+    '''
+    reader, writer = await connect()
+
+    try:
+        sender = CommandSender(reader, writer, flow, window, rx_buffer, timeout)
+        return await sender.run(program_commands(read_program(path), delay_mode))
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+class MockController():
+    '''
+    Имитация контроллера на локальном TCP порту. Команды принимаются в буфер rx_buffer байт
+    и передаются в очередь движений из planner_size команд; ответ 'ok' отправляется, когда
+    команда принята в очередь. Строка занимает приемный буфер от получения до приема
+    команды в очередь движений; превышение rx_buffer отмечается в overflow. Время
+    выполнения команды - execution_time секунд (или функция от команды). Команды из
+    fail_on приводят к ответу 'error:...'.
+    '''
+    def __init__(self, rx_buffer: int = 128, planner_size: int = 16, execution_time=0.0,
+                 fail_on: tuple = ()):
+
+        self.rx_buffer = rx_buffer
+        self.planner_size = planner_size
+        self.execution_time = execution_time
+        self.fail_on = set(fail_on)
+
+        self.received = []
+        self.executed = []
+        self.overflow = False
+        self.server = None
+
+    @property
+    def port(self) -> int:
+
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+        return self
+
+    async def stop(self):
+
+        self.server.close()
+        await self.server.wait_closed()
+
+    def duration(self, command: str) -> float:
+
+        if callable(self.execution_time):
+            return self.execution_time(command)
+
+        return self.execution_time
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        planner = asyncio.Queue(self.planner_size)
+        lines = asyncio.Queue()
+        buffered = 0
+
+        async def execute():
+            while True:
+                command = await planner.get()
+                await asyncio.sleep(self.duration(command))
+                self.executed.append(command)
+
+        async def parse():
+            nonlocal buffered
+            while True:
+                line = await lines.get()
+                command = line.decode().strip()
+
+                if command in self.fail_on:
+                    writer.write(f'error:1 {command}\n'.encode())
+                else:
+                    await planner.put(command)
+                    writer.write(b'ok\n')
+
+                # Строка освобождает приемный буфер после приема команды в очередь движений.
+                buffered -= len(line)
+                await writer.drain()
+
+        workers = [asyncio.ensure_future(execute()), asyncio.ensure_future(parse())]
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                # Проверка переполнения приемного буфера отправителем.
+                buffered += len(line)
+                if buffered > self.rx_buffer:
+                    self.overflow = True
+
+                self.received.append(line.decode().strip())
+                lines.put_nowait(line)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            writer.close()
+
+
+async def _demo(path: str, flow: str, window: int, rx_buffer: int, delay_mode: str) -> dict:
+
+    controller = await MockController(rx_buffer=rx_buffer).start()
+
+    try:
+        report = await stream_program(path, lambda: open_tcp('127.0.0.1', controller.port),
+                                      flow, window, rx_buffer, delay_mode)
+    finally:
+        await controller.stop()
+
+    report['overflow'] = controller.overflow
+
+    return report
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import functools
+
+    parser = argparse.ArgumentParser(description='Передача программы станку с управлением потоком.')
+    parser.add_argument('program', help='программа .tsc или G-code')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--tcp', help='адрес контроллера host:port')
+    target.add_argument('--serial', help='последовательный порт (нужен pyserial-asyncio)')
+    target.add_argument('--mock', action='store_true', help='локальная имитация контроллера')
+    parser.add_argument('--baud', type=int, default=115200, help='скорость порта')
+    parser.add_argument('--flow', choices=('ack', 'chars'), default='chars',
+                        help='управление потоком')
+    parser.add_argument('--window', type=int, default=4, help='строк без ответа (ack)')
+    parser.add_argument('--rx-buffer', type=int, default=128, help='буфер контроллера, байт (chars)')
+    parser.add_argument('--delays', choices=('drop', 'dwell', 'sleep'), default='drop',
+                        help='обработка пауз Delay')
+    args = parser.parse_args()
+
+    if args.mock:
+        report = asyncio.run(_demo(args.program, args.flow, args.window, args.rx_buffer, args.delays))
+    else:
+        if args.tcp:
+            host, port = args.tcp.rsplit(':', 1)
+            connect = functools.partial(open_tcp, host, int(port))
+        else:
+            connect = functools.partial(open_serial, args.serial, args.baud)
+
+        report = asyncio.run(stream_program(args.program, connect, args.flow, args.window,
+                                            args.rx_buffer, args.delays))
+
+    print(f"Отправлено команд: {report['sent']}, подтверждено: {report['acknowledged']}, "
+          f"наибольшее окно: {report['peak_window']}, время: {report['seconds']:.2f} с")
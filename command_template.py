@@ -0,0 +1,239 @@
+#command_template.py
+
+'''
+Компилированные шаблоны текста команд. Шаблон строится один раз из функции, формирующей
+текст блока (например, GCodeMaker.make_terminal_command): вместо значений передаются
+метки полей, статический текст сохраняется как есть, а метки заменяются спецификаторами
+формата %. Блок одного отверстия формируется одной операцией %.
+
+Числа выводятся с фиксированным количеством знаков precision (как '%.{precision}f') или,
+при precision=None, как str(value) - так же, как в f-строках GCodeMaker. Для набора блоков
+при заданном precision числа форматируются векторно (format_fixed) по столбцам массива
+решений, а блоки собираются в байтовой матрице без циклов по отверстиям.
+
+Пример:
+    template = CommandTemplate.compile(render, ('point', 'X', 'Y'), numeric=('X', 'Y'), precision=3)
+    text = template.render(('1', 10.0, -2.5))
+    template.write(file, {'point': names, 'X': xs, 'Y': ys})
+'''
+
+import io
+import re
+
+from itertools import chain
+
+import numpy as np
+
+
+_MARK = '\x00{}\x00'
+_MARK_PATTERN = re.compile('\x00(\\d+)\x00')
+
+# Наибольшее по модулю масштабированное значение, для которого округление выполняется точно.
+_EXACT_LIMIT = 2.0**52
+
+
+def format_fixed(values, precision: int) -> np.ndarray:
+    '''
+    Векторное форматирование чисел с фиксированным количеством знаков после запятой.
+    Результат совпадает с '%.{precision}f' % value: значения, для которых округление
+    массивом float64 неоднозначно (близкие к половине последнего знака), а также
+    бесконечности и очень большие числа форматируются поэлементно.
+
+    Parameters:
+    - values: np.ndarray.
+        Числа.
+    - precision: int.
+        Количество знаков после запятой.
+
+    Returns:
+    - np.ndarray.
+        Матрица N x W байтов ASCII: числа выровнены вправо, слева дополнены нулевыми байтами.
+    '''
+    values = np.asarray(values, dtype=float).ravel()
+    precision = int(precision)
+    tail = precision + 1 if precision else 0
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        scaled = values * 10.0**precision
+        rounded = np.rint(scaled)
+        exact = (np.abs(scaled) < _EXACT_LIMIT) & (
+            np.abs(np.abs(scaled - rounded) - 0.5) > np.abs(scaled) * 4e-16)
+    fallback = np.nonzero(~exact)[0]
+    rounded[fallback] = 0
+
+    magnitude = np.abs(rounded).astype(np.int64)
+    whole, fraction = np.divmod(magnitude, 10**precision)
+
+    # Количество цифр целой части (не меньше одной).
+    digits = np.ones(len(values), dtype=np.int64)
+    rest = whole // 10
+    while rest.any():
+        digits += rest > 0
+        rest //= 10
+
+    texts = ['%.*f' % (precision, values[i]) for i in fallback.tolist()]
+    width = max([1 + int(digits.max(initial=1)) + tail] + [len(text) for text in texts])
+
+    result = np.zeros((len(values), width), dtype=np.uint8)
+
+    if precision:
+        result[:, width - tail] = ord('.')
+        for k in range(precision):
+            fraction, digit = np.divmod(fraction, 10)
+            result[:, width - 1 - k] = ord('0') + digit
+
+    for k in range(int(digits.max(initial=1))):
+        whole, digit = np.divmod(whole, 10)
+        result[:, width - tail - 1 - k] = np.where(k < digits, ord('0') + digit, 0)
+
+    # Знак сохраняется и для отрицательных значений, округленных до нуля ('-0.000').
+    negative = np.nonzero(np.signbit(values))[0]
+    result[negative, width - tail - 1 - digits[negative]] = ord('-')
+
+    for i, text in zip(fallback.tolist(), texts):
+        result[i] = 0
+        result[i, width - len(text):] = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+
+    return result
+
+
+def format_strings(values, encoding: str = 'utf-8') -> np.ndarray:
+    '''
+    Строки в виде матрицы N x W байтов, дополненных справа нулевыми байтами.
+    '''
+    try:
+        strings = np.asarray(values, dtype=str).astype(bytes)
+    except UnicodeEncodeError:
+        strings = np.array([str(value).encode(encoding) for value in values], dtype=bytes)
+    width = max(strings.dtype.itemsize, 1)
+
+    return strings.astype(f'S{width}').view(np.uint8).reshape(len(strings), width)
+
+
+class CommandTemplate():
+    '''
+    Шаблон блока команд с полями.
+    '''
+    def __init__(self, text: str, fields: tuple, numeric: tuple = (), precision: int = None,
+                 encoding: str = 'utf-8'):
+        '''
+        Parameters:
+        - text: str.
+            Текст блока, в котором значения полей заменены метками _MARK.format(i), где
+            i - индекс поля в fields.
+        - fields: tuple.
+            Имена полей.
+        - numeric: tuple.
+            Числовые поля (форматируются с точностью precision).
+        - precision: int.
+            Количество знаков после запятой или None для str(value).
+        - encoding: str.
+            Кодировка текста при записи в двоичный файл.
+        '''
+        self.fields = tuple(fields)
+        self.numeric = tuple(numeric)
+        self.precision = precision
+        self.encoding = encoding
+
+        parts = _MARK_PATTERN.split(text)
+
+        # Статический текст и индексы полей в порядке появления в тексте (поле может
+        # встречаться несколько раз).
+        self.static = tuple(parts[0::2])
+        self.order = tuple(int(index) for index in parts[1::2])
+
+        number = '%s' if precision is None else f'%.{int(precision)}f'
+        specs = [number if self.fields[index] in self.numeric else '%s' for index in self.order]
+
+        self.format = ''.join(chain.from_iterable(zip(
+            (static.replace('%', '%%') for static in self.static), specs + ['']
+        )))
+        self.static_bytes = [np.frombuffer(static.encode(encoding), dtype=np.uint8)
+                             for static in self.static]
+
+    @classmethod
+    def compile(cls, render, fields: tuple, numeric: tuple = (), precision: int = None, **kwargs):
+        '''
+        Шаблон по функции render(**marks), возвращающей текст блока.
+        '''
+        marks = {name: _MARK.format(i) for i, name in enumerate(fields)}
+
+        return cls(render(**marks), fields, numeric, precision, **kwargs)
+
+    def __len__(self):
+
+        return len(self.order)
+
+    def render(self, values) -> str:
+        '''
+        Текст блока для значений полей (в порядке fields).
+        '''
+        return self.format % tuple(values[index] for index in self.order)
+
+    def columns(self, columns: dict) -> list:
+        '''
+        Столбцы значений в порядке появления полей в тексте. Массивы NumPy переводятся в
+        списки чисел Python.
+        '''
+        return [columns[self.fields[index]].tolist() if isinstance(columns[self.fields[index]], np.ndarray)
+                else list(columns[self.fields[index]]) for index in self.order]
+
+    def render_rows(self, columns: dict) -> list:
+        '''
+        Тексты блоков для столбцов значений {поле: массив или список}.
+        '''
+        template = self.format
+
+        return [template % row for row in zip(*self.columns(columns))]
+
+    def render_bytes(self, columns: dict) -> bytes:
+        '''
+        Текст всех блоков в кодировке encoding. При заданном precision блоки собираются
+        векторно: поля форматируются по столбцам в матрицы байтов, дополненные нулевыми
+        байтами, которые удаляются при объединении строк.
+        '''
+        if self.precision is None:
+            return ''.join(self.render_rows(columns)).encode(self.encoding)
+
+        formatted = {}
+        for index in set(self.order):
+            name = self.fields[index]
+            formatted[index] = (format_fixed(columns[name], self.precision) if name in self.numeric
+                                else format_strings(columns[name], self.encoding))
+
+        count = len(next(iter(formatted.values()))) if formatted else 0
+
+        pieces = []
+        for static, index in zip(self.static_bytes, self.order + (None,)):
+            if len(static):
+                pieces.append(np.broadcast_to(static, (count, len(static))))
+            if index is not None:
+                pieces.append(formatted[index])
+
+        matrix = np.concatenate(pieces, axis=1)
+
+        return matrix[matrix != 0].tobytes()
+
+    def write(self, file, columns: dict, chunk_size: int = 10000) -> int:
+        '''
+        Запись блоков в файл (или буфер с методом write) порциями по chunk_size блоков.
+        В текстовый файл (io.TextIOBase) записывается текст, в остальные - байты.
+
+        Returns:
+        - int.
+            Количество записанных блоков.
+        '''
+        count = len(columns[self.fields[self.order[0]]]) if self.order else 0
+        text = isinstance(file, io.TextIOBase)
+
+        for begin in range(0, count, chunk_size):
+            chunk = {name: values[begin:begin + chunk_size] for name, values in columns.items()}
+
+            if self.precision is None and text:
+                file.write(''.join(self.render_rows(chunk)))
+                continue
+
+            data = self.render_bytes(chunk)
+            file.write(data.decode(self.encoding) if text else data)
+
+        return count
@@ -0,0 +1,327 @@
+#cycle_time.py
+
+'''
+Оценка времени выполнения программ для станка без запуска на станке. Разбираются
+последовательности команд для терминала (commands_sequence_for_*.tsc: ComSendmacro и
+Delay, GCodeMaker.make_terminal_command) и G-code программы (GCodeMaker.make_gcode).
+
+Моделируются два независимых времени: время отправителя (терминал отправляет команду
+мгновенно и ждет только на Delay) и время станка (команды выполняются по очереди, каждая
+не раньше момента отправки). Время программы - наибольшее из них.
+
+Пример:
+    python cycle_time.py result/commands_sequence_for_cube.tsc --per-hole
+'''
+
+import re
+
+import numpy as np
+
+from machine_model import AXES, MachineModel
+
+
+COMSEND_PATTERN = re.compile(r"ComSendmacro\('(.*?)(?:\$0A)?'\)")
+DELAY_PATTERN = re.compile(r'Delay\((\d+)\)')
+_WORD = re.compile(r'([A-Z])\s*([-+]?\d*\.?\d+)?')
+_HOLE = re.compile(r'^\s*(?://\s*Hole|\(Hole)\s+([^)\s]+)')
+
+# Разделитель блоков в .tsc (может следовать сразу за командой в той же строке).
+_SEPARATOR = '// ......'
+
+
+def read_program(path: str) -> list:
+    '''
+    Чтение строк программы. Файлы .tsc записываются в кодировке системы по умолчанию
+    (cp1251 на станции управления), поэтому при ошибке UTF-8 используется cp1251.
+    '''
+    for encoding in ('utf-8', 'cp1251'):
+        try:
+            with open(path, encoding=encoding) as file:
+                return file.read().splitlines()
+        except UnicodeDecodeError:
+            continue
+
+    with open(path, encoding='utf-8', errors='replace') as file:
+        return file.read().splitlines()
+
+
+class Section():
+    '''
+    Участок программы: блок отверстия или калибровка.
+    '''
+    def __init__(self, kind: str, name: str, begin: float):
+
+        self.kind = kind
+        self.name = name
+        self.begin = begin
+        self.end = begin
+        self.delay = 0.0
+        self.motion = 0.0
+
+    @property
+    def seconds(self) -> float:
+
+        return self.end - self.begin
+
+    def to_dict(self) -> dict:
+
+        return {'kind': self.kind, 'name': self.name, 'seconds': self.seconds,
+                'delay': self.delay, 'motion': self.motion}
+
+
+class CycleSimulator():
+    '''
+    Пошаговое моделирование программы. Положение осей, подача F и режим G90/G91
+    модальны, перемещение с флагом O (до концевика) обнуляет координату оси, G10
+    обнуляет координаты всех осей.
+    '''
+    def __init__(self, model: MachineModel = None, homing_time: float = 0.0):
+        '''
+        Parameters:
+        - model: MachineModel.
+            Модель осей станка.
+        - homing_time: float.
+            Время перемещения до концевика в секундах (длина такого перемещения неизвестна).
+        '''
+        self.model = model or MachineModel()
+        self.homing_time = homing_time
+
+        self.position = dict.fromkeys(AXES, 0.0)
+        self.feed = None
+        self.absolute = True
+
+        self.sender = 0.0
+        self.machine = 0.0
+        self.delay = 0.0
+        self.travel = dict.fromkeys(AXES, 0.0)
+
+        self.sections = []
+        self.current = None
+
+        # Оси, перемещенные после последней паузы, и признак перемещения до концевика.
+        self.pending_axes = set()
+        self.pending_homing = False
+
+    @property
+    def clock(self) -> float:
+
+        return max(self.sender, self.machine)
+
+    def start_section(self, kind: str, name: str):
+
+        self.close_section()
+        self.current = Section(kind, name, self.clock)
+        self.sections.append(self.current)
+
+    def close_section(self):
+
+        if self.current is not None:
+            self.current.end = self.clock
+            self.current = None
+
+    def execute(self, command: str):
+        '''
+        Выполнение одной команды G-code.
+        '''
+        words = {letter: value for letter, value in _WORD.findall(command.upper())}
+        codes = [int(float(value)) for letter, value in _WORD.findall(command.upper())
+                 if letter == 'G' and value]
+
+        if 90 in codes:
+            self.absolute = True
+        if 91 in codes:
+            self.absolute = False
+        if 10 in codes:
+            self.position = dict.fromkeys(AXES, 0.0)
+
+        if words.get('F'):
+            self.feed = float(words['F'])
+
+        if not (0 in codes or 1 in codes):
+            return
+
+        targets = {axis: float(words[axis]) for axis in AXES if words.get(axis)}
+        if not targets:
+            return
+
+        if 'O' in words:
+            # Перемещение до концевика: длина неизвестна, координата обнуляется.
+            duration = self.homing_time
+            self.pending_homing = True
+            for axis in targets:
+                self.position[axis] = 0.0
+        else:
+            delta = {axis: (value - self.position[axis] if self.absolute else value)
+                     for axis, value in targets.items()}
+            # G0 - ускоренное перемещение с максимальной скоростью осей.
+            duration = self.model.move_time(delta, None if 0 in codes else self.feed)
+
+            for axis, value in delta.items():
+                self.travel[axis] += abs(value)
+                self.position[axis] += value
+                if value:
+                    self.pending_axes.add(axis)
+
+        start = max(self.sender, self.machine)
+        self.machine = start + duration
+
+        if self.current is not None:
+            self.current.motion += duration
+
+    def wait(self, seconds: float):
+
+        self.sender += seconds
+        self.delay += seconds
+
+        self.pending_axes = set()
+        self.pending_homing = False
+
+        if self.current is not None:
+            self.current.delay += seconds
+
+    def run_terminal(self, lines):
+        '''
+        Моделирование последовательности команд для терминала (.tsc).
+        '''
+        for line in lines:
+            hole = _HOLE.match(line)
+            if hole:
+                self.start_section('hole', hole.group(1))
+            elif line.lstrip().startswith('//') and self.current is None:
+                # Калибровка начинается с комментария после разделителя блоков.
+                self.start_section('calibration', line.strip('/ .'))
+
+            for command in COMSEND_PATTERN.findall(line):
+                self.execute(command)
+            for ms in DELAY_PATTERN.findall(line):
+                self.wait(int(ms) / 1000)
+
+            if _SEPARATOR in line:
+                self.close_section()
+
+        self.close_section()
+
+    def run_gcode(self, lines):
+        '''
+        Моделирование G-code программы (отправка без пауз).
+        '''
+        for line in lines:
+            hole = _HOLE.match(line)
+            if hole:
+                self.start_section('hole', hole.group(1))
+
+            command = re.sub(r'\(.*?\)|;.*', '', line).strip()
+            if command:
+                self.execute(command)
+
+        self.close_section()
+
+    def report(self) -> dict:
+        '''
+        Итоги моделирования.
+
+        Returns:
+        - dict.
+            {'total', 'sender', 'machine', 'delay', 'delay_share', 'travel', 'holes',
+            'calibration', 'sections'}: время в секундах, путь осей в мм и градусах,
+            время по отверстиям {номер: секунды}.
+        '''
+        total = self.clock
+        holes = {section.name: section.seconds for section in self.sections if section.kind == 'hole'}
+
+        return {'total': total,
+                'sender': self.sender,
+                'machine': self.machine,
+                'delay': self.delay,
+                'delay_share': self.delay / total if total else 0.0,
+                'travel': dict(self.travel),
+                'holes': holes,
+                'calibration': sum(section.seconds for section in self.sections
+                                   if section.kind == 'calibration'),
+                'sections': [section.to_dict() for section in self.sections]}
+
+
+def simulate_terminal(lines, model: MachineModel = None, homing_time: float = 0.0) -> dict:
+    '''
+    Моделирование последовательности команд для терминала (строки файла .tsc).
+    '''
+    simulator = CycleSimulator(model, homing_time)
+    simulator.run_terminal(lines)
+
+    return simulator.report()
+
+
+def simulate_gcode(lines, model: MachineModel = None) -> dict:
+    '''
+    Моделирование G-code программы (строки make_gcode).
+    '''
+    simulator = CycleSimulator(model)
+    simulator.run_gcode(lines)
+
+    return simulator.report()
+
+
+def simulate_file(path: str, model: MachineModel = None, homing_time: float = 0.0) -> dict:
+    '''
+    Моделирование файла программы: .tsc - команды для терминала, остальные - G-code.
+    '''
+    lines = read_program(path)
+
+    if path.endswith('.tsc'):
+        return simulate_terminal(lines, model, homing_time)
+
+    return simulate_gcode(lines, model)
+
+
+def format_seconds(seconds: float) -> str:
+
+    hours, rest = divmod(int(round(seconds)), 3600)
+
+    return f'{hours}:{rest // 60:02d}:{rest % 60:02d}'
+
+
+def format_simulation(report: dict, per_hole: bool = False) -> str:
+    '''
+    Текстовая сводка моделирования.
+    '''
+    lines = []
+
+    if per_hole:
+        for number, seconds in report['holes'].items():
+            lines.append(f'Отверстие {number}: {seconds:.1f} с')
+
+    holes = np.array(list(report['holes'].values()) or [0.0])
+    travel = ', '.join(f'{axis} {value:.1f}' for axis, value in report['travel'].items() if value)
+
+    lines.append(f"Время цикла: {format_seconds(report['total'])} ({report['total']:.1f} с)")
+    lines.append(f"Отверстий: {len(report['holes'])}, среднее время отверстия {holes.mean():.1f} с, "
+                 f"калибровки {report['calibration']:.1f} с")
+    lines.append(f"Паузы Delay: {report['delay']:.1f} с ({report['delay_share'] * 100:.1f} % времени цикла)")
+    lines.append(f"Путь осей: {travel or '-'}")
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Оценка времени выполнения программы .tsc или G-code.')
+    parser.add_argument('program', help='файл программы (.tsc или G-code)')
+    parser.add_argument('--machine', default=None,
+                        help='JSON файл параметров осей (machine_model.MachineModel.from_json)')
+    parser.add_argument('--homing-time', type=float, default=0.0,
+                        help='время перемещения до концевика, с')
+    parser.add_argument('--per-hole', action='store_true', help='время по отверстиям')
+    parser.add_argument('--report', default=None, help='JSON файл для записи отчета')
+    args = parser.parse_args()
+
+    model = MachineModel.from_json(args.machine) if args.machine else None
+    report = simulate_file(args.program, model, args.homing_time)
+
+    print(format_simulation(report, args.per_hole))
+
+    if args.report is not None:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=4, ensure_ascii=False)
@@ -0,0 +1,165 @@
+#delay_planner.py
+
+'''
+Расчет пауз Delay(...) последовательности команд для терминала по фактическим
+перемещениям. Вместо фиксированных пауз (3000, 5000, 10000, 20000 мс) каждая пауза
+вычисляется как время выполнения команд, отправленных после предыдущей паузы
+(cycle_time.CycleSimulator), с запасом margin и временем успокоения перемещенных осей.
+Структура команд не изменяется.
+
+По умолчанию паузы только сокращаются: если фиксированная пауза меньше расчетного времени
+перемещения (станок выполняет очередь команд дольше паузы), она сохраняется и учитывается
+в отчете как недостаточная. При extend=True такие паузы увеличиваются до расчетных.
+
+Для перемещений до концевика (флаг O) длина перемещения неизвестна, поэтому паузы после
+них сохраняются, если не задано время homing_time.
+
+Пример:
+    python delay_planner.py result/commands_sequence_for_cube.tsc result/cube_adaptive.tsc
+'''
+
+import math
+
+from cycle_time import COMSEND_PATTERN, DELAY_PATTERN, CycleSimulator
+from machine_model import AXES, MachineModel
+
+
+class DelayPlanner():
+    '''
+    Пересчет пауз потока строк команд. Состояние станка (положение осей, подача) сохраняется
+    между вызовами plan_text, поэтому текст программы можно передавать блоками в порядке
+    записи. Перед новой программой вызывается reset.
+    '''
+    def __init__(self, model: MachineModel = None, settle_time: dict = None, margin: float = 0.2,
+                 min_delay: float = 0.0, homing_time: float = None, resolution: int = 100,
+                 extend: bool = False):
+        '''
+        Parameters:
+        - model: MachineModel.
+            Модель осей станка.
+        - settle_time: dict.
+            Время успокоения осей после перемещения {ось: секунды}, по умолчанию 0.25 с.
+        - margin: float.
+            Относительный запас к расчетному времени перемещения.
+        - min_delay: float.
+            Наименьшая пауза в секундах.
+        - homing_time: float.
+            Время перемещения до концевика в секундах или None, чтобы сохранять исходные паузы.
+        - resolution: int.
+            Шаг округления пауз вверх в миллисекундах.
+        - extend: bool.
+            Увеличивать паузы, меньшие расчетного времени перемещения.
+        '''
+        self.model = model or MachineModel()
+        self.settle_time = dict.fromkeys(AXES, 0.25)
+        self.settle_time.update(settle_time or {})
+        self.margin = margin
+        self.min_delay = min_delay
+        self.homing_time = homing_time
+        self.resolution = resolution
+        self.extend = extend
+
+        self.reset()
+
+    def reset(self):
+        '''
+        Начало новой программы: оси в нулевом положении, подача не задана.
+        '''
+        self.simulator = CycleSimulator(self.model, self.homing_time or 0.0)
+        self.original = 0.0
+        self.planned = 0.0
+        self.insufficient = 0
+
+    def required_delay(self, original: float) -> float:
+        '''
+        Пауза в секундах, достаточная для завершения отправленных перемещений.
+        '''
+        simulator = self.simulator
+
+        if simulator.pending_homing and self.homing_time is None:
+            return original
+
+        motion = max(simulator.machine - simulator.sender, 0.0)
+        settle = max([self.settle_time[axis] for axis in simulator.pending_axes] + [0.0])
+        seconds = max(motion * (1 + self.margin) + settle, self.min_delay)
+        seconds = math.ceil(round(seconds * 1000 / self.resolution, 6)) * self.resolution / 1000
+
+        if seconds > original:
+            self.insufficient += 1
+            if not self.extend:
+                return original
+
+        return seconds
+
+    def plan_line(self, line: str) -> str:
+
+        for command in COMSEND_PATTERN.findall(line):
+            self.simulator.execute(command)
+
+        def replace(match):
+            original = int(match.group(1)) / 1000
+            seconds = self.required_delay(original)
+
+            self.simulator.wait(seconds)
+            self.original += original
+            self.planned += seconds
+
+            return f'Delay({int(round(seconds * 1000))})'
+
+        return DELAY_PATTERN.sub(replace, line)
+
+    def plan_lines(self, lines):
+        '''
+        Генератор строк с пересчитанными паузами.
+        '''
+        for line in lines:
+            yield self.plan_line(line)
+
+    def plan_text(self, text: str) -> str:
+
+        return ''.join(self.plan_line(line) for line in text.splitlines(keepends=True))
+
+    def report(self) -> dict:
+        '''
+        Суммарные паузы исходной и пересчитанной программы в секундах и количество
+        исходных пауз, меньших расчетного времени перемещения.
+        '''
+        return {'original': self.original, 'planned': self.planned,
+                'saved': self.original - self.planned, 'insufficient': self.insufficient}
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    from cycle_time import format_seconds, read_program, simulate_terminal
+    from endoscope_motion import TscWriter
+
+    parser = argparse.ArgumentParser(description='Пересчет пауз Delay программы .tsc.')
+    parser.add_argument('source', help='исходная программа .tsc')
+    parser.add_argument('target', help='программа с пересчитанными паузами')
+    parser.add_argument('--machine', default=None,
+                        help='JSON файл параметров осей (machine_model.MachineModel.from_json)')
+    parser.add_argument('--margin', type=float, default=0.2, help='относительный запас')
+    parser.add_argument('--settle', type=float, default=0.25, help='время успокоения осей, с')
+    parser.add_argument('--extend', action='store_true',
+                        help='увеличивать паузы, недостаточные для завершения перемещения')
+    parser.add_argument('--homing-time', type=float, default=None,
+                        help='время перемещения до концевика, с (по умолчанию паузы сохраняются)')
+    args = parser.parse_args()
+
+    model = MachineModel.from_json(args.machine) if args.machine else MachineModel()
+    planner = DelayPlanner(model, dict.fromkeys(AXES, args.settle), args.margin,
+                           homing_time=args.homing_time, extend=args.extend)
+
+    lines = read_program(args.source)
+    with TscWriter(args.target) as writer:
+        writer.write_text(''.join(planner.plan_line(line) + '\n' for line in lines))
+
+    before = simulate_terminal(lines, model, args.homing_time or 0.0)
+    after = simulate_terminal(read_program(args.target), model, args.homing_time or 0.0)
+    report = planner.report()
+
+    print(f"Паузы: {report['original']:.1f} с -> {report['planned']:.1f} с, "
+          f"недостаточных исходных пауз: {report['insufficient']}")
+    print(f"Время цикла: {format_seconds(before['total'])} -> {format_seconds(after['total'])}")
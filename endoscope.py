@@ -2,9 +2,9 @@
 
 import ursina
 import numpy as np
-import json
 
 from hole_center import Hole_center
+from hole_table import HoleTable
 
 class Endoscope():
     
@@ -13,7 +13,8 @@ class Endoscope():
                  input_coordinate_dict:dict=None,   # Словарь координат используется в случае если подается не json а заготовленный словарь 
                  diameter_endoscope:float=5.0,      # Диаметр эндоскопа
                  len_endoscope=300,                 # Длина энадоскопа
-                 point_objects_list:list=None       # Точки конца отверстия
+                 point_objects_list:list=None,      # Точки конца отверстия
+                 hole_table:HoleTable=None          # Общая таблица отверстий с положениями эндоскопа
                 ) -> None:
         
         self.json_path = json_path                         # Путь до json файла
@@ -21,6 +22,7 @@ class Endoscope():
         self.radius_endoscope = diameter_endoscope / 2     # Диаметр эндоскопа
         self.len_endoscope = len_endoscope                 # Длина эндоскопа
         self.point_objects_list = point_objects_list       # Список обьектов
+        self.hole_table = hole_table                       # Таблица отверстий (используется без копирования)
         
     def update():
         print(1)
@@ -38,71 +40,48 @@ class Endoscope():
         }
         
         """
-        start_coordinates = []
-        end_coordinates   = []
-        phi_angles = []
-        psi_angles = []
-        
+        # Таблица уже загружена и передана извне
+        if self.hole_table is not(None):
+            return
         
         if self.json_path is not(None):
             
-            #Считывание с json файла    ян
-            with open(self.json_path) as json_file:
-                coordinate_dict = json.load(json_file)
-
-            #получение координат 
-            # Вид {start:[[start_coordinate_1],[start_coordinate_2]], end:[[end_coordinate_1],[end_coordinate_2]]}
-            
-            for key in coordinate_dict:
-                
-                point_name = "hole_" + str(key.split("_")[1])
-                start_coordinates.append(coordinate_dict[point_name]['start'])
-                end_coordinates.append(coordinate_dict[point_name]['end'])
-            
-            self.point_dict = {'start':start_coordinates, 'end':end_coordinates}
+            # Потоковое считывание json файла или отображение в память таблицы .holetab (столбцы положений эндоскопа)
+            self.hole_table = HoleTable.open(self.json_path)
             
         # В случае если подается не json а заготовленный словарь 
         elif self.input_coordinate_dict is not(None):
-            self.point_dict = self.input_coordinate_dict
+            self.hole_table = HoleTable.from_dict(self.input_coordinate_dict, poses=True)
     
     
     # Конвертор координат под формат Vec3 (так же записывает количество отверстий в self.hole_counter:int и self.pints_counter:int количество точек)
     def convertor_dict_coordinate_to_Vec3_coordinate(self,) -> dict:
         '''Необходим для предворительного конвртировния координат'''
         
-        phi_list = []
-        psi_list = []
-        
-        vec_3_point_dict = {'start':[], 'end':[]}
-        point_dict = self.point_dict
+        table = self.hole_table
         
-        for index_hole in range(len(point_dict['start'])):
-            
-            start_point_coordinate = ursina.Vec3((float(point_dict['start'][index_hole]['X']), # получение начальной координаты по оси X
-                                                  float(point_dict['start'][index_hole]['Y']), # получение начальной координаты по оси Y
-                                                  float(point_dict['start'][index_hole]['Z']))) # получение начальной координаты по оси Z)
-            
-            end_point_coordinate  =  ursina.Vec3((float(point_dict['end'][index_hole]['X']),   # получение конечной координаты по оси X
-                                                  float(point_dict['end'][index_hole]['Y']),   # получение конечной координаты по оси Y
-                                                  float(point_dict['end'][index_hole]['Z'])))   # получение конечной координаты по оси Z
-
-            vec_3_point_dict['start'].append(start_point_coordinate)
-            vec_3_point_dict['end'].append(end_point_coordinate)
-            
-            phi_list.append(point_dict['start'][index_hole]['phi'])
-            psi_list.append(point_dict['start'][index_hole]['psi'])   
+        # Vec3 создаются напрямую из столбцов положений эндоскопа
+        vec_3_point_dict = {'start':[ursina.Vec3(*point) for point in table.mount_start.tolist()],
+                            'end':  [ursina.Vec3(*point) for point in table.mount_stop.tolist()]}
             
         self.vec_3_point_dict = vec_3_point_dict
-        self.hole_counter = len(point_dict['start'])
-        self.pints_counter = len(point_dict['start']) * 2 # так как у отверстия есть вход и выход
+        self.hole_counter = len(table)
+        self.pints_counter = len(table) * 2 # так как у отверстия есть вход и выход
         
-        self.phi_list = phi_list
-        self.psi_list = psi_list
+        # Углы наклона - представления столбцов таблицы
+        self.phi_list = table.phi
+        self.psi_list = table.psi
         
     # Получение координат точек c point_objects_list
     def get_point_objects_coordinate(self,) -> None:
         point_objects_list = self.point_objects_list
         
+        # Координаты отверстий есть в общей таблице: отдельные Entity маркеров не нужны (и отсутствуют при объединенных сетках)
+        if self.hole_table is not None and len(self.hole_table) and not np.isnan(self.hole_table.start).any():
+            self.coordinate_point_dict = {'start':[ursina.Vec3(*point) for point in self.hole_table.start.tolist()],
+                                          'end':  [ursina.Vec3(*point) for point in self.hole_table.end.tolist()]}
+            return
+        
         # тестовый прототип
         if point_objects_list == None:
             point_objects_list = {                                                                         # Список обьектов
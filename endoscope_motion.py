@@ -1,7 +1,57 @@
+import functools
 import json
+import logging
+import os
+import shutil
+import time
 import numpy as np
 import scipy
-import warnings
+
+from calibration_scheduler import CalibrationScheduler
+from command_template import CommandTemplate
+from cycle_time import read_program
+from hole_stream import iter_holes, read_header
+from hole_table import HoleTable
+from instrumentation import count as count_event, stage, timed, timed_iter
+from solver_diagnostics import LOGGER_NAME
+
+
+logger = logging.getLogger(LOGGER_NAME + '.endoscope_motion')
+
+
+def spherical_angles(offsets: np.ndarray):
+    '''
+    Углы наклона эндоскопа в сферической системе координат для набора смещений входного 
+    отверстия относительно точки крепления эндоскопа. Все квадранты и случаи, параллельные 
+    осям, обрабатываются через np.arctan2 без ветвлений и исключений.
+
+    - phi - горизонтальный угол (в плоскости X Y), отсчитывается от оси Y. Для нижней 
+    полуплоскости X Y лежит в диапазоне (90, 270].
+    - psi - вертикальный угол.
+
+    Parameters:
+    - offsets: np.ndarray.
+        Массив N x 3 (или вектор из трех элементов) смещений [x, y, z].
+
+    Returns:
+    - tuple. 
+        Массивы phi и psi в градусах и булев массив degenerate. Для вырожденных отверстий 
+        (x = y = 0, ось параллельна Z) угол phi равен 0, при нулевом смещении psi также равен 0.
+    '''
+    x, y, z = np.asarray(offsets, dtype=float).reshape(-1, 3).T
+    
+    phi = np.arctan2(x, y)
+    # Для третьего квадранта угол отсчитывается в положительном направлении. 
+    phi = np.where(phi < -np.pi/2, phi + 2*np.pi, phi)
+
+    psi = np.arctan2(z, np.hypot(x, y))
+
+    degenerate = (x == 0) & (y == 0)
+
+    # np.arctan2 учитывает знак нуля: для смещения (0, -0.0, z) phi было бы равно 180.
+    phi = np.where(degenerate, 0.0, phi)
+
+    return np.rad2deg(phi), np.rad2deg(psi), degenerate
 
 
 class Endoscope_Minimize():
@@ -9,7 +59,11 @@ class Endoscope_Minimize():
     Класс для определения координат положения и углов наклона эндоскопа при помощи 
     метода scipy.optimize.minimize.
     '''
-    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float):
+    # Допуск невязки успешного решения относительно длины эндоскопа.
+    residual_tol = 1e-6
+
+    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float, diagnostics=None, 
+                 hole: str = ''):
         '''
         Parameters:
         - input: np.ndarray.
@@ -18,12 +72,22 @@ class Endoscope_Minimize():
             Координаты [x, y, z] выходного отверстия.   
         - e_len: float.
             Длина эндоскопа.
+        - diagnostics: SolverDiagnostics.
+            Таблица диагностики (solver_diagnostics.SolverDiagnostics) или None.
+        - hole: str.
+            Номер отверстия для диагностики.
         '''
         self.d = e_len
 
         self.input = input
         self.output = output
 
+        self.diagnostics = diagnostics
+        self.hole = hole
+
+        # Состояние последнего решения (см. find_point).
+        self.stats = {}
+
         # Глубина отверстия. 
         self.hole_depth = np.sqrt(np.sum((output - input)**2))
 
@@ -67,12 +131,30 @@ class Endoscope_Minimize():
         obj_func = lambda x: np.sum(np.square(self.distance(x, d1, d2)))
         
         # Минимизация функции. 
+        begin = time.perf_counter()
         result = scipy.optimize.minimize(obj_func, m0)
 
-        print(result.success)
-        print(result.message)
+        self.record_stats('minimize', result, np.sqrt(result.fun), time.perf_counter() - begin)
 
         return result.x
+
+    def record_stats(self, solver: str, result, residual: float, seconds: float):
+        '''
+        Сохранение состояния решения в self.stats и в таблицу диагностики. Решение с 
+        невязкой больше residual_tol * e_len считается неудачным, даже если решатель 
+        завершился успешно (найден локальный минимум).
+        '''
+        self.stats = {'solver': solver,
+                      'success': bool(result.success and residual <= self.residual_tol * max(1.0, self.d)),
+                      'residual': float(residual),
+                      'iterations': result.get('nit', result.get('njev')),
+                      'nfev': int(result.get('nfev') or 0),
+                      'njev': int(result.get('njev') or 0),
+                      'seconds': seconds,
+                      'message': str(result.message)}
+
+        if self.diagnostics is not None:
+            self.diagnostics.record(self.hole, '', **self.stats)
     
     def find_angles(self, d1: float, d2: float):
         '''
@@ -88,43 +170,14 @@ class Endoscope_Minimize():
         Returns:
         - list. 
             Координаты [x, y, z] начального положения эндоскопа и углы наклона [phi, psi]. 
+            Признак вырожденного отверстия сохраняется в self.degenerate.
         '''
         # Найдем координаты начального положения эндоскопа в абсолютной СК. 
         xm, ym, zm = self.find_point(d1, d2)
 
         # Координаты стартового отверстия относительно координат эндоскопа.
-        x = self.input[0] - xm 
-        y = self.input[1] - ym # y=0 - вырожденный случай. 
-        z = self.input[2] - zm
-
         # Углы сферической системы координат. Определяют наклон эндоскопа. 
-        # phi - горизонтальный угол (в плоскости X Y).
-        # psi - вертикальный угол.
-        try:
-            # Для задней боковой поверхности. 
-            if x < 0 and y == 0:
-                phi = - np.pi/2
-            # Для передней боковой поверхности. 
-            elif x > 0 and y == 0:
-                phi = np.pi/2
-            # Для верхней полуплоскости X Y.
-            elif x > 0 and y > 0:
-                phi = np.arctan(x / y)
-            elif x < 0 and y > 0:
-                phi = np.arctan(x / y)
-            # Для нижней полуплоскости X Y.
-            else: 
-                phi = np.arctan(x / y) + np.pi
-            
-            psi = np.arcsin(z / np.sqrt(x**2 + y**2 + z**2))
-        
-        # Обработка исключения в случае нулевого значения в знаменателе phi. 
-        except RuntimeWarning:
-            phi = 0
-            psi = np.arcsin(z / np.sqrt(x**2 + y**2 + z**2))
-
-        phi = np.rad2deg(phi)
-        psi = np.rad2deg(psi)
+        (phi,), (psi,), (self.degenerate,) = spherical_angles(self.input - [xm, ym, zm])
 
         return xm, ym, zm, phi, psi
     
@@ -134,9 +187,10 @@ class Endoscope_Root(Endoscope_Minimize):
     Класс для определения координат положения и углов наклона эндоскопа при помощи 
     метода scipy.optimize.root.
     '''
-    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float):
+    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float, diagnostics=None, 
+                 hole: str = ''):
         
-        Endoscope_Minimize.__init__(self, input, output, e_len)
+        Endoscope_Minimize.__init__(self, input, output, e_len, diagnostics, hole)
         
         self.X1, self.Y1, self.Z1 = self.input 
         self.X2, self.Y2, self.Z2 = self.output
@@ -177,59 +231,641 @@ class Endoscope_Root(Endoscope_Minimize):
 
         return [eq1, eq2, eq3, eq4, eq5]
     
-    def find_point(self, d1: float, d2: float):
+    def jacobian(self, m: list, d1: float = None, d2: float = None):
         '''
-        Решает систему уравнений методом Левенберга — Марквардта с начальными условиями [1, 1, 1]. 
+        Аналитическая матрица Якоби 5 x 3 системы уравнений system_equations (d1, d2 не 
+        входят в производные и принимаются для совместимости с сигнатурой системы).
+        '''
+        return system_jacobian(np.asarray(m, dtype=float), self.input, self.output)
+
+    def find_point(self, d1: float, d2: float, initial_guess: np.ndarray = None, 
+                   analytic: bool = True):
+        '''
+        Решает систему уравнений методом Левенберга — Марквардта. Количество вычислений 
+        системы и матрицы Якоби сохраняется в self.stats.
         
         Parameters:
         - d1: float.
             Расстояние от точки крепления эндоскопа до входного отверстия. 
         - d2: float.
             Расстояние от точки крепления эндоскопа до выходного отверстия.
+        - initial_guess: np.ndarray.
+            Начальное приближение, например решение соседнего положения. По умолчанию - 
+            точка на оси отверстия на расстоянии d1 за входным отверстием. Для отверстия 
+            нулевой глубины ось не определена, и начальное приближение - точка на 
+            расстоянии d1 над отверстием (вертикальное положение эндоскопа): начало из 
+            самого отверстия приводит к локальному минимуму с ненулевой невязкой.
+        - analytic: bool.
+            Использовать аналитическую матрицу Якоби вместо численного дифференцирования.
 
         Returns:
         - list. Координаты [x, y, z] начального положения эндоскопа. 
         '''
         system = lambda x: self.system_equations(x, d1, d2)
 
-        initial_guess = np.mean([self.input, self.output], axis=0)
+        if initial_guess is None and self.hole_depth > 0:
+            initial_guess = self.input - d1 * (self.output - self.input) / self.hole_depth
+        elif initial_guess is None:
+            initial_guess = self.input + np.array([0, 0, d1], dtype=float)
 
-        return scipy.optimize.root(system, initial_guess, method='lm').x
+        begin = time.perf_counter()
+        with stage('root'):
+            result = scipy.optimize.root(system, initial_guess, method='lm', 
+                                         jac=self.jacobian if analytic else None)
+        count_event('root_calls')
+
+        self.record_stats('root', result, np.linalg.norm(result.fun), time.perf_counter() - begin)
+
+        return result.x
 
 
-class SolutionsChecker(Endoscope_Minimize):
+class Endoscope_Batch():
     '''
-    Поиск решений для различных начальных условий. Проверка решений на равенство. 
+    Класс для определения координат положения и углов наклона эндоскопа сразу для набора 
+    отверстий. Искомая точка лежит на оси отверстия на расстоянии d1 от входного отверстия, 
+    поэтому решение находится в замкнутом виде за один проход NumPy. Итерационный решатель 
+    Endoscope_Root используется только для отверстий, для которых замкнутое решение неприменимо.
     '''
-    def get_start_coordinate(self):
+    # Тип решателя. Входит в ключ кэша решений.
+    solver_kind = 'closed_form'
 
-        # Список начальных условий для численного решения системы. 
-        starting_values = []
+    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float, diagnostics=None,
+                 holes: list = None):
+        '''
+        Parameters:
+        - input: np.ndarray.
+            Массив N x 3 координат [x, y, z] входных отверстий. 
+        - output: np.ndarray.
+            Массив N x 3 координат [x, y, z] выходных отверстий.   
+        - e_len: float.
+            Длина эндоскопа.
+        - diagnostics: SolverDiagnostics.
+            Таблица диагностики (solver_diagnostics.SolverDiagnostics) или None.
+        - holes: list.
+            Номера отверстий для диагностики (по умолчанию - индексы).
+        '''
+        self.d = e_len
+        self.diagnostics = diagnostics
 
-        for i in [-1, 1]:
-            for j in [-1, 1]:
-                for k in [-1, 1]:
-                    starting_values.append([i,j,k])
+        self.input = np.asarray(input, dtype=float).reshape(-1, 3)
+        self.output = np.asarray(output, dtype=float).reshape(-1, 3)
 
-        # Поиск решений для разных начальных условий. 
-        solutions = []
-        for i, value in enumerate(starting_values):
+        # Вектор оси отверстия и глубина каждого отверстия. 
+        self.axis = self.output - self.input
+        self.hole_depth = np.linalg.norm(self.axis, axis=1)
 
-            sol = scipy.optimize.root(self.start_coordinates_equations, value, method='lm').x
-            solutions.append([round(coord,3) for coord in sol])
-        
-        # Проверка решений на взаимное равенство. 
-        if all(sol==solutions[0] for sol in solutions) == True:
-            print('ЕДИНСТВЕННОЕ РЕШЕНИЕ')
-            print(solutions[0])
-        else:
-            print('РЕШЕНИЯ РАЗНЫЕ')
+        self.holes = list(holes) if holes is not None else [str(i) for i in range(len(self.input))]
+
+        # Решения итерационного решателя: {'index', 'position'} и Endoscope_Root.stats.
+        self.stats = []
+
+    def find_point(self, d1, d2, tol: float = 1e-9, initial_guess: np.ndarray = None, 
+                   position: str = ''):
+        '''
+        Метод для поиска координат начального/конечного положения эндоскопа для всех отверстий.
+        Точка крепления лежит на продолжении оси отверстия за входным отверстием: 
+        m = input - d1 * (output - input) / hole_depth.
+
+        Итерационный решатель начинает с initial_guess, а без него - с начального 
+        приближения Endoscope_Root.find_point, зависящего только от самого отверстия, 
+        поэтому решение не зависит от порядка отверстий и разбиения на порции. Количество 
+        вычислений по отверстиям добавляется в self.stats, все решения записываются в 
+        таблицу диагностики.
+
+        Parameters:
+        - d1: float | np.ndarray.
+            Расстояние от точки крепления эндоскопа до входного отверстия. 
+        - d2: float | np.ndarray.
+            Расстояние от точки крепления эндоскопа до выходного отверстия.
+        - tol: float.
+            Допуск проверки условия d2 - d1 = hole_depth.
+        - initial_guess: np.ndarray.
+            Массив N x 3 начальных приближений итерационного решателя или None.
+        - position: str.
+            Название положения для диагностики ('start', 'stop').
+
+        Returns:
+        - np.ndarray. 
+            Массив N x 3 координат [x, y, z] положения эндоскопа. 
+        '''
+        begin = time.perf_counter()
+
+        d1 = np.broadcast_to(np.asarray(d1, dtype=float), self.hole_depth.shape)
+        d2 = np.broadcast_to(np.asarray(d2, dtype=float), self.hole_depth.shape)
+
+        # Замкнутое решение существует, если ось отверстия определена, а точка m лежит 
+        # за входным отверстием на расстоянии d1 >= 0.
+        closed = ((self.hole_depth > 0) & (d1 >= 0) & 
+                  (np.abs(d2 - d1 - self.hole_depth) <= tol * np.maximum(1, d2)))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(closed, d1 / self.hole_depth, 0)
+
+        points = self.input - scale[:, None] * self.axis
+
+        if self.diagnostics is not None:
+            residuals = system_residuals(points[closed], self.input[closed], self.output[closed], 
+                                         d1[closed], d2[closed])
+            self.diagnostics.record_batch([self.holes[i] for i in np.flatnonzero(closed)], position, 
+                                          self.solver_kind, np.linalg.norm(residuals, axis=1), 
+                                          time.perf_counter() - begin)
+
+        # Итерационное решение для остальных отверстий. 
+        for i in np.flatnonzero(~closed):
+            guess = initial_guess[i] if initial_guess is not None else None
+
+            endoscope = Endoscope_Root(self.input[i], self.output[i], self.d)
+            points[i] = endoscope.find_point(d1[i], d2[i], guess)
+            self.stats.append(dict(index=int(i), position=position, **endoscope.stats))
+
+            if self.diagnostics is not None:
+                self.diagnostics.record(self.holes[i], position, **endoscope.stats)
+
+        return points
+
+    def find_angles(self, d1, d2, position: str = ''):
+        '''
+        Метод для поиска углов наклона эндоскопа в сферической системе координат для всех 
+        отверстий. Маска вырожденных отверстий сохраняется в self.degenerate.
+
+        Parameters:
+        - d1: float | np.ndarray.
+            Расстояние от точки крепления эндоскопа до входного отверстия. 
+        - d2: float | np.ndarray.
+            Расстояние от точки крепления эндоскопа до выходного отверстия.
+        - position: str.
+            Название положения для диагностики.
+
+        Returns:
+        - np.ndarray. 
+            Массив N x 5: координаты [x, y, z] начального положения эндоскопа и углы [phi, psi]. 
+        '''
+        points = self.find_point(d1, d2, position=position)
+
+        # Углы наклона и маска вырожденных отверстий (ось параллельна Z).
+        with stage('angles'):
+            phi, psi, self.degenerate = spherical_angles(self.input - points)
+
+        return np.column_stack([points, phi, psi])
+
+    def solve(self):
+        '''
+        Поиск начального и конечного положения эндоскопа для всех отверстий.
+
+        Returns:
+        - tuple.
+            Массив N x 5 [x, y, z, phi, psi] начальных положений и массив N x 3 [x, y, z] 
+            конечных положений эндоскопа.
+        '''
+        # Начальное положение: d1 = e_len, d2 = e_len + hole_depth.
+        start = self.find_angles(self.d, self.d + self.hole_depth, 'start')
+
+        # Конечное положение: d1 = e_len - hole_depth, d2 = e_len. Начальное приближение - 
+        # начальное положение, смещенное на глубину отверстия вдоль оси.
+        stop = self.find_point(self.d - self.hole_depth, self.d, initial_guess=start[:, :3] + self.axis,
+                               position='stop')
+
+        return start, stop
+
+
+def system_residuals(points: np.ndarray, inputs: np.ndarray, outputs: np.ndarray, d1, d2):
+    '''
+    Невязки системы уравнений Endoscope_Root.system_equations для набора точек.
+
+    Parameters:
+    - points: np.ndarray.
+        Массив ... x 3 координат искомых точек m.
+    - inputs: np.ndarray.
+        Массив ... x 3 координат входных отверстий.
+    - outputs: np.ndarray.
+        Массив ... x 3 координат выходных отверстий.
+    - d1: float | np.ndarray.
+        Расстояние от точки крепления эндоскопа до входного отверстия.
+    - d2: float | np.ndarray.
+        Расстояние от точки крепления эндоскопа до выходного отверстия.
+
+    Returns:
+    - np.ndarray.
+        Массив ... x 5 невязок [eq1, eq2, eq3, eq4, eq5].
+    '''
+    a = points - inputs
+    b = points - outputs
+    axis = outputs - inputs
+
+    return np.stack([a[..., 0] * axis[..., 1] - a[..., 1] * axis[..., 0],
+                     a[..., 0] * axis[..., 2] - a[..., 2] * axis[..., 0],
+                     a[..., 1] * axis[..., 2] - a[..., 2] * axis[..., 1],
+                     np.linalg.norm(a, axis=-1) - d1,
+                     np.linalg.norm(b, axis=-1) - d2], axis=-1)
+
+
+def system_jacobian(points: np.ndarray, inputs: np.ndarray, outputs: np.ndarray):
+    '''
+    Аналитическая матрица Якоби системы уравнений Endoscope_Root.system_equations.
+    Уравнения eq1 - eq3 линейны по m, производные eq4, eq5 - единичные векторы от
+    входного и выходного отверстий к точке m. В самих отверстиях расстояние не
+    дифференцируемо, и используется производная по направлению от выходного отверстия
+    к входному (точка крепления лежит за входным отверстием).
+
+    Returns:
+    - np.ndarray.
+        Массив ... x 5 x 3 производных невязок по координатам [x, y, z] точки m.
+    '''
+    a = points - inputs
+    b = points - outputs
+    axis = np.broadcast_to(outputs - inputs, a.shape)
+    zero = np.zeros(a.shape[:-1])
+
+    ax, ay, az = axis[..., 0], axis[..., 1], axis[..., 2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.linalg.norm(axis, axis=-1, keepdims=True)
+        backward = np.where(depth > 0, -axis / depth, 0.0)
+
+        na = np.linalg.norm(a, axis=-1, keepdims=True)
+        nb = np.linalg.norm(b, axis=-1, keepdims=True)
+        ua = np.where(na > 0, a / na, backward)
+        ub = np.where(nb > 0, b / nb, backward)
+
+    return np.stack([np.stack([ay, -ax, zero], axis=-1),
+                     np.stack([az, zero, -ax], axis=-1),
+                     np.stack([zero, az, -ay], axis=-1),
+                     ua, ub], axis=-2)
+
+
+def solve_system_batch(points: np.ndarray, inputs: np.ndarray, outputs: np.ndarray, d1, d2,
+                       max_iter: int = 100, xtol: float = 1e-10, ftol: float = 1e-20):
+    '''
+    Решение набора систем уравнений Endoscope_Root методом Левенберга — Марквардта
+    одновременно для всех начальных точек (векторизованно NumPy).
+
+    Parameters:
+    - points: np.ndarray.
+        Массив K x 3 начальных точек.
+    - inputs, outputs: np.ndarray.
+        Массивы K x 3 координат входных и выходных отверстий.
+    - d1, d2: float | np.ndarray.
+        Расстояния до входного и выходного отверстий (скаляры или массивы длины K).
+    - max_iter: int.
+        Наибольшее количество итераций.
+    - xtol: float.
+        Относительная точность шага.
+    - ftol: float.
+        Допуск суммы квадратов невязок.
+
+    Returns:
+    - tuple.
+        Массив K x 3 решений, массив K сумм квадратов невязок, булев массив K признаков
+        сходимости и количество выполненных итераций.
+    '''
+    m = np.array(points, dtype=float).reshape(-1, 3)
+    inputs = np.broadcast_to(inputs, m.shape)
+    outputs = np.broadcast_to(outputs, m.shape)
+    d1 = np.broadcast_to(np.asarray(d1, dtype=float), m.shape[:1])
+    d2 = np.broadcast_to(np.asarray(d2, dtype=float), m.shape[:1])
+
+    residuals = system_residuals(m, inputs, outputs, d1, d2)
+    cost = np.sum(residuals**2, axis=1)
+    damping = np.full(len(m), 1e-3)
+    converged = cost <= ftol
+    active = ~converged
+
+    iterations = 0
+    while iterations < max_iter and active.any():
+        iterations += 1
+        idx = np.flatnonzero(active)
+
+        jacobian = system_jacobian(m[idx], inputs[idx], outputs[idx])
+        gradient = np.einsum('kij,ki->kj', jacobian, residuals[idx])
+        normal = np.einsum('kij,kil->kjl', jacobian, jacobian)
+
+        # Масштабирование Марквардта диагональю JᵀJ (единичной для нулевых столбцов).
+        diagonal = np.einsum('kjj->kj', normal)
+        diagonal = np.where(diagonal > 0, diagonal, 1.0)
+        system = normal + damping[idx, None, None] * diagonal[:, :, None] * np.eye(3)
+
+        step = -np.linalg.solve(system, gradient[..., None])[..., 0]
+        candidate = m[idx] + step
+        candidate_residuals = system_residuals(candidate, inputs[idx], outputs[idx], d1[idx], d2[idx])
+        candidate_cost = np.sum(candidate_residuals**2, axis=1)
+
+        better = candidate_cost < cost[idx]
+        accepted = idx[better]
+
+        m[accepted] = candidate[better]
+        residuals[accepted] = candidate_residuals[better]
+        cost[accepted] = candidate_cost[better]
+        damping[idx] = np.where(better, damping[idx] / 10, damping[idx] * 10)
+
+        small_step = (np.linalg.norm(step, axis=1) <= xtol * (1 + np.linalg.norm(m[idx], axis=1)))
+        done = (better & small_step) | (cost[idx] <= ftol)
+        converged[idx[done]] = True
+
+        # Шаг не уменьшает невязку при любом демпфировании - локальный минимум.
+        stalled = damping[idx] > 1e12
+        active[idx[done | stalled]] = False
+
+    return m, cost, converged, iterations
+
+
+class SolutionsChecker(Endoscope_Batch):
+    '''
+    Проверка единственности решений системы уравнений Endoscope_Root. Для каждого отверстия
+    система решается из нескольких начальных точек (все отверстия и начальные точки - одним
+    векторизованным расчетом), найденные корни объединяются с допуском tolerance.
+
+    Пример:
+        checker = SolutionsChecker(table.start, table.end, e_len, table.point_numbers)
+        report = checker.get_start_coordinate()
+        print(format_solutions_report(report))
+    '''
+    def __init__(self, input: np.ndarray, output: np.ndarray, e_len: float, point_numbers: list = None,
+                 tolerance: float = 1e-3, residual_tol: float = 1e-6, batch_size: int = 50000):
+        '''
+        Parameters:
+        - input: np.ndarray.
+            Массив N x 3 координат [x, y, z] входных отверстий.
+        - output: np.ndarray.
+            Массив N x 3 координат [x, y, z] выходных отверстий.
+        - e_len: float.
+            Длина эндоскопа.
+        - point_numbers: list.
+            Номера отверстий для отчета (по умолчанию - индексы).
+        - tolerance: float.
+            Расстояние, в пределах которого корни считаются одним решением.
+        - residual_tol: float.
+            Допуск невязки (расстояние до оси отверстия и ошибка расстояний) для корня.
+        - batch_size: int.
+            Наибольшее количество решаемых одновременно систем.
+        '''
+        Endoscope_Batch.__init__(self, input, output, e_len)
+
+        self.point_numbers = (list(point_numbers) if point_numbers is not None
+                              else [str(i) for i in range(len(self.input))])
+        self.tolerance = tolerance
+        self.residual_tol = residual_tol
+        self.batch_size = batch_size
+
+    def starting_values(self) -> np.ndarray:
+        '''
+        Начальные точки: середина отверстия и вершины куба с центром в ней и полустороной,
+        равной длине эндоскопа с глубиной отверстия.
+
+        Returns:
+        - np.ndarray.
+            Массив N x 9 x 3.
+        '''
+        corners = np.array([[0, 0, 0]] + [[i, j, k] for i in (-1, 1) for j in (-1, 1) for k in (-1, 1)],
+                           dtype=float)
+        middle = (self.input + self.output) / 2
+        spread = np.maximum(self.d + self.hole_depth, 1.0)
+
+        return middle[:, None, :] + spread[:, None, None] * corners
+
+    def residual_errors(self, points: np.ndarray, d1: np.ndarray, d2: np.ndarray) -> np.ndarray:
+        '''
+        Наибольшая геометрическая ошибка корня: расстояние до оси отверстия и ошибки
+        расстояний до входного и выходного отверстий.
+        '''
+        residuals = system_residuals(points, self.input[:, None], self.output[:, None],
+                                     d1[:, None], d2[:, None])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            line = np.linalg.norm(residuals[..., :3], axis=-1) / self.hole_depth[:, None]
+        line = np.where(self.hole_depth[:, None] > 0, line, 0.0)
+
+        return np.maximum(line, np.abs(residuals[..., 3:]).max(axis=-1))
+
+    def solve_starts(self, d1, d2) -> tuple:
+        '''
+        Решение систем всех отверстий из всех начальных точек.
+
+        Returns:
+        - tuple.
+            Массив N x S x 3 корней, массив N x S ошибок и булев массив N x S признаков сходимости.
+        '''
+        d1 = np.broadcast_to(np.asarray(d1, dtype=float), self.hole_depth.shape)
+        d2 = np.broadcast_to(np.asarray(d2, dtype=float), self.hole_depth.shape)
+
+        starts = self.starting_values()
+        count, per_hole = starts.shape[:2]
+
+        points = starts.reshape(-1, 3).copy()
+        converged = np.zeros(len(points), dtype=bool)
+        holes = np.repeat(np.arange(count), per_hole)
+
+        for begin in range(0, len(points), self.batch_size):
+            chunk = slice(begin, begin + self.batch_size)
+            index = holes[chunk]
+            points[chunk], _, converged[chunk], _ = solve_system_batch(
+                points[chunk], self.input[index], self.output[index], d1[index], d2[index])
+
+        points = points.reshape(count, per_hole, 3)
+
+        return points, self.residual_errors(points, d1, d2), converged.reshape(count, per_hole)
+
+    def cluster(self, roots: np.ndarray) -> list:
+        '''
+        Объединение корней одного отверстия, отстоящих друг от друга не более чем на tolerance.
+        '''
+        distinct = []
+        for root in roots:
+            if not any(np.linalg.norm(root - other) <= self.tolerance for other in distinct):
+                distinct.append(root)
+
+        return distinct
+
+    def check(self, d1, d2, kind: str = '') -> dict:
+        '''
+        Проверка единственности решения для всех отверстий.
+
+        Parameters:
+        - d1, d2: float | np.ndarray.
+            Расстояния до входного и выходного отверстий.
+        - kind: str.
+            Название проверяемого положения для отчета.
+
+        Returns:
+        - dict.
+            {'kind', 'holes', 'unique', 'ambiguous', 'failed', 'seconds'}: количество
+            отверстий и отверстий с единственным решением, списки отверстий с несколькими
+            решениями и без решений. Элемент списка - {'index', 'point_number', 'roots',
+            'solved_starts', 'starts', 'error'}.
+        '''
+        begin = time.perf_counter()
+
+        points, errors, converged = self.solve_starts(d1, d2)
+        solved = converged & (errors <= self.residual_tol * np.maximum(1.0, self.d))
+
+        report = {'kind': kind, 'holes': len(points), 'unique': 0, 'ambiguous': [], 'failed': []}
+
+        for i in range(len(points)):
+            roots = self.cluster(points[i][solved[i]])
+
+            if len(roots) == 1:
+                report['unique'] += 1
+                continue
+
+            case = {'index': i,
+                    'point_number': self.point_numbers[i],
+                    'roots': np.round(roots, 6).tolist(),
+                    'solved_starts': int(solved[i].sum()),
+                    'starts': int(solved.shape[1]),
+                    'error': float(errors[i].min())}
+
+            report['ambiguous' if roots else 'failed'].append(case)
+
+        report['seconds'] = time.perf_counter() - begin
+
+        return report
+
+    def get_start_coordinate(self) -> dict:
+        '''
+        Проверка начального положения: d1 = e_len, d2 = e_len + hole_depth.
+        '''
+        return self.check(self.d, self.d + self.hole_depth, 'start')
+
+    def get_stop_coordinate(self) -> dict:
+        '''
+        Проверка конечного положения: d1 = e_len - hole_depth, d2 = e_len.
+        '''
+        return self.check(self.d - self.hole_depth, self.d, 'stop')
+
+
+def check_part_solutions(json_path: str, **kwargs) -> list:
+    '''
+    Проверка единственности начального и конечного положений эндоскопа для всех отверстий
+    JSON файла детали. Дополнительные аргументы передаются SolutionsChecker.
+
+    Returns:
+    - list.
+        Отчеты SolutionsChecker.check для начального и конечного положений.
+    '''
+    header = read_header(json_path)
+    table = HoleTable.from_json(json_path)
+
+    checker = SolutionsChecker(table.start, table.end, header['endoscope_length'],
+                               table.point_numbers, **kwargs)
+
+    return [checker.get_start_coordinate(), checker.get_stop_coordinate()]
+
+
+def format_solutions_report(report: dict) -> str:
+    '''
+    Текстовая сводка проверки единственности решений.
+    '''
+    lines = [f"Положение {report['kind']}: отверстий {report['holes']}, единственное решение "
+             f"{report['unique']}, несколько решений {len(report['ambiguous'])}, без решения "
+             f"{len(report['failed'])} ({report['seconds']:.2f} с)"]
+
+    for case in report['ambiguous']:
+        lines.append(f"  Отверстие {case['point_number']}: решений {len(case['roots'])} - {case['roots']}")
+    for case in report['failed']:
+        lines.append(f"  Отверстие {case['point_number']}: нет решения (сошлось {case['solved_starts']} "
+                     f"из {case['starts']}, ошибка {case['error']:.3g})")
+
+    return '\n'.join(lines)
+
+
+# Калибровка по Q W. Блок не зависит от отверстия и формируется один раз.
+LIGHT_CALIBRATION = (
+
+    "// КАЛИБРОВКА (Q W) ",
+
+    "ComSendmacro('G1 X0 Y0 Z0$0A');",
+
+    "Delay(10000);",
+
+    "// Замыкание концевиков, обнуление координат ",
+    "ComSendmacro('G1 Q-999 O$0A');",
+    "ComSendmacro('G1 W-999 O$0A');",
+
+    "Delay(5000);",
+
+    "// Замыкание концевиков, обнуление координат ",
+    "ComSendmacro('G1 Q90$0A');",
+    "ComSendmacro('G1 W90$0A');",
+
+    "Delay(5000);",
+
+    "// Замыкание концевиков, обнуление координат ",
+    "ComSendmacro('G1 Q-999 O$0A');",
+    "ComSendmacro('G1 W-999 O$0A');",
+
+    "Delay(5000);",
+
+    "// Стартовое положение ",
+    "ComSendmacro('G1 Q31$0A');",
+    "ComSendmacro('G1 W60$0A');",
+
+    "Delay(5000);",
+
+    "// Обнуление координат стартового положения ",
+    "ComSendmacro('G10$0A');",
+
+    "// ........................................................."
+)
+
+
+# Калибровка по X Y Z. Блок не зависит от отверстия и формируется один раз.
+FULL_CALIBRATION = (
+
+    "// КАЛИБРОВКА (X Y Z) ",
+
+    "// Замыкание концевиков, обнуление координат ",
+    "ComSendmacro('G1 Z999 O$0A');",
+    
+    "Delay(20000);",
+
+    "ComSendmacro('G1 Y-999 O$0A');",
+    
+    "Delay(20000);",
+
+    "ComSendmacro('G1 X-999 O$0A');",
+
+    "Delay(20000);",
+
+    "// Стартовое положение ",
+    "ComSendmacro('G1 Z-263$0A');",
+
+    "Delay(20000);",
+
+    "ComSendmacro('G1 Y488$0A');",
+
+    "Delay(20000);",
+
+    "ComSendmacro('G1 X442$0A');",
+
+    "Delay(20000);",
+
+    "// Обнуление координат стартового положения ",
+    "ComSendmacro('G10$0A');",
+
+    "// ........................................................."
+)
 
 
 class GCodeMaker():
 
-    def __init__(self, start_solution: list, end_solution: list, starting_height: int):
-        
+    def __init__(self, start_solution: list, end_solution: list, starting_height: int,
+                 precision: int = None):
+        '''
+        Parameters:
+        - start_solution: list.
+            [x, y, z, phi, psi] начального положения.
+        - end_solution: list.
+            [x, y, z] конечного положения.
+        - starting_height: int.
+            Высота стартовой плоскости.
+        - precision: int.
+            Количество знаков после запятой в командах или None для вывода чисел без
+            изменения (str).
+        '''
+        if precision is not None:
+            start_solution = [f'{value:.{precision}f}' for value in start_solution]
+            end_solution = [f'{value:.{precision}f}' for value in end_solution]
+            starting_height = f'{starting_height:.{precision}f}'
+
         self.X1, self.Y1, self.Z1, self.phi, self.psi = start_solution
         self.X2, self.Y2, self.Z2 = end_solution
         self.starting_height = starting_height
@@ -316,206 +952,689 @@ class GCodeMaker():
     
     def make_light_calibration(self):
 
-        calibration = [
+        return list(LIGHT_CALIBRATION)
+    
+    def make_full_calibration(self):
 
-        "// КАЛИБРОВКА (Q W) ",
+        return list(FULL_CALIBRATION)
 
-        "ComSendmacro('G1 X0 Y0 Z0$0A');",
 
-        "Delay(10000);",
+    def make_json(self, point_number: str):
+        '''
+        Решение для отверстия в формате endoscope_coordinates_for_*.json: 
+        {'hole_<point_number>': {'start': {...}, 'end': {...}}}.
+        '''
+        return {'hole_' + point_number: hole_solution([self.X1, self.Y1, self.Z1, self.phi, self.psi],
+                                                      [self.X2, self.Y2, self.Z2])}
 
-        "// Замыкание концевиков, обнуление координат ",
-        "ComSendmacro('G1 Q-999 O$0A');",
-        "ComSendmacro('G1 W-999 O$0A');",
 
-        "Delay(5000);",
+class TscWriter():
+    '''
+    Потоковая запись последовательности команд для терминала (.tsc). Файл открывается 
+    один раз, команды накапливаются в буфере и сбрасываются крупными блоками. 
+    При atomic=True запись идет во временный файл, который по завершении переименовывается 
+    в целевой, поэтому при сбое существующий файл не повреждается и не дописывается. 
+    При заданном planner (delay_planner.DelayPlanner) паузы Delay пересчитываются по 
+    перемещениям в порядке записи, при заданном optimizer (program_optimizer.TerminalOptimizer) 
+    избыточные команды удаляются.
+
+    Пример:
+        with TscWriter('result/commands_sequence_for_cube.tsc') as writer:
+            writer.write_full_calibration()
+            writer.write_commands(commands)
+    '''
+    # Калибровочные блоки в виде готового текста. 
+    LIGHT_CALIBRATION_TEXT = ''.join(command + '\n' for command in LIGHT_CALIBRATION)
+    FULL_CALIBRATION_TEXT = ''.join(command + '\n' for command in FULL_CALIBRATION)
 
-        "// Замыкание концевиков, обнуление координат ",
-        "ComSendmacro('G1 Q90$0A');",
-        "ComSendmacro('G1 W90$0A');",
+    def __init__(self, path: str, atomic: bool = True, chunk_size: int = 1 << 20, planner=None,
+                 optimizer=None):
+        '''
+        Parameters:
+        - path: str.
+            Путь до файла .tsc. Существующий файл перезаписывается.
+        - atomic: bool.
+            Запись через временный файл с последующим переименованием.
+        - chunk_size: int.
+            Размер буфера в символах, при превышении которого буфер сбрасывается в файл.
+        - planner: DelayPlanner.
+            Планировщик пауз или None для записи пауз без изменений.
+        - optimizer: TerminalOptimizer.
+            Сокращение программы (program_optimizer.TerminalOptimizer) или None.
+        '''
+        self.path = path
+        self.atomic = atomic
+        self.chunk_size = chunk_size
+        self.planner = planner
+        self.optimizer = optimizer
 
-        "Delay(5000);",
+        self.buffer = []
+        self.buffer_size = 0
+        self.file = None
 
-        "// Замыкание концевиков, обнуление координат ",
-        "ComSendmacro('G1 Q-999 O$0A');",
-        "ComSendmacro('G1 W-999 O$0A');",
+    def open(self):
 
-        "Delay(5000);",
+        self.temp_path = self.path + '.tmp' if self.atomic else self.path
+        self.file = open(self.temp_path, 'w')
 
-        "// Стартовое положение ",
-        "ComSendmacro('G1 Q31$0A');",
-        "ComSendmacro('G1 W60$0A');",
+        if self.planner is not None:
+            self.planner.reset()
 
-        "Delay(5000);",
+        if self.optimizer is not None:
+            self.optimizer.reset()
 
-        "// Обнуление координат стартового положения ",
-        "ComSendmacro('G10$0A');",
+        return self
 
-        "// ........................................................."
+    def write_text(self, text: str):
+        '''
+        Добавляет готовый текст в буфер и сбрасывает буфер при его заполнении.
+        '''
+        if self.planner is not None:
+            text = self.planner.plan_text(text)
 
-        ]
-        return calibration
-    
-    def make_full_calibration(self):
+        if self.optimizer is not None:
+            text = self.optimizer.optimize_text(text)
 
-        calibration = [
+        self.buffer.append(text)
+        self.buffer_size += len(text)
 
-        "// КАЛИБРОВКА (X Y Z) ",
+        if self.buffer_size >= self.chunk_size:
+            self.flush()
 
-        "// Замыкание концевиков, обнуление координат ",
-        "ComSendmacro('G1 Z999 O$0A');",
-        
-        "Delay(20000);",
+    def write_commands(self, commands: list):
 
-        "ComSendmacro('G1 Y-999 O$0A');",
-        
-        "Delay(20000);",
+        self.write_text(''.join(command + '\n' for command in commands))
 
-        "ComSendmacro('G1 X-999 O$0A');",
+    def write_light_calibration(self):
 
-        "Delay(20000);",
+        self.write_text(self.LIGHT_CALIBRATION_TEXT)
 
-        "// Стартовое положение ",
-        "ComSendmacro('G1 Z-263$0A');",
+    def write_full_calibration(self):
 
-        "Delay(20000);",
+        self.write_text(self.FULL_CALIBRATION_TEXT)
 
-        "ComSendmacro('G1 Y488$0A');",
+    def flush(self):
 
-        "Delay(20000);",
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+        self.buffer_size = 0
 
-        "ComSendmacro('G1 X442$0A');",
+    def close(self):
 
-        "Delay(20000);",
+        if self.optimizer is not None:
+            self.buffer.append(self.optimizer.finish())
 
-        "// Обнуление координат стартового положения ",
-        "ComSendmacro('G10$0A');",
+        self.flush()
+        self.file.close()
 
-        "// ........................................................."
-        ]
-        return calibration
+        if self.atomic:
+            os.replace(self.temp_path, self.path)
 
+    def abort(self):
+        '''
+        Закрывает файл без сохранения. Временный файл удаляется, целевой не изменяется.
+        '''
+        self.file.close()
 
-    def make_json(self, point_number: str):
-        
-        points = {}
+        if self.atomic:
+            os.remove(self.temp_path)
 
-        points['hole_' + point_number]['start'] = {
-            'X': self.X1, 'Y': self.Y1, 'Z': self.Z1, 'phi': self.phi, 'psi': self.psi}
-        
-        points['hole_' + point_number]['end'] = {'X': self.X2, 'Y': self.Y2, 'Z': self.Z2}
+    def __enter__(self):
 
-        return points
+        return self.open()
 
+    def __exit__(self, exc_type, exc_value, traceback):
 
-if __name__ == '__main__':
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
-    warnings.filterwarnings("error")
 
-    # Имя JSON файла с координатами отверстий.  сг
-    name = input('Введите название JSON файла с координатами: ')
+def solve_holes(inputs: np.ndarray, outputs: np.ndarray, e_len: float, 
+                starting_height: float = 0, cache=None, diagnostics=None, point_numbers: list = None):
+    '''
+    Поиск начальных и конечных положений эндоскопа для набора отверстий. При переданном 
+    кэше решаются только отверстия, для которых нет сохраненного решения.
+
+    Parameters:
+    - inputs: np.ndarray.
+        Массив N x 3 координат входных отверстий.
+    - outputs: np.ndarray.
+        Массив N x 3 координат выходных отверстий.
+    - e_len: float.
+        Длина эндоскопа.
+    - starting_height: float.
+        Высота стартовой плоскости (входит в ключ кэша).
+    - cache: SolutionCache.
+        Кэш решений (solution_cache.SolutionCache) или None.
+    - diagnostics: SolverDiagnostics.
+        Таблица диагностики решений (решения из кэша не записываются) или None.
+    - point_numbers: list.
+        Номера отверстий для диагностики.
+
+    Returns:
+    - tuple.
+        Массив N x 5 [x, y, z, phi, psi] начальных и массив N x 3 [x, y, z] конечных положений.
+    '''
+    count_event('holes', len(inputs))
 
-    with open('src/json/' + name + '.json') as f:
-        coordinates = json.load(f)
+    if cache is None:
+        with stage('solve'):
+            return Endoscope_Batch(inputs, outputs, e_len, diagnostics, point_numbers).solve()
+
+    with stage('cache'):
+        keys = cache.make_keys(inputs, outputs, e_len, starting_height, Endoscope_Batch.solver_kind)
+        found = cache.get_many(keys)
+
+    starts = np.empty((len(keys), 5))
+    stops = np.empty((len(keys), 3))
+
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    for i, key in enumerate(keys):
+        if key in found:
+            starts[i], stops[i] = found[key]
+
+    if missing:
+        holes = [point_numbers[i] for i in missing] if point_numbers is not None else missing
+        with stage('solve'):
+            starts[missing], stops[missing] = Endoscope_Batch(
+                inputs[missing], outputs[missing], e_len, diagnostics, holes).solve()
+        with stage('cache'):
+            cache.put_many([keys[i] for i in missing], starts[missing], stops[missing])
+
+    return starts, stops
+
+
+# Поля шаблонов команд (command_template.CommandTemplate) в порядке аргументов.
+TEMPLATE_FIELDS = ('point_number', 'X1', 'Y1', 'Z1', 'phi', 'psi', 'X2', 'Y2', 'Z2', 'starting_height')
+
+
+@functools.lru_cache(maxsize=None)
+def command_template(kind: str = 'terminal', precision: int = None) -> CommandTemplate:
+    '''
+    Шаблон блока команд одного отверстия, построенный по GCodeMaker: текст блока
+    формируется один раз с метками вместо значений. Вывод шаблона совпадает с выводом
+    GCodeMaker с той же точностью precision.
+
+    Parameters:
+    - kind: str.
+        'terminal' - make_terminal_command, 'gcode' - make_gcode.
+    - precision: int.
+        Количество знаков после запятой или None для вывода чисел без изменения.
+
+    Returns:
+    - CommandTemplate.
+    '''
+    def render(point_number, X1, Y1, Z1, phi, psi, X2, Y2, Z2, starting_height):
+        gcode = GCodeMaker([X1, Y1, Z1, phi, psi], [X2, Y2, Z2], starting_height)
+        if kind == 'terminal':
+            commands = gcode.make_terminal_command(point_number)
+        elif kind == 'gcode':
+            commands = gcode.make_gcode(point_number)
+        else:
+            raise ValueError(f'Неизвестный вид шаблона: {kind}')
+        return ''.join(command + '\n' for command in commands)
+
+    return CommandTemplate.compile(render, TEMPLATE_FIELDS, TEMPLATE_FIELDS[1:], precision)
+
+
+def render_hole_block(point_number: str, start: list, stop: list, starting_height: float,
+                      precision: int = None) -> str:
+    '''
+    Текст блока команд для терминала для одного отверстия (без калибровки).
+    '''
+    return command_template('terminal', precision).render((point_number, *start, *stop, starting_height))
+
+
+def render_hole_blocks(point_numbers: list, starts: np.ndarray, stops: np.ndarray,
+                       starting_height: float, precision: int = None, file=None,
+                       kind: str = 'terminal'):
+    '''
+    Тексты блоков команд для набора отверстий по массивам решений: шаблон заполняется
+    одной операцией на порцию отверстий.
+
+    Parameters:
+    - point_numbers: list.
+        Номера отверстий.
+    - starts: np.ndarray.
+        Массив N x 5 [x, y, z, phi, psi] начальных положений.
+    - stops: np.ndarray.
+        Массив N x 3 [x, y, z] конечных положений.
+    - starting_height: float.
+        Высота стартовой плоскости.
+    - precision: int.
+        Количество знаков после запятой или None для вывода чисел без изменения.
+    - file: file.
+        Файл или буфер для записи блоков или None.
+    - kind: str.
+        'terminal' или 'gcode'.
+
+    Returns:
+    - list | int.
+        Тексты блоков или, при заданном file, количество записанных блоков.
+    '''
+    template = command_template(kind, precision)
+
+    starts = np.asarray(starts, dtype=float).reshape(-1, 5)
+    stops = np.asarray(stops, dtype=float).reshape(-1, 3)
+
+    columns = dict(zip(TEMPLATE_FIELDS[1:6], starts.T))
+    columns.update(zip(TEMPLATE_FIELDS[6:9], stops.T))
+    columns['point_number'] = point_numbers
+    columns['starting_height'] = [starting_height] * len(starts)
+
+    if file is not None:
+        return template.write(file, columns)
+
+    return template.render_rows(columns)
+
+
+def hole_solution(start: list, stop: list) -> dict:
+    '''
+    Запись решения для одного отверстия в формате endoscope_coordinates_for_*.json.
+    '''
+    return {'start': {'X': start[0], 'Y': start[1], 'Z': start[2], 'phi': start[3], 'psi': start[4]},
+            'end': {'X': stop[0], 'Y': stop[1], 'Z': stop[2]}}
+
+
+def write_command_sequence(path: str, blocks, planner=None, scheduler=None, optimizer=None):
+    '''
+    Запись последовательности команд для терминала: блоки отверстий с калибровками. По 
+    умолчанию калибровка по Q W выполняется перед каждым измерением, калибровка по X Y Z - 
+    в начале цикла и через каждые 10 измерений (calibration_scheduler.CalibrationScheduler).
+
+    Parameters:
+    - path: str.
+        Путь до файла .tsc.
+    - blocks: iterable.
+        Тексты блоков отверстий (render_hole_block) в порядке обхода.
+    - planner: DelayPlanner.
+        Планировщик пауз (delay_planner.DelayPlanner) или None для фиксированных пауз.
+    - scheduler: CalibrationScheduler.
+        Планировщик калибровок или None для исходного цикла.
+    - optimizer: TerminalOptimizer.
+        Сокращение программы (program_optimizer.TerminalOptimizer) или None.
+    '''
+    if scheduler is None:
+        scheduler = CalibrationScheduler()
+
+    scheduler.reset()
+
+    with TscWriter(path, planner=planner, optimizer=optimizer) as writer:
+
+        texts = {'full': writer.FULL_CALIBRATION_TEXT, 'light': writer.LIGHT_CALIBRATION_TEXT}
+
+        for block in blocks:
+            # Калибровки по X Y Z и Q W перед измерением.
+            for kind in scheduler.due():
+                with stage('write_tsc'):
+                    writer.write_text(texts[kind])
+                scheduler.record(kind, texts[kind])
+            # Проход по отверстию
+            with stage('write_tsc'):
+                writer.write_text(block)
+            scheduler.record('hole', block)
+
+
+def split_command_sequence(path: str) -> dict:
+    '''
+    Разбор файла .tsc на блоки отверстий. Блок начинается строкой "// Hole N" и 
+    заканчивается перед следующей калибровкой или в конце файла. Файлы в кодировке cp1251 
+    читаются так же, как в UTF-8 (cycle_time.read_program).
+
+    Returns:
+    - dict.
+        {номер отверстия: текст блока}.
+    '''
+    blocks = {}
+    point_number = None
+
+    for line in read_program(path):
+        line += '\n'
+        if line.startswith('// Hole '):
+            point_number = line[len('// Hole '):].strip()
+            blocks[point_number] = []
+        elif line.startswith('// КАЛИБРОВКА'):
+            point_number = None
+
+        if point_number is not None:
+            blocks[point_number].append(line)
+
+    return {point_number: ''.join(lines) for point_number, lines in blocks.items()}
+
+
+def result_paths(result_dir: str, name: str) -> dict:
+    '''
+    Пути до файлов результатов детали: последовательности команд (tsc), координат 
+    эндоскопа (coordinates), копии входных данных расчета (inputs), двоичной таблицы 
+    отверстий (binary), диагностики решений (diagnostics), программы G-code (gcode) и 
+    координат эндоскопа в формате CSV (csv).
+    '''
+    return {'tsc': os.path.join(result_dir, 'commands_sequence_for_' + name + '.tsc'),
+            'coordinates': os.path.join(result_dir, 'endoscope_coordinates_for_' + name + '.json'),
+            'inputs': os.path.join(result_dir, 'endoscope_inputs_for_' + name + '.json'),
+            'binary': os.path.join(result_dir, 'endoscope_coordinates_for_' + name + '.holetab'),
+            'diagnostics': os.path.join(result_dir, 'solver_diagnostics_for_' + name + '.csv'),
+            'gcode': os.path.join(result_dir, 'gcode_for_' + name + '.nc'),
+            'csv': os.path.join(result_dir, 'endoscope_coordinates_for_' + name + '.csv')}
+
+
+def solve_hole_table(table: HoleTable, e_len: float, starting_height: float = 0, cache=None,
+                     diagnostics=None):
+    '''
+    Заполнение столбцов mount_start, mount_stop, phi и psi таблицы отверстий. Столбцы 
+    start/end передаются решателю без копирования.
+
+    Returns:
+    - HoleTable.
+        Та же таблица.
+    '''
+    starts, stops = solve_holes(table.start, table.end, e_len, starting_height, cache, 
+                                diagnostics, table.point_numbers if diagnostics is not None else None)
+
+    table.mount_start[:] = starts[:, :3]
+    table.phi[:] = starts[:, 3]
+    table.psi[:] = starts[:, 4]
+    table.mount_stop[:] = stops
+
+    return table
+
+
+def solve_hole_stream(records, e_len: float, starting_height: float = 0, cache=None, 
+                      chunk_size: int = 10000, diagnostics=None):
+    '''
+    Генератор решенных таблиц для потока отверстий. Отверстия решаются порциями по 
+    chunk_size (таблицами HoleTable) векторным решателем, поэтому в памяти одновременно 
+    находится только одна порция.
+
+    Parameters:
+    - records: iterable.
+        Записи hole_stream.HoleRecord.
+    - e_len: float.
+        Длина эндоскопа.
+    - starting_height: float.
+        Высота стартовой плоскости.
+    - cache: SolutionCache.
+        Кэш решений (solution_cache.SolutionCache) или None.
+    - chunk_size: int.
+        Количество отверстий в порции.
+    - diagnostics: SolverDiagnostics.
+        Таблица диагностики решений или None.
+
+    Yields:
+    - HoleTable.
+        Порция отверстий с заполненными положениями эндоскопа.
+    '''
+    for table in HoleTable.iter_chunks(timed_iter('parse_json', records), chunk_size):
+
+        # Координаты начального и конечного положения точки крепления эндоскопа и углы его 
+        # наклона для всей порции отверстий. 
+        yield solve_hole_table(table, e_len, starting_height, cache, diagnostics)
+
+
+def iter_solutions(tables):
+    '''
+    Генератор округленных решений по отверстиям из потока решенных таблиц.
+
+    Yields:
+    - tuple.
+        Номер отверстия, [x, y, z, phi, psi] начала и [x, y, z] конца (округление до 3 знаков).
+    '''
+    for table in tables:
+
+        starts = np.column_stack([table.mount_start, table.phi, table.psi])
+
+        for point_number, start, stop in zip(table.point_numbers, 
+                                             np.round(starts, 3).tolist(), 
+                                             np.round(table.mount_stop, 3).tolist()):
+            yield point_number, start, stop
+
+
+def order_part_table(table, starting_height: float, scheduler=None, name: str = ''):
+    '''
+    Перестановка решенной таблицы отверстий в порядок с наименьшим оценочным временем 
+    цикла (hole_order.order_hole_table). Время цикла до и после по моделированию программы
+    записывается в журнал. Для калибровок по перемещениям и времени порядок не изменяется.
+
+    Returns:
+    - HoleTable.
+        Переставленная таблица.
+    '''
+    # hole_order использует константы калибровки этого модуля.
+    from hole_order import format_order_report, order_hole_table
+
+    if scheduler is not None and scheduler.uses_motion:
+        logger.warning('%s\nПорядок обхода не изменен: калибровки %r зависят от перемещений',
+                       name, scheduler)
+        return table
+
+    table, before, after = order_hole_table(table, starting_height, scheduler=scheduler)
+    logger.info('%s\n%s', name, format_order_report(before, after))
+
+    return table
+
+
+@timed('process_part')
+def process_part(json_path: str, result_dir: str = 'result', cache=None, binary: bool = False,
+                 optimize_order: bool = False, planner=None, scheduler=None, diagnostics=None,
+                 precision: int = None, outputs: tuple = ('terminal', 'json'), optimize: bool = False):
+    '''
+    Расчет положений эндоскопа для одной детали и запись результатов: по умолчанию 
+    последовательности команд commands_sequence_for_<name>.tsc и координат 
+    endoscope_coordinates_for_<name>.json, где name - имя JSON файла без расширения. 
+    Отверстия читаются, решаются и записываются потоком за один проход для всех форматов 
+    outputs (post_processor), поэтому расход памяти не зависит от их количества. Копия 
+    входного файла сохраняется для regenerate_part.
+
+    Parameters:
+    - json_path: str.
+        Путь до JSON файла с координатами отверстий.
+    - result_dir: str.
+        Папка для записи результатов.
+    - cache: SolutionCache.
+        Кэш решений (solution_cache.SolutionCache) или None.
+    - binary: bool.
+        Дополнительно записать таблицу отверстий и решений endoscope_coordinates_for_<name>.holetab
+        (то же, что 'binary' в outputs).
+    - optimize_order: bool.
+        Переставить отверстия в порядок с наименьшим оценочным временем цикла 
+        (hole_order). Требует загрузки всех отверстий в память.
+    - planner: DelayPlanner.
+        Планировщик пауз (delay_planner.DelayPlanner) или None для фиксированных пауз.
+    - scheduler: CalibrationScheduler.
+        Планировщик калибровок (calibration_scheduler.CalibrationScheduler) или None для 
+        исходного цикла.
+    - diagnostics: SolverDiagnostics.
+        Таблица диагностики решений (solver_diagnostics.SolverDiagnostics) или None.
+    - precision: int.
+        Количество знаков после запятой в командах .tsc или None для вывода чисел без 
+        изменения.
+    - outputs: tuple.
+        Форматы результатов (post_processor.POST_PROCESSORS): 'terminal', 'gcode', 'json', 
+        'csv', 'binary'.
+    - optimize: bool.
+        Удалить избыточные команды программ .tsc и G-code (program_optimizer).
+
+    Returns:
+    - int.
+        Количество обработанных отверстий.
+    '''
+    name = os.path.splitext(os.path.basename(json_path))[0]
+    paths = result_paths(result_dir, name)
+
+    header = read_header(json_path)
 
     # Длина эндоскопа.
-    e_len = coordinates['endoscope_length']
+    e_len = header['endoscope_length']
 
     # Высота стартовой плоскости относительно нулевой координаты. 
+    starting_height = header['starting_height']
+
+    tables = solve_hole_stream(iter_holes(json_path), e_len, starting_height, cache, 
+                               diagnostics=diagnostics)
+
+    if optimize_order:
+        tables = [order_part_table(HoleTable.concatenate(tables), starting_height, scheduler, name)]
+
+    # Постпроцессоры используют функции этого модуля.
+    from post_processor import open_post_processors, write_outputs
+
+    if binary and 'binary' not in outputs:
+        outputs = tuple(outputs) + ('binary',)
+
+    processors = open_post_processors(outputs, paths, header, precision=precision, planner=planner,
+                                      scheduler=scheduler, optimize=optimize)
+
+    count = write_outputs(tables, processors)
+
+    # Копия входных данных для инкрементального пересчета.
+    shutil.copyfile(json_path, paths['inputs'])
+
+    return count
+
+
+@timed('regenerate_part')
+def regenerate_part(json_path: str, result_dir: str = 'result', cache=None, binary: bool = False,
+                    planner=None, scheduler=None, diagnostics=None, precision: int = None,
+                    outputs: tuple = ('terminal', 'json'), optimize: bool = False,
+                    optimize_order: bool = False):
+    '''
+    Инкрементальный пересчет детали. Новый словарь holes сравнивается с копией входных 
+    данных предыдущего запуска: решаются только добавленные и измененные отверстия, решения 
+    остальных отверстий переносятся из существующего файла координат, удаленные отверстия 
+    исключаются. Все результаты записываются теми же постпроцессорами, что и в 
+    process_part, по таблице решений всех отверстий: блоки команд, паузы (planner) и 
+    калибровки (scheduler) формируются заново, поэтому результаты совпадают с полным 
+    расчетом с теми же параметрами. При отсутствии результатов предыдущего запуска или 
+    изменении endoscope_length/starting_height выполняется полный расчет process_part.
+
+    Parameters:
+    - json_path: str.
+        Путь до JSON файла с координатами отверстий.
+    - result_dir: str.
+        Папка с результатами предыдущего запуска.
+    - cache: SolutionCache.
+        Кэш решений (solution_cache.SolutionCache) или None.
+    - binary: bool.
+        Дополнительно записать таблицу отверстий и решений endoscope_coordinates_for_<name>.holetab.
+    - planner: DelayPlanner.
+        Планировщик пауз (delay_planner.DelayPlanner) или None для фиксированных пауз.
+    - scheduler: CalibrationScheduler.
+        Планировщик калибровок (calibration_scheduler.CalibrationScheduler) или None для 
+        исходного цикла.
+    - diagnostics: SolverDiagnostics.
+        Таблица диагностики решений или None.
+    - precision: int.
+        Количество знаков после запятой в командах или None.
+    - outputs: tuple.
+        Форматы результатов (см. process_part). Файлы .tsc и JSON координат, нужные 
+        следующему пересчету, записываются всегда.
+    - optimize: bool.
+        Удалить избыточные команды программ .tsc и G-code (program_optimizer).
+    - optimize_order: bool.
+        Переставить все отверстия в порядок с наименьшим оценочным временем цикла 
+        (hole_order), как при полном расчете.
+
+    Returns:
+    - int.
+        Количество обработанных отверстий.
+    '''
+    name = os.path.splitext(os.path.basename(json_path))[0]
+    paths = result_paths(result_dir, name)
+
+    if not all(os.path.exists(paths[key]) for key in ('tsc', 'coordinates', 'inputs')):
+        return process_part(json_path, result_dir, cache, binary, planner=planner, scheduler=scheduler,
+                            diagnostics=diagnostics, precision=precision, outputs=outputs,
+                            optimize=optimize, optimize_order=optimize_order)
+
+    with open(json_path) as f:
+        coordinates = json.load(f)
+
+    with open(paths['inputs']) as f:
+        previous = json.load(f)
+
+    e_len = coordinates['endoscope_length']
     starting_height = coordinates['starting_height']
 
-    points = {}
+    if e_len != previous['endoscope_length'] or starting_height != previous['starting_height']:
+        return process_part(json_path, result_dir, cache, binary, planner=planner, scheduler=scheduler,
+                            diagnostics=diagnostics, precision=precision, outputs=outputs,
+                            optimize=optimize, optimize_order=optimize_order)
 
-    # Счетчик измерений. 
-    n = 0
+    with open(paths['coordinates']) as f:
+        previous_points = json.load(f)
 
-    for point in coordinates['holes']:
+    holes = coordinates['holes']
+    point_numbers = [point.split('_')[-1] for point in holes]
 
-        # Номер точки.
-        *other, point_number = point.split('_')
-        
-        # Словари с координатами точек start и end. 
-        input_point = coordinates['holes'][f'{point}']['start']
-        output_point = coordinates['holes'][f'{point}']['end']
+    # Добавленные и измененные отверстия. 
+    changed = [i for i, (point, point_number) in enumerate(zip(holes, point_numbers))
+               if previous['holes'].get(point) != holes[point] 
+               or 'hole_' + point_number not in previous_points]
 
-        # Массивы с координатами точек start и end.
-        input = np.array(list(input_point.values()))
-        output = np.array(list(output_point.values()))
+    starts, stops = np.empty((0, 5)), np.empty((0, 3))
+    if changed:
+        inputs = np.array([list(holes[point]['start'].values()) for point in holes], 
+                          dtype=float).reshape(-1, 3)[changed]
+        ends = np.array([list(holes[point]['end'].values()) for point in holes], 
+                        dtype=float).reshape(-1, 3)[changed]
 
-        print(input)
-        print(output)
+        starts, stops = solve_holes(inputs, ends, e_len, starting_height, cache, diagnostics,
+                                    [point_numbers[i] for i in changed])
 
-        endoscope = Endoscope_Root(input, output, e_len)
-        
-        # Начальное расстояния от точки крепления эндоскопа до точек start и end.
-        d1 = endoscope.d
-        d2 = endoscope.d + endoscope.hole_depth
-        
-        # Координаты начального положения точки крепления эндоскопа и углы его наклона. 
-        start = [round(x,3) for x in endoscope.find_angles(d1, d2)]
-        print('Отверстие №' + point_number, '(начало)', start)
+    solved = dict(zip(changed, zip(np.round(starts, 3).tolist(), np.round(stops, 3).tolist())))
 
-        # Конечное расстояния от точки крепления эндоскопа до точек start и end.
-        d1 = endoscope.d - endoscope.hole_depth
-        d2 = endoscope.d
-        
-        # Координаты конечного положения точки крепления эндоскопа. 
-        stop = [round(x,3) for x in endoscope.find_point(d1, d2)]
-        print('Отверстие №' + point_number, '(конец)', stop)
-        print('..................................................')
+    solutions = []
 
-        gcode = GCodeMaker(start, stop, starting_height)
+    for i, point_number in enumerate(point_numbers):
 
-        # Запись файла gcode программы.
-        # gcode_commands = gcode.make_gcode(point_number)
+        if i in solved:
+            start, stop = solved[i]
+        else:
+            point = previous_points['hole_' + point_number]
+            start = [point['start'][key] for key in ('X', 'Y', 'Z', 'phi', 'psi')]
+            stop = [point['end'][key] for key in ('X', 'Y', 'Z')]
 
-        # with open(name + '.nc', 'a') as file:
-        #     for command in gcode_commands:
-        #         file.write(command + '\n')
-        #     file.write('M30')
+        solutions.append(start + stop)
 
-        # Запись файла с командами для терминала. 
-        terminal_commands = gcode.make_terminal_command(point_number)
+    # Таблица решений в порядке входного файла.
+    table = HoleTable.from_json(json_path)
+    if solutions:
+        solutions = np.array(solutions, dtype=float)
+        table.mount_start[:] = solutions[:, :3]
+        table.phi[:] = solutions[:, 3]
+        table.psi[:] = solutions[:, 4]
+        table.mount_stop[:] = solutions[:, 5:]
 
-        light_calibration = gcode.make_light_calibration()
+    if optimize_order:
+        table = order_part_table(table, starting_height, scheduler, name)
 
-        full_calibration = gcode.make_full_calibration()
+    # Постпроцессоры используют функции этого модуля.
+    from post_processor import open_post_processors, write_outputs
 
-        with open('result/commands_sequence_for_' + name + '.tsc', 'a') as file:
-            
-            # Калибровка по X Y Z в начале цикла.
-            if n == 0:
-                for command in full_calibration:
-                    file.write(command + '\n')
-            # Калибровка по X Y Z через каждые 10 измерений.
-            if n == 10:
-                for command in full_calibration:
-                    file.write(command + '\n')
-                n = 1
-            # Калибровка по Q W перед каждым измерением. 
-            for command in light_calibration:
-                file.write(command + '\n')
-            # Проход по отверстию
-            for command in terminal_commands:
-                file.write(command + '\n')
-        # Приращение счетчика. 
-        n += 1
-
-
-        # Запись координат в JSON файл.  
-        points['hole_' + point_number] = {}
-        # Координаты начала.
-        points['hole_' + point_number]['start'] = {
-            'X': start[0],
-            'Y': start[1],
-            'Z': start[2], 'phi': start[3], 'psi': start[4]}
-        # Координаты конца. 
-        points['hole_' + point_number]['end'] = {'X': stop[0], 'Y': stop[1], 'Z': stop[2]}
-
-    with open('result/endoscope_coordinates_for_' + name + '.json', 'w') as file:
-        json.dump(points, file, indent=4)    
-        
+    outputs = tuple(dict.fromkeys(('terminal', 'json') + tuple(outputs)
+                                  + (('binary',) if binary else ())))
+    header = {'endoscope_length': e_len, 'starting_height': starting_height}
+
+    processors = open_post_processors(outputs, paths, header, precision=precision, planner=planner,
+                                      scheduler=scheduler, optimize=optimize)
+
+    write_outputs([table], processors)
+
+    # Копия входных данных для следующего инкрементального пересчета.
+    shutil.copyfile(json_path, paths['inputs'])
+
+    return len(point_numbers)
+
+
+if __name__ == '__main__':
+
+    # Имя JSON файла с координатами отверстий.  сг
+    name = input('Введите название JSON файла с координатами: ')
+
+    process_part('src/json/' + name + '.json')
 
-        # Проверка. 
-        # cheker = SolutionsChecker(start_coordinates, end_coordinates, e_len) 
-        # cheker.get_start_coordinate()   
+    # Проверка единственности решений.
+    # for report in check_part_solutions('src/json/' + name + '.json'):
+    #     print(format_solutions_report(report))
@@ -1,16 +1,20 @@
 #hole_center.py
 
 import ursina
-import json
 import numpy as np
 
+from hole_table import HoleTable
+from mesh_batch import cylinder_batch, instance_mesh, sphere_template, split_instances
+
 '''Проверитиь под входной словарик'''
 
 class Hole_center():
     
-    def __init__(self, json_path:str=None, input_coordinate_dict:dict=None,) -> None:
+    def __init__(self, json_path:str=None, input_coordinate_dict:dict=None, hole_table:HoleTable=None, batched:bool=False,) -> None:
         self.json_path = json_path
         self.input_coordinate_dict = input_coordinate_dict     
+        self.hole_table = hole_table                        # Общая таблица отверстий (используется без копирования)
+        self.batched = batched                              # Объединять маркеры и соединения в несколько общих сеток
     
     
     # Распоковщик json файла
@@ -26,52 +30,33 @@ class Hole_center():
         }
         
         """
-        start_coordinates = []
-        end_coordinates   = []
+        # Таблица уже загружена и передана извне
+        if self.hole_table is not(None):
+            return
         
         if self.json_path is not(None):
             
-            #Считывание с json файла    
-            with open(self.json_path) as json_file:
-                coordinate_dict = json.load(json_file)
-        
-            #получение координат 
-            # Вид {start:[[start_coordinate_1],[start_coordinate_2]], end:[[end_coordinate_1],[end_coordinate_2]]}
-            
-            for key in coordinate_dict:
-                point_name = "hole_" + str(key.split("_")[1])
-                start_coordinates.append(coordinate_dict[point_name]['start'])
-                end_coordinates.append(coordinate_dict[point_name]['end'])
-
-            self.point_dict = {'start':start_coordinates, 'end':end_coordinates}
+            # Потоковое считывание json файла или отображение в память таблицы .holetab
+            self.hole_table = HoleTable.open(self.json_path)
         
         # В случае если подается не json а заготовленный словарь 
         elif self.input_coordinate_dict is not(None):
-            self.point_dict = self.input_coordinate_dict
+            self.hole_table = HoleTable.from_dict(self.input_coordinate_dict, poses=False)
     
     
     # Конвертор координат под формат Vec3 (так же записывает количество отверстий в self.hole_counter:int и self.pints_counter:int количество точек)
     def convertor_dict_coordinate_to_Vec3_coordinate(self,) -> dict:
         '''Необходим для предворительного конвртировния координат'''
         
-        vec_3_point_dict = {'start':[], 'end':[]}
-        point_dict = self.point_dict
-        for index_hole in range(len(point_dict['start'])):
-            
-            start_point_coordinate = ursina.Vec3((float(point_dict['start'][index_hole]['X']), # получение начальной координаты по оси X
-                                                  float(point_dict['start'][index_hole]['Y']), # получение начальной координаты по оси Y
-                                                  float(point_dict['start'][index_hole]['Z']))) # получение начальной координаты по оси Z)
-            
-            end_point_coordinate  =  ursina.Vec3((float(point_dict['end'][index_hole]['X']),   # получение конечной координаты по оси X
-                                                  float(point_dict['end'][index_hole]['Y']),   # получение конечной координаты по оси Y
-                                                  float(point_dict['end'][index_hole]['Z'])))   # получение конечной координаты по оси Z
-
-            vec_3_point_dict['start'].append(start_point_coordinate)
-            vec_3_point_dict['end'].append(end_point_coordinate)
+        table = self.hole_table
+        
+        # Vec3 создаются напрямую из столбцов таблицы
+        vec_3_point_dict = {'start':[ursina.Vec3(*point) for point in table.start.tolist()],
+                            'end':  [ursina.Vec3(*point) for point in table.end.tolist()]}
         
         self.vec_3_point_dict = vec_3_point_dict
-        self.hole_counter = len(point_dict['start'])
-        self.pints_counter = len(point_dict['start']) * 2 # так как у отверстия есть вход и выход
+        self.hole_counter = len(table)
+        self.pints_counter = len(table) * 2 # так как у отверстия есть вход и выход
  
  
     # Генерация списка созданных обьектов
@@ -112,6 +97,9 @@ class Hole_center():
         # Получение количества отверситий
         hole_counter = self.hole_counter
         
+        # Направления цилиндров (координаты конца - координаты начала) для всех отверстий
+        turn_coordinates = self.hole_table.end - self.hole_table.start
+        
         # Список Entity Cylinder выполняющие роль соединений
         connection_list = []
 
@@ -119,7 +107,7 @@ class Hole_center():
         for index_hole in range(hole_counter):
             
             # Получение координаты повнаправление цилиндра (координаты конца - координаты начала)
-            turn_coordinate =  np.subtract(np.array(point_dict['end'][index_hole]), np.array(point_dict['start'][index_hole]))
+            turn_coordinate = turn_coordinates[index_hole]
             
             # Создание обьекта Цилиндр по заданными параметрам
             connection = ursina.Entity(model=ursina.Cylinder(resolution=6,                              # Количество граней
@@ -138,6 +126,58 @@ class Hole_center():
         return connection_list
        
         
+    # Генерация объединенных сеток маркеров (несколько Entity на все отверстия)
+    def generate_batched_point_group(self, max_vertices:int=65535,) -> dict:
+        
+        table = self.hole_table
+        
+        # Сетка-шаблон маркера (аналог модели 'sphere' с масштабом 1)
+        vertices, triangles = sphere_template()
+        
+        # Словарь Entity где ключ start входные отверстия а end выходные
+        object_dict = {'start':[], 'end':[]}
+        
+        for key, points, color in (('start', table.start, ursina.color.green),
+                                   ('end',   table.end,   ursina.color.red)):
+            
+            for part in split_instances(len(table), len(vertices), max_vertices):
+                
+                part_vertices, part_triangles = instance_mesh(vertices, triangles, points[part])
+                
+                object_dict[key].append(ursina.Entity(model=ursina.Mesh(vertices=part_vertices.tolist(),    # Вершины всех маркеров группы
+                                                                        triangles=part_triangles.tolist()), # Треугольники всех маркеров группы
+                                                      color=color))                                         # Цвет обьекта
+        
+        self.object_point_dict = object_dict
+        
+        return object_dict
+    
+    
+    # Создает связи между точками одной объединенной сеткой цилиндров
+    def generate_batched_connections(self, color_connection:ursina.color.Color=ursina.color.pink, max_vertices:int=65535,) -> list:
+        
+        table = self.hole_table
+        
+        # Количество вершин одного цилиндра: два кольца по 6 вершин и центры торцов
+        resolution = 6
+        vertices_per_cylinder = 2 * resolution + 2
+        
+        # Список Entity выполняющие роль соединений
+        connection_list = []
+        
+        for part in split_instances(len(table), vertices_per_cylinder, max_vertices):
+            
+            vertices, triangles = cylinder_batch(table.start[part], table.end[part], resolution=resolution)
+            
+            connection_list.append(ursina.Entity(model=ursina.Mesh(vertices=vertices.tolist(),    # Вершины всех цилиндров группы
+                                                                   triangles=triangles.tolist()), # Треугольники всех цилиндров группы
+                                                 color=color_connection))                         # Цвет соединения 
+        
+        self.connection_list = connection_list
+        
+        return connection_list
+       
+        
     # Основной метод запуска скрипта          
     def main(self,):
         
@@ -147,18 +187,27 @@ class Hole_center():
         # распаковываем json
         self.unpucking_json() 
 
-        # Конвертация координат под формат ursina.Vec3
-        self.convertor_dict_coordinate_to_Vec3_coordinate()
-        
-        #создаем список Entity точек центров отверстий 
-        entity_point_group = self.generate_entity_point_group()
+        if self.batched:
+            
+            #создаем объединенные сетки точек центров отверстий и соединений
+            entity_point_group = self.generate_batched_point_group()
+            connections_points = self.generate_batched_connections()
+            
+        else:
+            
+            # Конвертация координат под формат ursina.Vec3
+            self.convertor_dict_coordinate_to_Vec3_coordinate()
+            
+            #создаем список Entity точек центров отверстий 
+            entity_point_group = self.generate_entity_point_group()
+            
+            #создаем список Entity цилиндров выполняюших роль соединения центров отверстий (соединяет start и end)  
+            connections_points = self.generate_connections_with_points()
         
-        #создаем список Entity цилиндров выполняюших роль соединения центров отверстий (соединяет start и end)  
-        connections_points = self.generate_connections_with_points()
+        self.hole_counter = len(self.hole_table)
         
         #Заполнение списка обьектов
         object_list.append(entity_point_group)
         object_list.append(connections_points)
         
         return object_list
-        
\ No newline at end of file
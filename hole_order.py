@@ -0,0 +1,488 @@
+#hole_order.py
+
+'''
+Оптимизация порядка обхода отверстий. Время обработки отверстия оценивается по командам
+GCodeMaker.make_terminal_command: подъем Z на starting_height, поворот Q линзой вниз,
+поворот W на phi и Q на psi, перемещение X Y со скоростью F200 и опускание Z, плюс
+фиксированные паузы. Время перехода зависит от положения, в котором станок остался после
+предыдущего отверстия, либо от нулевого положения после калибровки (команда G10).
+
+Калибровки расставляются планировщиком (calibration_scheduler.CalibrationScheduler) и
+возвращают станок в нулевое положение, поэтому отверстия делятся на группы между
+калибровками. Для условий по количеству отверстий расстановка не зависит от порядка и
+вычисляется заранее; порядок для условий по перемещениям и времени не оптимизируется.
+
+Порядок строится эвристикой ближайшего соседа и улучшается алгоритмами 2-opt и Or-opt,
+после чего разбивается на группы между калибровками, и порядок внутри каждой группы
+улучшается отдельно с учетом старта из нулевого положения. При калибровке перед каждым
+отверстием время не зависит от порядка и порядок не изменяется.
+
+Оценка HoleCostModel приблизительна, поэтому найденный порядок принимается, только если
+моделирование программы (cycle_time.simulate_terminal) подтверждает сокращение времени.
+'''
+
+import re
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+from calibration_scheduler import CalibrationScheduler, schedule_program
+from cycle_time import simulate_terminal
+from endoscope_motion import FULL_CALIBRATION, LIGHT_CALIBRATION, render_hole_blocks
+from machine_model import MachineModel
+
+
+# Угол Q поворота эндоскопа линзой вниз перед наведением (make_terminal_command).
+LENS_DOWN_ANGLE = -91.0
+
+# Подачи команд make_terminal_command: X Y - F200, остальные перемещения - F2000.
+TRAVERSE_FEED = 200.0
+AXIS_FEED = 2000.0
+
+# Паузы блока отверстия в секундах (make_terminal_command).
+HOLE_DELAYS = (3.0, 3.0, 3.0, 5.0)
+
+# Команды калибровок по видам планировщика.
+CALIBRATIONS = {'full': FULL_CALIBRATION, 'light': LIGHT_CALIBRATION}
+
+
+def commands_delay(commands) -> float:
+    '''
+    Суммарная длительность пауз Delay(...) последовательности команд в секундах.
+    '''
+    return sum(int(ms) for command in commands for ms in re.findall(r'Delay\((\d+)\)', command)) / 1000
+
+
+def calibration_plan(count: int, scheduler: CalibrationScheduler = None) -> list:
+    '''
+    Калибровки перед каждой позицией порядка обхода по планировщику. Расстановка
+    вычисляется только для условий по количеству отверстий: условия по перемещениям и
+    времени зависят от порядка.
+
+    Parameters:
+    - count: int.
+        Количество отверстий.
+    - scheduler: CalibrationScheduler.
+        Планировщик калибровок (по умолчанию - исходный цикл write_command_sequence).
+
+    Returns:
+    - list.
+        Виды калибровок ('full', 'light') перед каждой позицией.
+    '''
+    if scheduler is None:
+        scheduler = CalibrationScheduler()
+
+    if scheduler.uses_motion:
+        raise ValueError(f'Калибровки {scheduler!r} зависят от перемещений, '
+                         f'порядок обхода не оптимизируется')
+
+    scheduler.reset()
+    plan = []
+
+    for _ in range(count):
+        kinds = scheduler.due()
+        for kind in kinds:
+            scheduler.record(kind, '')
+        scheduler.record('hole', '')
+        plan.append(kinds)
+
+    scheduler.reset()
+
+    return plan
+
+
+def calibration_blocks(plan: list) -> list:
+    '''
+    Группы позиций между калибровками плана calibration_plan.
+
+    Returns:
+    - list.
+        Срезы (slice) позиций в порядке обхода.
+    '''
+    begins = [position for position, kinds in enumerate(plan) if kinds or position == 0]
+
+    return [slice(begin, end) for begin, end in zip(begins, begins[1:] + [len(plan)])]
+
+
+class HoleCostModel():
+    '''
+    Оценка времени обработки отверстий в заданном порядке.
+    '''
+    def __init__(self, starts: np.ndarray, starting_height: float, model: MachineModel = None,
+                 scheduler: CalibrationScheduler = None):
+        '''
+        Parameters:
+        - starts: np.ndarray.
+            Массив N x 5 [x, y, z, phi, psi] начальных положений эндоскопа.
+        - starting_height: float.
+            Высота стартовой плоскости.
+        - model: MachineModel.
+            Модель осей станка (по умолчанию MachineModel()).
+        - scheduler: CalibrationScheduler.
+            Планировщик калибровок с условиями по количеству отверстий (calibration_plan).
+        '''
+        self.starts = np.asarray(starts, dtype=float).reshape(-1, 5)
+        self.starting_height = starting_height
+        self.model = model or MachineModel()
+
+        self.plan = calibration_plan(len(self.starts), scheduler)
+        self.blocks = calibration_blocks(self.plan)
+
+        self.x, self.y, self.z, self.phi, self.psi = self.starts.T
+
+    def transition_time(self, previous: np.ndarray, holes: np.ndarray) -> np.ndarray:
+        '''
+        Время блока команд отверстий holes после отверстий previous (индекс -1 - нулевое
+        положение после калибровки), включая паузы.
+        '''
+        model = self.model
+        zero = previous < 0
+        prev = np.where(zero, 0, previous)
+
+        x0, y0 = np.where(zero, 0, self.x[prev]), np.where(zero, 0, self.y[prev])
+        z0 = np.where(zero, 0, self.z[prev])
+        q0, w0 = np.where(zero, 0, self.psi[prev]), np.where(zero, 0, self.phi[prev])
+
+        x, y, z = self.x[holes], self.y[holes], self.z[holes]
+
+        return (model.axis_time('Z', self.starting_height - z0, AXIS_FEED) +
+                model.axis_time('Q', LENS_DOWN_ANGLE - q0, AXIS_FEED) +
+                model.axis_time('W', self.phi[holes] - w0, AXIS_FEED) +
+                model.axis_time('Q', self.psi[holes] - LENS_DOWN_ANGLE, AXIS_FEED) +
+                model.path_time(np.hypot(x - x0, y - y0), TRAVERSE_FEED) +
+                model.axis_time('Z', z - self.starting_height, AXIS_FEED) +
+                sum(HOLE_DELAYS))
+
+    @property
+    def order_independent(self) -> bool:
+        '''
+        Калибровка перед каждым отверстием: время не зависит от порядка.
+        '''
+        return all(self.plan)
+
+    def previous_holes(self, order: np.ndarray) -> np.ndarray:
+        '''
+        Отверстие, после которого выполняется каждое отверстие порядка order (-1 - после
+        калибровки).
+        '''
+        previous = np.empty(len(order), dtype=np.int64)
+        previous[1:] = order[:-1]
+        for block in self.blocks:
+            previous[block.start] = -1
+
+        return previous
+
+    def sequence_time(self, order: np.ndarray = None) -> dict:
+        '''
+        Оценка времени цикла для порядка order (по умолчанию - исходный порядок). Движения
+        и паузы считаются последовательными.
+
+        Returns:
+        - dict.
+            {'holes': время блоков отверстий, 'calibration': время калибровок,
+            'total': общее время} в секундах.
+        '''
+        order = np.arange(len(self.starts)) if order is None else np.asarray(order)
+        if len(order) == 0:
+            return {'holes': 0.0, 'calibration': 0.0, 'total': 0.0}
+
+        holes = float(self.transition_time(self.previous_holes(order), order).sum())
+
+        calibration = sum(commands_delay(CALIBRATIONS[kind]) for kinds in self.plan for kind in kinds)
+
+        # Возврат в X0 Y0 Z0 перед калибровкой по Q W (после калибровки по X Y Z - на месте).
+        returns = [position for position, kinds in enumerate(self.plan) if position and kinds == ['light']]
+        if returns:
+            distance = np.linalg.norm(self.starts[order[np.array(returns) - 1], :3], axis=1)
+            calibration += float(self.model.path_time(distance, axes='XYZ').sum())
+
+        return {'holes': holes, 'calibration': calibration, 'total': holes + calibration}
+
+    def pair_time(self, a: int, b: int) -> float:
+        '''
+        Зависящая от пары часть времени перехода a -> b (перемещение X Y и поворот W).
+        Индекс -1 - нулевое положение.
+        '''
+        if a < 0:
+            x0 = y0 = w0 = 0.0
+        else:
+            x0, y0, w0 = self.xy_w[a]
+        x1, y1, w1 = self.xy_w[b]
+
+        return (self.model.path_time(((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5, TRAVERSE_FEED) +
+                self.model.axis_time('W', w1 - w0, AXIS_FEED))
+
+    def pair_times(self, a: int, holes: np.ndarray) -> np.ndarray:
+        '''
+        Векторный вариант pair_time для переходов из a во все отверстия holes.
+        '''
+        x0, y0, w0 = (0.0, 0.0, 0.0) if a < 0 else (self.x[a], self.y[a], self.phi[a])
+
+        return (self.model.path_time(np.hypot(self.x[holes] - x0, self.y[holes] - y0), TRAVERSE_FEED) +
+                self.model.axis_time('W', self.phi[holes] - w0, AXIS_FEED))
+
+    @property
+    def xy_w(self) -> list:
+
+        if not hasattr(self, '_xy_w'):
+            self._xy_w = np.column_stack([self.x, self.y, self.phi]).tolist()
+
+        return self._xy_w
+
+
+def nearest_neighbour_path(cost: HoleCostModel, nodes: np.ndarray, neighbours: int = 16) -> list:
+    '''
+    Путь ближайшего соседа по отверстиям nodes из нулевого положения. Кандидаты выбираются
+    по k-d дереву в координатах времени перемещения (x, y, w), при отсутствии непосещенных
+    кандидатов просматриваются все оставшиеся отверстия.
+    '''
+    if len(nodes) == 0:
+        return []
+
+    traverse = TRAVERSE_FEED / 60
+    rotation = AXIS_FEED / 60
+    points = np.column_stack([cost.x[nodes] / traverse, cost.y[nodes] / traverse,
+                              cost.phi[nodes] / rotation])
+    tree = cKDTree(points)
+
+    unvisited = np.ones(len(nodes), dtype=bool)
+    path = []
+    current = -1
+    position = np.zeros(3)
+
+    for _ in range(len(nodes)):
+        k = min(neighbours, len(nodes))
+        _, candidates = tree.query(position, k=k)
+        candidates = np.atleast_1d(candidates)
+        candidates = candidates[unvisited[candidates]]
+
+        if len(candidates) == 0:
+            candidates = np.flatnonzero(unvisited)
+
+        best = int(candidates[int(np.argmin(cost.pair_times(current, nodes[candidates])))])
+
+        unvisited[best] = False
+        path.append(int(nodes[best]))
+        current = int(nodes[best])
+        position = points[best]
+
+    return path
+
+
+def improve_path(cost: HoleCostModel, path: list, neighbours: dict = None,
+                 max_passes: int = None) -> list:
+    '''
+    Улучшение открытого пути из нулевого положения алгоритмами 2-opt и Or-opt (перенос
+    участков из 1-3 отверстий) по зависящей от пары части времени перехода.
+
+    Parameters:
+    - cost: HoleCostModel.
+        Модель времени.
+    - path: list.
+        Порядок отверстий.
+    - neighbours: dict.
+        Списки соседей {отверстие: [отверстия]} для ограничения перебора (по умолчанию -
+        все отверстия пути).
+    - max_passes: int.
+        Наибольшее количество проходов 2-opt и Or-opt (None - до отсутствия улучшений).
+        Ограничение по проходам, а не по времени, дает одинаковый результат при каждом
+        запуске.
+
+    Returns:
+    - list.
+        Улучшенный порядок.
+    '''
+    route = [-1] + list(path)
+    d = cost.pair_time
+
+    def out_time(i):
+        return d(route[i], route[i + 1]) if i + 1 < len(route) else 0.0
+
+    improved = True
+    passes = 0
+    while improved and (max_passes is None or passes < max_passes):
+        improved = False
+        passes += 1
+
+        # 2-opt: разворот участка route[i + 1 .. j].
+        position = {node: i for i, node in enumerate(route)}
+        for i in range(len(route) - 1):
+            a, b = route[i], route[i + 1]
+            candidates = neighbours.get(a, ()) if neighbours is not None else route[i + 2:]
+            for c in candidates:
+                j = position.get(c, -1)
+                if j <= i + 1:
+                    continue
+                delta = d(a, c) - d(a, b) - out_time(j)
+                if j + 1 < len(route):
+                    delta += d(b, route[j + 1])
+                if delta < -1e-9:
+                    route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+                    position.update({node: k for k, node in enumerate(route[i + 1:j + 1], i + 1)})
+                    a, b = route[i], route[i + 1]
+                    improved = True
+
+        # Or-opt: перенос участка route[i .. i + length - 1] в другое место пути.
+        for length in (1, 2, 3):
+            position = {node: k for k, node in enumerate(route)}
+            i = 1
+            while i + length <= len(route):
+                segment = route[i:i + length]
+                before = route[i - 1]
+                after = route[i + length] if i + length < len(route) else None
+
+                removed = d(before, segment[0]) + (d(segment[-1], after) if after is not None else 0.0)
+                removed -= d(before, after) if after is not None else 0.0
+
+                best, best_gain, best_reverse = None, 1e-9, False
+
+                candidates = (neighbours.get(segment[0], ()) if neighbours is not None
+                              else route[:i] + route[i + length:])
+                for c in candidates:
+                    if c in segment:
+                        continue
+                    # Позиция c и следующий за ним узел в пути без участка.
+                    j = position[c]
+                    k = j if j < i else j - length
+                    e = after if j + 1 == i else (route[j + 1] if j + 1 < len(route) else None)
+                    for reverse in (False, True):
+                        first, last = (segment[-1], segment[0]) if reverse else (segment[0], segment[-1])
+                        added = d(c, first) + (d(last, e) - d(c, e) if e is not None else 0.0)
+                        if removed - added > best_gain:
+                            best, best_gain, best_reverse = k, removed - added, reverse
+
+                if best is not None:
+                    moved = segment[::-1] if best_reverse else segment
+                    rest = route[:i] + route[i + length:]
+                    route = rest[:best + 1] + moved + rest[best + 1:]
+                    # Позиции изменились только между старым и новым местом участка.
+                    low, high = min(i, best + 1), max(i, best + 1) + length
+                    position.update({node: k for k, node in enumerate(route[low:high], low)})
+                    improved = True
+                else:
+                    i += 1
+
+    return route[1:]
+
+
+def neighbour_lists(cost: HoleCostModel, nodes: np.ndarray, count: int = 8) -> dict:
+    '''
+    Ближайшие соседи каждого отверстия (и нулевого положения) в координатах времени
+    перемещения.
+    '''
+    traverse = TRAVERSE_FEED / 60
+    rotation = AXIS_FEED / 60
+    points = np.column_stack([cost.x[nodes] / traverse, cost.y[nodes] / traverse,
+                              cost.phi[nodes] / rotation])
+    k = min(count + 1, len(nodes))
+    _, found = cKDTree(points).query(np.vstack([np.zeros(3), points]), k=k)
+    found = np.asarray(nodes)[np.asarray(found).reshape(len(points) + 1, -1)].tolist()
+
+    keys = [-1] + list(nodes)
+
+    return {key: [node for node in near if node != key] for key, near in zip(keys, found)}
+
+
+def optimize_order(starts: np.ndarray, starting_height: float, model: MachineModel = None,
+                   scheduler: CalibrationScheduler = None, max_passes: int = 20) -> np.ndarray:
+    '''
+    Поиск порядка обхода отверстий с наименьшим оценочным временем цикла.
+
+    Parameters:
+    - starts: np.ndarray.
+        Массив N x 5 [x, y, z, phi, psi] начальных положений эндоскопа.
+    - starting_height: float.
+        Высота стартовой плоскости.
+    - model: MachineModel.
+        Модель осей станка.
+    - scheduler: CalibrationScheduler.
+        Планировщик калибровок с условиями по количеству отверстий (calibration_plan).
+    - max_passes: int.
+        Наибольшее количество проходов улучшения каждого пути (improve_path).
+
+    Returns:
+    - np.ndarray.
+        Перестановка индексов отверстий.
+    '''
+    cost = HoleCostModel(starts, starting_height, model, scheduler)
+    count = len(cost.starts)
+
+    # Каждое отверстие начинается из нулевого положения: порядок не влияет на время.
+    if cost.order_independent or count < 2:
+        return np.arange(count)
+
+    nodes = np.arange(count)
+
+    # Общий путь по всем отверстиям определяет состав групп между калибровками.
+    path = nearest_neighbour_path(cost, nodes)
+    path = improve_path(cost, path, neighbour_lists(cost, nodes), max_passes)
+
+    # Улучшение порядка внутри групп: каждая группа начинается из нулевого положения.
+    order = []
+    for block in cost.blocks:
+        group = np.array(path[block])
+        order.extend(improve_path(cost, path[block], neighbour_lists(cost, group), max_passes))
+
+    order = np.array(order)
+
+    # Эвристика не должна ухудшать исходный порядок.
+    if cost.sequence_time(order)['total'] >= cost.sequence_time()['total']:
+        return np.arange(count)
+
+    return order
+
+
+def format_order_report(before: dict, after: dict) -> str:
+    '''
+    Сравнение времени цикла до и после оптимизации порядка.
+    '''
+    saved = before['total'] - after['total']
+    share = saved / before['total'] * 100 if before['total'] else 0.0
+
+    return (f"Время цикла по моделированию программы: до {before['total']:.1f} с, "
+            f"после {after['total']:.1f} с, экономия {saved:.1f} с ({share:.1f} %)")
+
+
+def simulate_order(point_numbers: list, starts: np.ndarray, stops: np.ndarray, order: np.ndarray,
+                   starting_height: float, model: MachineModel = None,
+                   scheduler: CalibrationScheduler = None) -> dict:
+    '''
+    Моделирование программы для терминала (cycle_time.simulate_terminal) с отверстиями в
+    порядке order и калибровками по планировщику, без планирования пауз.
+    '''
+    blocks = render_hole_blocks([point_numbers[i] for i in order], starts[order], stops[order],
+                                starting_height)
+    program = schedule_program(blocks, scheduler if scheduler is not None else CalibrationScheduler())
+
+    return simulate_terminal(''.join(program).splitlines(), model)
+
+
+def order_hole_table(table, starting_height: float, model: MachineModel = None,
+                     scheduler: CalibrationScheduler = None, max_passes: int = 20) -> tuple:
+    '''
+    Перестановка решенной таблицы отверстий (hole_table.HoleTable) в оптимальный порядок.
+    Порядок ищется по положениям, округленным до 3 знаков, как в программе: полный и
+    инкрементальный (по сохраненным координатам) расчет дают одинаковый порядок. Порядок
+    принимается, только если моделирование программы подтверждает сокращение времени.
+
+    Returns:
+    - tuple.
+        Таблица (переставленная или исходная) и результаты моделирования программы до и
+        после (simulate_order).
+    '''
+    starts = np.round(np.column_stack([table.mount_start, table.phi, table.psi]), 3)
+    stops = np.round(table.mount_stop, 3)
+    identity = np.arange(len(starts))
+
+    order = optimize_order(starts, starting_height, model, scheduler, max_passes)
+    before = simulate_order(table.point_numbers, starts, stops, identity, starting_height, model, scheduler)
+
+    if np.array_equal(order, identity):
+        return table, before, before
+
+    after = simulate_order(table.point_numbers, starts, stops, order, starting_height, model, scheduler)
+    if after['total'] >= before['total']:
+        return table, before, before
+
+    return table[order], before, after
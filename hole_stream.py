@@ -0,0 +1,232 @@
+#hole_stream.py
+
+'''
+Потоковое чтение JSON файлов с отверстиями. Файл читается блоками, отверстия выдаются
+по одному в виде компактных записей HoleRecord, поэтому расход памяти не зависит от
+количества отверстий в файле.
+
+Поддерживаются оба формата:
+- входные данные: {"endoscope_length": .., "starting_height": .., "holes": {"hole_1": {"start": {..}, "end": {..}}}}
+- результаты: {"hole_1": {"start": {"X", "Y", "Z", "phi", "psi"}, "end": {"X", "Y", "Z"}}}
+'''
+
+import json
+
+from collections import namedtuple
+
+
+# Компактная запись отверстия. start/end - кортежи (X, Y, Z), phi/psi - углы наклона
+# эндоскопа (None для входных данных).
+HoleRecord = namedtuple('HoleRecord', ['name', 'start', 'end', 'phi', 'psi'])
+
+_WHITESPACE = ' \t\n\r'
+
+# Символы, которыми может завершаться число или литерал true/false/null.
+_DELIMITERS = _WHITESPACE + ',:]}'
+
+
+class JsonStream():
+    '''
+    Инкрементальный разбор JSON объекта из файла. Ключи объекта выдаются генератором
+    iter_object, значение каждого ключа вызывающий код обязан прочитать методом
+    read_value, пропустить методом skip_value или разобрать вложенным iter_object.
+    '''
+    def __init__(self, file, chunk_size: int = 1 << 16):
+        '''
+        Parameters:
+        - file: file object.
+            Текстовый файл, открытый на чтение.
+        - chunk_size: int.
+            Размер блока чтения в символах.
+        '''
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        '''
+        Дочитывает очередной блок файла. Прочитанная часть буфера отбрасывается.
+
+        Returns:
+        - bool.
+            False, если файл закончился.
+        '''
+        if self.eof:
+            return False
+
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+        return True
+
+    def peek(self) -> str:
+        '''
+        Первый значащий символ после пробелов (пустая строка в конце файла).
+        '''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+
+        if self.peek() != char:
+            raise ValueError(f'Ожидался символ {char!r} в позиции JSON потока, '
+                             f'получен {self.peek()!r}')
+        self.pos += 1
+
+    def read_value(self):
+        '''
+        Чтение очередного значения целиком. Значение дочитывается, пока не будет
+        разобрано полностью: число на границе блока может быть не завершено ("12." + "5"),
+        поэтому число или литерал принимается только перед разделителем или в конце файла.
+        '''
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+
+            scalar = self.buffer[self.pos] not in '"{['
+            if end == len(self.buffer) or scalar and self.buffer[end] not in _DELIMITERS:
+                if self.fill():
+                    continue
+
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        '''
+        Пропуск значения. Вложенные объекты пропускаются поэлементно, без загрузки в память.
+        '''
+        if self.peek() == '{':
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_object(self):
+        '''
+        Генератор ключей объекта. После каждого ключа поток находится перед значением.
+        '''
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            self.expect(':')
+
+            yield key
+
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+
+def _point(point: dict) -> tuple:
+
+    return (float(point['X']), float(point['Y']), float(point['Z']))
+
+
+def _record(name: str, hole: dict) -> HoleRecord:
+
+    start = hole['start']
+
+    return HoleRecord(name, _point(start), _point(hole['end']), start.get('phi'), start.get('psi'))
+
+
+def iter_holes(path: str, chunk_size: int = 1 << 16):
+    '''
+    Генератор отверстий JSON файла в порядке следования в файле.
+
+    Parameters:
+    - path: str.
+        Путь до JSON файла во входном формате или формате результатов.
+    - chunk_size: int.
+        Размер блока чтения в символах.
+
+    Yields:
+    - HoleRecord.
+    '''
+    with open(path) as file:
+        stream = JsonStream(file, chunk_size)
+
+        for key in stream.iter_object():
+            if key == 'holes':
+                for name in stream.iter_object():
+                    yield _record(name, stream.read_value())
+            elif stream.peek() == '{':
+                yield _record(key, stream.read_value())
+            else:
+                stream.skip_value()
+
+
+def read_header(path: str, keys: tuple = ('endoscope_length', 'starting_height')) -> dict:
+    '''
+    Чтение скалярных параметров верхнего уровня без загрузки отверстий. Чтение
+    останавливается, как только найдены все ключи keys.
+
+    Returns:
+    - dict.
+        Найденные параметры.
+    '''
+    header = {}
+
+    with open(path) as file:
+        stream = JsonStream(file)
+
+        for key in stream.iter_object():
+            if key in keys:
+                header[key] = stream.read_value()
+                if len(header) == len(keys):
+                    break
+            else:
+                stream.skip_value()
+
+    return header
+
+
+class JsonObjectWriter():
+    '''
+    Потоковая запись JSON объекта по одному ключу. Результат совпадает с
+    json.dump(obj, file, indent=indent). Для объекта, вложенного в другой объект на 
+    глубине level, отступы увеличиваются так же, как в json.dump внешнего объекта.
+    '''
+    def __init__(self, file, indent: int = 4, level: int = 0):
+
+        self.file = file
+        self.indent = indent
+        self.level = level
+        self.count = 0
+
+    def write_member(self, key: str, value):
+
+        prefix = '{\n' if self.count == 0 else ',\n'
+        pad = ' ' * self.indent * (self.level + 1)
+        text = json.dumps(value, indent=self.indent).replace('\n', '\n' + pad)
+
+        self.file.write(f'{prefix}{pad}{json.dumps(key)}: {text}')
+        self.count += 1
+
+    def close(self):
+
+        self.file.write('{}' if self.count == 0 else '\n' + ' ' * self.indent * self.level + '}')
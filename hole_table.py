@@ -0,0 +1,470 @@
+#hole_table.py
+
+'''
+Колоночная таблица отверстий на основе структурированного массива NumPy. Одна таблица
+хранит координаты отверстий, положения эндоскопа и углы наклона и передается решателю
+(endoscope_motion), визуализации отверстий (Hole_center) и эндоскопа (Endoscope) без
+копирования: столбцы таблицы - представления (views) одного массива.
+'''
+
+import json
+
+import numpy as np
+
+from hole_stream import HoleRecord, JsonObjectWriter, iter_holes, read_header
+
+
+# Двоичный формат таблицы (.holetab):
+# - 8 байт сигнатуры MAGIC;
+# - uint32 версия формата, uint32 длина заголовка и uint64 количество записей (little-endian);
+# - заголовок JSON: {'dtype', 'meta'}, дополненный пробелами так, чтобы записи начинались
+#   со смещения, кратного 64 байтам;
+# - count записей HoleTable.dtype фиксированной длины.
+MAGIC = b'HOLETAB\0'
+FORMAT_VERSION = 1
+BINARY_SUFFIX = '.holetab'
+_ALIGNMENT = 64
+_PREFIX = np.dtype([('version', '<u4'), ('header_length', '<u4'), ('count', '<u8')])
+
+# Параметры детали, сохраняемые в метаданных .holetab и заголовке входного JSON файла.
+PART_KEYS = ('endoscope_length', 'starting_height')
+
+
+class HoleTable():
+    '''
+    Таблица отверстий. Одна запись (144 байта) на отверстие:
+    - name: имя отверстия ('hole_1') в кодировке UTF-8, не длиннее 32 байт.
+    - start, end: координаты [x, y, z] входного и выходного отверстия.
+    - mount_start, mount_stop: координаты [x, y, z] начального и конечного положения
+    точки крепления эндоскопа.
+    - phi, psi: углы наклона эндоскопа в градусах.
+
+    Незаполненные столбцы содержат NaN.
+    '''
+    dtype = np.dtype([('name', 'S32'),
+                      ('start', 'f8', (3,)),
+                      ('end', 'f8', (3,)),
+                      ('mount_start', 'f8', (3,)),
+                      ('mount_stop', 'f8', (3,)),
+                      ('phi', 'f8'),
+                      ('psi', 'f8')])
+
+    def __init__(self, data: np.ndarray = None, size: int = 0):
+        '''
+        Parameters:
+        - data: np.ndarray.
+            Структурированный массив с dtype HoleTable.dtype. Используется без копирования.
+        - size: int.
+            Количество записей новой таблицы, если data не задан.
+        '''
+        if data is None:
+            data = np.zeros(size, dtype=self.dtype)
+            for column in ('start', 'end', 'mount_start', 'mount_stop', 'phi', 'psi'):
+                data[column] = np.nan
+
+        self.data = data
+        self.meta = {}
+
+    @classmethod
+    def from_records(cls, records, poses: bool = None):
+        '''
+        Таблица из записей hole_stream.HoleRecord. Записи с углами phi/psi (формат
+        результатов) заполняют столбцы положений эндоскопа, остальные - столбцы отверстий.
+
+        Parameters:
+        - records: iterable.
+            Записи HoleRecord.
+        - poses: bool.
+            Принудительно считать записи положениями эндоскопа (True) или отверстиями
+            (False). По умолчанию определяется по наличию phi.
+        '''
+        records = list(records)
+        table = cls(size=len(records))
+        data = table.data
+
+        if not records:
+            return table
+
+        data['name'] = encode_names(record.name for record in records)
+
+        if poses is None:
+            poses = records[0].phi is not None
+
+        if poses:
+            data['mount_start'] = [record.start for record in records]
+            data['mount_stop'] = [record.end for record in records]
+            data['phi'] = [np.nan if record.phi is None else record.phi for record in records]
+            data['psi'] = [np.nan if record.psi is None else record.psi for record in records]
+        else:
+            data['start'] = [record.start for record in records]
+            data['end'] = [record.end for record in records]
+
+        return table
+
+    @classmethod
+    def iter_chunks(cls, records, size: int = 10000):
+        '''
+        Группировка потока записей HoleRecord в таблицы по size отверстий.
+        '''
+        chunk = []
+
+        for record in records:
+            chunk.append(record)
+
+            if len(chunk) == size:
+                yield cls.from_records(chunk)
+                chunk = []
+
+        if chunk:
+            yield cls.from_records(chunk)
+
+    @classmethod
+    def from_json(cls, path: str, poses_path: str = None, chunk_size: int = 100000):
+        '''
+        Потоковая загрузка таблицы из JSON файла (входной формат или формат результатов).
+
+        Parameters:
+        - path: str.
+            Путь до JSON файла с отверстиями.
+        - poses_path: str.
+            Путь до JSON файла с положениями эндоскопа (формат результатов). Положения
+            присоединяются к отверстиям по имени.
+        - chunk_size: int.
+            Количество записей, преобразуемых в массив за один шаг.
+        '''
+        table = cls.concatenate(cls.iter_chunks(iter_holes(path), chunk_size))
+
+        if poses_path is not None:
+            table.join_poses(iter_holes(poses_path))
+
+        return table
+
+    @classmethod
+    def concatenate(cls, tables):
+        '''
+        Объединение таблиц (например, порций iter_chunks) в одну.
+        '''
+        chunks = [table.data for table in tables]
+
+        return cls(np.concatenate(chunks) if chunks else None)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        '''
+        Загрузка таблицы из двоичного файла .holetab. При mmap=True записи отображаются 
+        в память (только чтение) без разбора и копирования.
+
+        Parameters:
+        - path: str.
+            Путь до файла .holetab.
+        - mmap: bool.
+            Отображение файла в память вместо чтения.
+
+        Returns:
+        - HoleTable.
+            Таблица; метаданные файла сохраняются в атрибуте meta.
+        '''
+        header, offset = read_binary_header(path)
+
+        if header['count'] == 0:
+            data = np.zeros(0, dtype=cls.dtype)
+        elif mmap:
+            data = np.memmap(path, dtype=cls.dtype, mode='r', offset=offset, shape=(header['count'],))
+        else:
+            data = np.fromfile(path, dtype=cls.dtype, count=header['count'], offset=offset)
+
+        table = cls(data)
+        table.meta = header['meta']
+
+        return table
+
+    @classmethod
+    def open(cls, path: str):
+        '''
+        Загрузка таблицы из файла любого поддерживаемого формата: .holetab отображается в 
+        память, JSON читается потоково.
+        '''
+        if path.endswith(BINARY_SUFFIX):
+            return cls.load(path)
+
+        return cls.from_json(path)
+
+    def save(self, path: str, meta: dict = None):
+        '''
+        Запись таблицы в двоичный файл .holetab.
+
+        Parameters:
+        - path: str.
+            Путь до файла.
+        - meta: dict.
+            Дополнительные параметры (например, endoscope_length), сохраняемые в заголовке.
+        '''
+        with HoleTableWriter(path, meta) as writer:
+            writer.write(self)
+
+    def write_json(self, path: str, header: dict = None):
+        '''
+        Потоковая запись таблицы в JSON. Если заполнены положения эндоскопа, 
+        записывается формат результатов (endoscope_coordinates_for_*.json), иначе - 
+        координаты отверстий {"hole_N": {"start": {X, Y, Z}, "end": {X, Y, Z}}}.
+
+        Parameters:
+        - path: str.
+            Путь до файла.
+        - header: dict.
+            Параметры детали (PART_KEYS). Если заданы, координаты отверстий записываются 
+            во входном формате детали {"endoscope_length", "starting_height", "holes": {..}}.
+        '''
+        poses = len(self) > 0 and not np.isnan(self.phi).all()
+
+        with open(path, 'w') as file:
+            part = None
+            if header and not poses:
+                part = JsonObjectWriter(file)
+                for key, value in header.items():
+                    part.write_member(key, value)
+                file.write(',\n' + ' ' * part.indent + '"holes": ')
+
+            writer = JsonObjectWriter(file, level=0 if part is None else 1)
+
+            for i, name in enumerate(self.names):
+                if poses:
+                    start, stop = self.mount_start[i].tolist(), self.mount_stop[i].tolist()
+                    hole = {'start': dict(zip('XYZ', start), phi=float(self.phi[i]), psi=float(self.psi[i])),
+                            'end': dict(zip('XYZ', stop))}
+                else:
+                    hole = {'start': dict(zip('XYZ', self.start[i].tolist())),
+                            'end': dict(zip('XYZ', self.end[i].tolist()))}
+                writer.write_member(name, hole)
+
+            writer.close()
+
+            if part is not None:
+                part.close()
+
+    @classmethod
+    def from_dict(cls, coordinate_dict: dict, poses: bool = None):
+        '''
+        Таблица из словаря вида
+        {"start": [{'X':float, 'Y':float, 'Z':float}, ], "end": [{'X':float, 'Y':float, 'Z':float}, ]}.
+        Углы phi/psi берутся из записей "start", если они есть.
+        '''
+        records = [HoleRecord(f'hole_{index + 1}',
+                              (start['X'], start['Y'], start['Z']),
+                              (end['X'], end['Y'], end['Z']),
+                              start.get('phi'), start.get('psi'))
+                   for index, (start, end) in enumerate(zip(coordinate_dict['start'],
+                                                            coordinate_dict['end']))]
+
+        return cls.from_records(records, poses)
+
+    def join_poses(self, records):
+        '''
+        Заполнение положений эндоскопа по имени отверстия из записей формата результатов.
+        Записи с именами, отсутствующими в таблице, пропускаются.
+        '''
+        index = {name: i for i, name in enumerate(self.data['name'].tolist())}
+
+        for record in records:
+            i = index.get(record.name.encode())
+            if i is not None:
+                self.data['mount_start'][i] = record.start
+                self.data['mount_stop'][i] = record.end
+                self.data['phi'][i] = np.nan if record.phi is None else record.phi
+                self.data['psi'][i] = np.nan if record.psi is None else record.psi
+
+    def __len__(self):
+
+        return len(self.data)
+
+    def __getitem__(self, key):
+
+        return HoleTable(self.data[key])
+
+    @property
+    def names(self) -> list:
+
+        return [name.decode() for name in self.data['name'].tolist()]
+
+    @property
+    def point_numbers(self) -> list:
+
+        return [name.split('_')[-1] for name in self.names]
+
+    @property
+    def start(self) -> np.ndarray:
+
+        return self.data['start']
+
+    @property
+    def end(self) -> np.ndarray:
+
+        return self.data['end']
+
+    @property
+    def mount_start(self) -> np.ndarray:
+
+        return self.data['mount_start']
+
+    @property
+    def mount_stop(self) -> np.ndarray:
+
+        return self.data['mount_stop']
+
+    @property
+    def phi(self) -> np.ndarray:
+
+        return self.data['phi']
+
+    @property
+    def psi(self) -> np.ndarray:
+
+        return self.data['psi']
+
+    @property
+    def nbytes(self) -> int:
+
+        return self.data.nbytes
+
+
+def encode_names(names) -> list:
+    '''
+    Имена отверстий в кодировке UTF-8 для столбца name. Более длинные имена не 
+    усекаются: усеченные имена могут совпасть, и присоединение положений по имени 
+    (join_poses) и инкрементальный пересчет сопоставят разные отверстия.
+
+    Raises:
+    - ValueError.
+        Имя длиннее ширины столбца name.
+    '''
+    width = HoleTable.dtype['name'].itemsize
+    encoded = [name.encode() for name in names]
+
+    for name in encoded:
+        if len(name) > width:
+            raise ValueError(f'Имя отверстия {name.decode()!r} длиннее {width} байт '
+                             f'({len(name)} байт в UTF-8)')
+
+    return encoded
+
+
+def read_binary_header(path: str) -> tuple:
+    '''
+    Чтение и проверка заголовка файла .holetab.
+
+    Returns:
+    - tuple.
+        Заголовок (dict) и смещение первой записи в байтах.
+    '''
+    with open(path, 'rb') as file:
+
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path}: файл не является таблицей отверстий {BINARY_SUFFIX}')
+
+        prefix = np.frombuffer(file.read(_PREFIX.itemsize), dtype=_PREFIX)[0]
+        if prefix['version'] > FORMAT_VERSION:
+            raise ValueError(f'{path}: версия формата {prefix["version"]} не поддерживается '
+                             f'(поддерживается до {FORMAT_VERSION})')
+
+        header = json.loads(file.read(int(prefix['header_length'])))
+        header['version'] = int(prefix['version'])
+        header['count'] = int(prefix['count'])
+
+    if np.dtype([tuple(field) for field in header['dtype']]) != HoleTable.dtype:
+        raise ValueError(f'{path}: структура записей не совпадает с HoleTable.dtype')
+
+    return header, len(MAGIC) + _PREFIX.itemsize + int(prefix['header_length'])
+
+
+class HoleTableWriter():
+    '''
+    Последовательная запись таблиц в файл .holetab порциями. Количество записей 
+    дописывается в заголовок при закрытии файла.
+    '''
+    def __init__(self, path: str, meta: dict = None):
+
+        self.path = path
+        self.meta = meta or {}
+        self.count = 0
+
+    def prefix(self) -> bytes:
+
+        return np.array([(FORMAT_VERSION, self.header_length, self.count)], dtype=_PREFIX).tobytes()
+
+    def open(self):
+
+        header = json.dumps({'dtype': HoleTable.dtype.descr, 'meta': self.meta}).encode()
+        header += b' ' * (-(len(MAGIC) + _PREFIX.itemsize + len(header)) % _ALIGNMENT)
+        self.header_length = len(header)
+
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC + self.prefix() + header)
+
+        return self
+
+    def write(self, table: HoleTable):
+
+        self.file.write(np.ascontiguousarray(table.data, dtype=HoleTable.dtype).tobytes())
+        self.count += len(table)
+
+    def tee(self, tables):
+        '''
+        Запись потока таблиц с их дальнейшей передачей по конвейеру.
+        '''
+        for table in tables:
+            self.write(table)
+            yield table
+
+    def close(self):
+
+        # Количество записей известно только после записи всех порций.
+        self.file.seek(len(MAGIC))
+        self.file.write(self.prefix())
+        self.file.close()
+
+    def __enter__(self):
+
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
+
+
+def json_to_binary(json_path: str, binary_path: str, poses_path: str = None, meta: dict = None):
+    '''
+    Конвертация JSON файла (входной формат или формат результатов) в .holetab. 
+    Параметры детали (PART_KEYS) входного файла сохраняются в метаданных.
+    '''
+    meta = {**read_header(json_path, PART_KEYS), **(meta or {})}
+
+    HoleTable.from_json(json_path, poses_path).save(binary_path, meta)
+
+
+def binary_to_json(binary_path: str, json_path: str):
+    '''
+    Конвертация .holetab в JSON (формат результатов, если заполнены положения эндоскопа). 
+    Если в метаданных есть параметры детали, координаты отверстий записываются во 
+    входном формате детали, пригодном для endoscope_motion.process_part.
+    '''
+    table = HoleTable.load(binary_path)
+    header = {key: table.meta[key] for key in PART_KEYS if key in table.meta}
+
+    table.write_json(json_path, header)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Конвертация таблиц отверстий JSON <-> .holetab.')
+    parser.add_argument('source', help='исходный файл (.json или .holetab)')
+    parser.add_argument('target', help='файл результата (.holetab или .json)')
+    parser.add_argument('--poses', default=None,
+                        help='JSON файл с положениями эндоскопа для присоединения по имени')
+    args = parser.parse_args()
+
+    if args.source.endswith(BINARY_SUFFIX):
+        binary_to_json(args.source, args.target)
+    else:
+        json_to_binary(args.source, args.target, args.poses)
@@ -0,0 +1,344 @@
+#instrumentation.py
+
+'''
+Замеры времени этапов расчета (чтение JSON, решение, углы, формирование команд, запись
+файлов), счетчики и необязательный сбор cProfile и tracemalloc. По умолчанию замеры
+выключены: stage возвращает общий пустой контекст, timed_iter - исходный итератор.
+
+Включение:
+- из кода: instrumentation.enable(cprofile=True);
+- переменной окружения NEW_ANIMATE_PROFILE: '1' (замеры), или список через запятую из
+'timers', 'cprofile', 'tracemalloc'. Результаты записываются при завершении процесса в
+папку NEW_ANIMATE_PROFILE_DIR (по умолчанию result/profile).
+
+Результаты: сводка по этапам (report, format_report) и трасса в формате Chrome trace
+(write_chrome_trace, открывается в chrome://tracing или Perfetto).
+
+Пример:
+    with stage('solve'):
+        starts, stops = batch.solve()
+    count('holes', len(starts))
+'''
+
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+ENV_FLAG = 'NEW_ANIMATE_PROFILE'
+ENV_DIR = 'NEW_ANIMATE_PROFILE_DIR'
+
+_NULL = contextlib.nullcontext()
+
+
+class _Stage():
+    '''
+    Замер одного выполнения этапа.
+    '''
+    __slots__ = ('owner', 'name', 'begin', 'children')
+
+    def __init__(self, owner, name: str):
+
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+
+        self.children = 0.0
+        self.owner.stack.append(self)
+        self.begin = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        end = time.perf_counter()
+        owner = self.owner
+        duration = end - self.begin
+
+        owner.stack.pop()
+        if owner.stack:
+            owner.stack[-1].children += duration
+
+        total = owner.totals.get(self.name)
+        if total is None:
+            total = owner.totals[self.name] = [0, 0.0, 0.0]
+        total[0] += 1
+        total[1] += duration
+        total[2] += duration - self.children
+
+        if len(owner.events) < owner.max_events:
+            owner.events.append((self.name, self.begin, duration, threading.get_ident()))
+
+
+class Instrumentation():
+    '''
+    Накопитель замеров одного процесса.
+    '''
+    def __init__(self, max_events: int = 1_000_000):
+        '''
+        Parameters:
+        - max_events: int.
+            Наибольшее количество событий трассы (сводка по этапам не ограничена).
+        '''
+        self.max_events = max_events
+        self.enabled = False
+        self.profiler = None
+        self.tracemalloc = False
+
+        self.reset()
+
+    def reset(self):
+        '''
+        Начало нового запуска: замеры и счетчики очищаются.
+        '''
+        self.totals = {}
+        self.counters = {}
+        self.events = []
+        self.stack = []
+        self.begin = time.perf_counter()
+        self.wall_begin = time.time()
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        if self.tracemalloc:
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+
+    def enable(self, cprofile: bool = False, trace_memory: bool = False):
+        '''
+        Включение замеров и, при необходимости, cProfile и tracemalloc.
+        '''
+        self.enabled = True
+
+        if cprofile and self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        if trace_memory and not self.tracemalloc:
+            tracemalloc.start()
+            self.tracemalloc = True
+
+    def disable(self):
+
+        self.enabled = False
+
+        if self.profiler is not None:
+            self.profiler.disable()
+
+        if self.tracemalloc:
+            tracemalloc.stop()
+            self.tracemalloc = False
+
+    def stage(self, name: str):
+
+        if not self.enabled:
+            return _NULL
+
+        return _Stage(self, name)
+
+    def count(self, name: str, value: int = 1):
+
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def timed_iter(self, name: str, iterable):
+        '''
+        Итератор, время получения каждого элемента которого учитывается в этапе name
+        (например, разбор JSON при потоковом чтении).
+        '''
+        if not self.enabled:
+            return iterable
+
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name: str, iterable):
+
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def timed(self, name: str):
+        '''
+        Декоратор: каждый вызов функции учитывается в этапе name.
+        '''
+        def decorator(function):
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Stage(self, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def report(self) -> dict:
+        '''
+        Сводка запуска.
+
+        Returns:
+        - dict.
+            {'seconds', 'stages', 'counters', 'memory'}: общее время, по этапам
+            {имя: {'calls', 'seconds', 'self_seconds'}} (seconds включает вложенные этапы),
+            счетчики и пиковый расход памяти в МБ (при включенном tracemalloc).
+        '''
+        stages = {name: {'calls': calls, 'seconds': seconds, 'self_seconds': own}
+                  for name, (calls, seconds, own) in sorted(self.totals.items(),
+                                                            key=lambda item: -item[1][1])}
+
+        memory = None
+        if self.tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            memory = {'current_mb': current / 2**20, 'peak_mb': peak / 2**20}
+
+        return {'seconds': time.perf_counter() - self.begin,
+                'stages': stages,
+                'counters': dict(self.counters),
+                'memory': memory}
+
+    def format_report(self) -> str:
+
+        report = self.report()
+
+        lines = [f"{'Этап':<16}  {'Вызовов':>9}  {'Время, с':>9}  {'Собств., с':>10}  Доля"]
+        for name, row in report['stages'].items():
+            share = row['self_seconds'] / report['seconds'] * 100 if report['seconds'] else 0.0
+            lines.append(f"{name:<16}  {row['calls']:>9}  {row['seconds']:>9.4f}  "
+                         f"{row['self_seconds']:>10.4f}  {share:.1f} %")
+
+        lines.append(f"Общее время: {report['seconds']:.4f} с")
+
+        if report['counters']:
+            lines.append('Счетчики: ' + ', '.join(f'{name} {value}'
+                                                  for name, value in report['counters'].items()))
+        if report['memory'] is not None:
+            lines.append(f"Пиковый расход памяти: {report['memory']['peak_mb']:.1f} МБ")
+
+        return '\n'.join(lines)
+
+    def chrome_trace(self) -> dict:
+        '''
+        Трасса в формате Chrome trace (события 'X' с временем в микросекундах).
+        '''
+        pid = os.getpid()
+        events = [{'name': name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (begin - self.begin) * 1e6, 'dur': duration * 1e6}
+                  for name, begin, duration, tid in self.events]
+
+        end = (time.perf_counter() - self.begin) * 1e6
+        for name, value in self.counters.items():
+            events.append({'name': name, 'ph': 'C', 'pid': pid, 'ts': end, 'args': {name: value}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'start': self.wall_begin}}
+
+    def write_chrome_trace(self, path: str):
+
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+    def write_profile(self, path: str, top: int = 30):
+        '''
+        Запись статистики cProfile: двоичный файл pstats и текстовая сводка <path>.txt
+        с top функциями по накопленному времени.
+        '''
+        if self.profiler is None:
+            return
+
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+
+        with open(path + '.txt', 'w') as file:
+            pstats.Stats(self.profiler, stream=file).sort_stats('cumulative').print_stats(top)
+
+        self.profiler.enable()
+
+    def write_run(self, directory: str, name: str = 'run') -> dict:
+        '''
+        Запись результатов запуска в папку: сводка <name>.report.json, трасса
+        <name>.trace.json и, при включенном cProfile, <name>.pstats.
+
+        Returns:
+        - dict.
+            Сводка report.
+        '''
+        os.makedirs(directory, exist_ok=True)
+
+        report = self.report()
+        with open(os.path.join(directory, name + '.report.json'), 'w') as file:
+            json.dump(report, file, indent=4)
+
+        self.write_chrome_trace(os.path.join(directory, name + '.trace.json'))
+        self.write_profile(os.path.join(directory, name + '.pstats'))
+
+        return report
+
+
+# Замеры процесса.
+INSTRUMENTATION = Instrumentation()
+
+stage = INSTRUMENTATION.stage
+count = INSTRUMENTATION.count
+timed_iter = INSTRUMENTATION.timed_iter
+timed = INSTRUMENTATION.timed
+enable = INSTRUMENTATION.enable
+disable = INSTRUMENTATION.disable
+reset = INSTRUMENTATION.reset
+report = INSTRUMENTATION.report
+format_report = INSTRUMENTATION.format_report
+write_chrome_trace = INSTRUMENTATION.write_chrome_trace
+write_run = INSTRUMENTATION.write_run
+
+
+def configure_from_env(environ=os.environ) -> bool:
+    '''
+    Включение замеров по переменной окружения NEW_ANIMATE_PROFILE. Результаты
+    записываются при завершении процесса.
+
+    Returns:
+    - bool.
+        Замеры включены.
+    '''
+    value = environ.get(ENV_FLAG, '').strip().lower()
+    if value in ('', '0', 'false', 'no'):
+        return False
+
+    features = {item.strip() for item in value.split(',')}
+    if features & {'1', 'true', 'yes', 'all'}:
+        features |= {'timers'} | ({'cprofile', 'tracemalloc'} if 'all' in features else set())
+
+    enable(cprofile='cprofile' in features, trace_memory='tracemalloc' in features)
+
+    directory = environ.get(ENV_DIR, os.path.join('result', 'profile'))
+    script = sys.argv[0] if sys.argv and sys.argv[0] not in ('', '-c') else 'python'
+    name = f'{os.path.splitext(os.path.basename(script))[0]}_{os.getpid()}'
+
+    def finish():
+        write_run(directory, name)
+        print(format_report(), file=sys.stderr)
+
+    atexit.register(finish)
+
+    return True
+
+
+configure_from_env()
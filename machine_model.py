@@ -0,0 +1,131 @@
+#machine_model.py
+
+'''
+Модель движения станка для оценки времени перемещений. Для каждой оси задаются
+максимальная скорость (мм/мин для X Y Z, град/мин для Q W) и ускорение (мм/с^2, град/с^2).
+Перемещение G1 выполняется со скоростью F, ограниченной максимальными скоростями
+участвующих осей, по трапецеидальному профилю скорости.
+'''
+
+import json
+import math
+
+import numpy as np
+
+
+LINEAR_AXES = 'XYZ'
+ROTARY_AXES = 'QW'
+AXES = LINEAR_AXES + ROTARY_AXES
+
+
+class MachineModel():
+    '''
+    Параметры осей станка. Значения по умолчанию соответствуют подачам команд
+    GCodeMaker.make_terminal_command (F2000), ускорение по умолчанию не ограничено.
+    '''
+    def __init__(self, max_feed: dict = None, acceleration: dict = None):
+        '''
+        Parameters:
+        - max_feed: dict.
+            Максимальная скорость осей {ось: мм/мин или град/мин}. Используется также для
+            перемещений без F.
+        - acceleration: dict.
+            Ускорение осей {ось: мм/с^2 или град/с^2}. Отсутствующие оси разгоняются мгновенно.
+        '''
+        self.max_feed = dict.fromkeys(AXES, 2000.0)
+        self.max_feed.update(max_feed or {})
+
+        self.acceleration = dict.fromkeys(AXES, np.inf)
+        self.acceleration.update(acceleration or {})
+
+    @classmethod
+    def from_json(cls, path: str):
+        '''
+        Загрузка параметров из JSON файла {"max_feed": {...}, "acceleration": {...}}.
+        '''
+        with open(path) as f:
+            config = json.load(f)
+
+        return cls(config.get('max_feed'), config.get('acceleration'))
+
+    def to_dict(self) -> dict:
+
+        return {'max_feed': dict(self.max_feed),
+                'acceleration': {axis: value for axis, value in self.acceleration.items()
+                                 if np.isfinite(value)}}
+
+    @staticmethod
+    def profile_time(distance, speed, acceleration):
+        '''
+        Время перемещения на distance по трапецеидальному (треугольному для коротких
+        перемещений) профилю скорости. Векторизовано по NumPy.
+
+        Parameters:
+        - distance: float | np.ndarray.
+            Длина перемещения.
+        - speed: float | np.ndarray.
+            Скорость в единицах в секунду.
+        - acceleration: float | np.ndarray.
+            Ускорение в единицах в секунду за секунду (inf - без разгона).
+
+        Returns:
+        - float | np.ndarray.
+            Время в секундах.
+        '''
+        # Скалярный расчет без NumPy для циклов эвристик.
+        if isinstance(distance, float) and isinstance(speed, float) and isinstance(acceleration, float):
+            distance = abs(distance)
+            if distance == 0:
+                return 0.0
+            if distance < speed * speed / acceleration:
+                return 2 * math.sqrt(distance / acceleration)
+            return distance / speed + speed / acceleration
+
+        distance = np.abs(distance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cruise = distance / speed + speed / acceleration
+            triangle = 2 * np.sqrt(distance / acceleration)
+            # Треугольный профиль, если на разгон и торможение не хватает длины.
+            time = np.where(distance < speed ** 2 / acceleration, triangle, cruise)
+
+        return np.where(distance > 0, time, 0.0)
+
+    def axis_time(self, axis: str, distance, feed: float = None):
+        '''
+        Время перемещения одной оси на distance с подачей feed (мм/мин или град/мин).
+        '''
+        speed = float(min(feed or np.inf, self.max_feed[axis]) / 60)
+
+        return self.profile_time(distance, speed, float(self.acceleration[axis]))
+
+    def path_time(self, length, feed: float = None, axes: str = 'XY'):
+        '''
+        Время перемещения по траектории длиной length осями axes (оценка сверху: скорость
+        и ускорение ограничены самой медленной из осей). Векторизовано по length.
+        '''
+        speed = float(min([feed or np.inf] + [self.max_feed[axis] for axis in axes]) / 60)
+        acceleration = float(min(self.acceleration[axis] for axis in axes))
+
+        return self.profile_time(length, speed, acceleration)
+
+    def move_time(self, delta: dict, feed: float = None) -> float:
+        '''
+        Время линейного перемещения G1 на смещения delta {ось: смещение}. Линейные оси
+        движутся по общей прямой, поворотные - одновременно с ними; время перемещения равно
+        наибольшему из времен линейной и поворотной частей.
+        '''
+        times = [0.0]
+
+        for axes in (LINEAR_AXES, ROTARY_AXES):
+            moving = [axis for axis in axes if delta.get(axis, 0)]
+            if not moving:
+                continue
+
+            length = float(np.sqrt(sum(delta[axis] ** 2 for axis in moving)))
+            # Скорость и ускорение по траектории ограничены каждой участвующей осью.
+            speed = min([feed or np.inf] + [self.max_feed[axis] * length / abs(delta[axis])
+                                            for axis in moving]) / 60
+            acceleration = min(self.acceleration[axis] * length / abs(delta[axis]) for axis in moving)
+            times.append(float(self.profile_time(length, speed, acceleration)))
+
+        return max(times)
@@ -0,0 +1,161 @@
+#mesh_batch.py
+
+'''
+Построение объединенных сеток (mesh) для большого количества однотипных объектов:
+маркеров-сфер и цилиндров-соединений. Вершины и треугольники формируются массивами
+NumPy сразу для всех объектов, поэтому количество объектов сцены (и вызовов отрисовки)
+не зависит от количества отверстий.
+'''
+
+import numpy as np
+
+
+def sphere_template(radius: float = 0.5, rings: int = 6, segments: int = 8) -> tuple:
+    '''
+    Сетка UV-сферы с центром в начале координат.
+
+    Parameters:
+    - radius: float.
+        Радиус сферы (0.5 соответствует модели 'sphere' ursina с масштабом 1).
+    - rings: int.
+        Количество поясов по широте.
+    - segments: int.
+        Количество сегментов по долготе.
+
+    Returns:
+    - tuple.
+        Массив вершин V x 3 и массив треугольников T x 3.
+    '''
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+
+    ring_vertices = np.stack([np.sin(theta)[:, None] * np.cos(phi)[None, :],
+                              np.cos(theta)[:, None] * np.ones_like(phi)[None, :],
+                              np.sin(theta)[:, None] * np.sin(phi)[None, :]], axis=-1).reshape(-1, 3)
+
+    vertices = np.vstack([[0, 1, 0], ring_vertices, [0, -1, 0]]) * radius
+    bottom = len(vertices) - 1
+
+    k = np.arange(segments)
+    k_next = (k + 1) % segments
+
+    # Верхняя и нижняя "шапки" из треугольников вокруг полюсов.
+    top_cap = np.column_stack([np.zeros(segments, dtype=int), 1 + k_next, 1 + k])
+    last = 1 + (rings - 2) * segments
+    bottom_cap = np.column_stack([np.full(segments, bottom), last + k, last + k_next])
+
+    # Пояса между соседними кольцами: по два треугольника на сегмент.
+    ring = np.arange(rings - 2)[:, None]
+    a = 1 + ring * segments + k
+    b = 1 + ring * segments + k_next
+    c = a + segments
+    d = b + segments
+    bands = np.concatenate([np.stack([a, b, d], axis=-1), np.stack([a, d, c], axis=-1)], axis=1).reshape(-1, 3)
+
+    return vertices, np.vstack([top_cap, bands, bottom_cap])
+
+
+def instance_mesh(vertices: np.ndarray, triangles: np.ndarray, centers: np.ndarray,
+                  scale: float = 1.0) -> tuple:
+    '''
+    Копирование сетки-шаблона во все точки centers.
+
+    Returns:
+    - tuple.
+        Массив вершин (N * V) x 3 и массив треугольников (N * T) x 3.
+    '''
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+
+    all_vertices = (vertices[None, :, :] * scale + centers[:, None, :]).reshape(-1, 3)
+    offsets = np.arange(len(centers))[:, None, None] * len(vertices)
+    all_triangles = (triangles[None, :, :] + offsets).reshape(-1, 3)
+
+    return all_vertices, all_triangles
+
+
+def perpendicular_basis(axes: np.ndarray) -> tuple:
+    '''
+    Единичные векторы u, v, перпендикулярные каждой оси и друг другу. Для нулевых осей
+    используется базис плоскости X Z.
+    '''
+    length = np.linalg.norm(axes, axis=1, keepdims=True)
+    w = np.where(length > 0, axes / np.where(length > 0, length, 1), [0, 1, 0])
+
+    # Вспомогательный вектор, не параллельный оси.
+    helper = np.where(np.abs(w[:, [0]]) < 0.9, [1, 0, 0], [0, 1, 0])
+
+    u = np.cross(w, helper)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    v = np.cross(w, u)
+
+    return u, v
+
+
+def cylinder_batch(starts: np.ndarray, ends: np.ndarray, radius: float = 0.5,
+                   resolution: int = 6, caps: bool = True) -> tuple:
+    '''
+    Объединенная сетка цилиндров от starts до ends.
+
+    Parameters:
+    - starts: np.ndarray.
+        Массив N x 3 начальных точек.
+    - ends: np.ndarray.
+        Массив N x 3 конечных точек.
+    - radius: float.
+        Радиус цилиндров.
+    - resolution: int.
+        Количество граней.
+    - caps: bool.
+        Закрывать торцы цилиндров.
+
+    Returns:
+    - tuple.
+        Массив вершин и массив треугольников.
+    '''
+    starts = np.asarray(starts, dtype=float).reshape(-1, 3)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 3)
+    count = len(starts)
+
+    u, v = perpendicular_basis(ends - starts)
+
+    angles = np.linspace(0, 2 * np.pi, resolution, endpoint=False)
+    ring = radius * (np.cos(angles)[None, :, None] * u[:, None, :] +
+                     np.sin(angles)[None, :, None] * v[:, None, :])
+
+    # Вершины одного цилиндра: нижнее кольцо, верхнее кольцо, центры торцов.
+    vertices = np.concatenate([starts[:, None, :] + ring,
+                               ends[:, None, :] + ring,
+                               starts[:, None, :],
+                               ends[:, None, :]], axis=1)
+    per_cylinder = vertices.shape[1]
+
+    k = np.arange(resolution)
+    k_next = (k + 1) % resolution
+    top = k + resolution
+    top_next = k_next + resolution
+
+    triangles = [np.column_stack([k, k_next, top_next]),
+                 np.column_stack([k, top_next, top])]
+    if caps:
+        triangles.append(np.column_stack([np.full(resolution, 2 * resolution), k_next, k]))
+        triangles.append(np.column_stack([np.full(resolution, 2 * resolution + 1), top, top_next]))
+    triangles = np.vstack(triangles)
+
+    offsets = np.arange(count)[:, None, None] * per_cylinder
+    all_triangles = (triangles[None, :, :] + offsets).reshape(-1, 3)
+
+    return vertices.reshape(-1, 3), all_triangles
+
+
+def split_instances(count: int, vertices_per_instance: int, max_vertices: int = 65535) -> list:
+    '''
+    Разбиение N экземпляров на группы так, чтобы в одной сетке было не более max_vertices
+    вершин (ограничение 16-битных индексов).
+
+    Returns:
+    - list.
+        Срезы (slice) экземпляров.
+    '''
+    step = max(1, max_vertices // vertices_per_instance)
+
+    return [slice(i, min(i + step, count)) for i in range(0, count, step)]
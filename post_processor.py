@@ -0,0 +1,423 @@
+#post_processor.py
+
+'''
+Постпроцессоры результатов расчета. Каждый формат вывода (диалект) - отдельный класс,
+зарегистрированный декоратором register_post_processor, который получает общий поток
+решенных таблиц отверстий (hole_table.HoleTable с заполненными положениями эндоскопа).
+Несколько файлов результатов записываются за один проход по отверстиям:
+- 'terminal' - последовательность команд для терминала (.tsc, ComSendmacro) с калибровками;
+- 'gcode' - программа ISO G-code с поворотами G68/G69 (.nc);
+- 'json' - координаты эндоскопа endoscope_coordinates_for_*.json;
+- 'csv' - координаты эндоскопа в виде таблицы CSV;
+- 'binary' - двоичная таблица отверстий и решений .holetab.
+
+Пример:
+    python post_processor.py src/json/cube.json --outputs terminal gcode csv
+'''
+
+import csv
+import logging
+import os
+
+import numpy as np
+
+from calibration_scheduler import CalibrationScheduler
+from endoscope_motion import (TscWriter, hole_solution, iter_solutions, logger, render_hole_blocks,
+                              result_paths)
+from hole_stream import JsonObjectWriter
+from hole_table import HoleTableWriter
+from instrumentation import stage
+from program_optimizer import GCodeOptimizer, TerminalOptimizer
+
+
+# Зарегистрированные постпроцессоры {имя: класс}.
+POST_PROCESSORS = {}
+
+DEFAULT_OUTPUTS = ('terminal', 'json')
+
+
+def register_post_processor(name: str):
+    '''
+    Декоратор регистрации класса постпроцессора под именем name.
+    '''
+    def decorator(cls):
+        cls.name = name
+        POST_PROCESSORS[name] = cls
+        return cls
+
+    return decorator
+
+
+def create_post_processor(name: str, path: str, header: dict = None, **options):
+    '''
+    Постпроцессор по имени. Параметры options, не используемые постпроцессором,
+    игнорируются.
+    '''
+    if name not in POST_PROCESSORS:
+        raise ValueError(f"Неизвестный постпроцессор: {name} (доступны: {', '.join(POST_PROCESSORS)})")
+
+    return POST_PROCESSORS[name](path, header, **options)
+
+
+class PostProcessor():
+    '''
+    Базовый класс постпроцессора. Порядок вызовов: open, write для каждой решенной
+    таблицы, close (или abort при ошибке). Результат записывается во временный файл
+    (path + '.tmp'), которым close заменяет целевой файл, как в TscWriter: при ошибке
+    предыдущий результат не изменяется.
+    '''
+    name = None
+    # Ключ пути результата в endoscope_motion.result_paths.
+    path_key = None
+
+    def __init__(self, path: str, header: dict = None, precision: int = None, **options):
+        '''
+        Parameters:
+        - path: str.
+            Путь до файла результата.
+        - header: dict.
+            Параметры детали {'endoscope_length', 'starting_height'}.
+        - precision: int.
+            Количество знаков после запятой в командах или None для вывода чисел без изменения.
+        '''
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.header = header or {}
+        self.precision = precision
+        self.starting_height = self.header.get('starting_height', 0)
+
+        self.file = None
+        self.count = 0
+
+    def open(self):
+
+        return self
+
+    def open_file(self, mode: str = 'w', **kwargs):
+        '''
+        Открытие временного файла результата.
+        '''
+        self.file = open(self.temp_path, mode, **kwargs)
+
+        return self.file
+
+    def replace_file(self):
+        '''
+        Закрытие временного файла и замена им целевого файла.
+        '''
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def write(self, table):
+
+        self.count += len(table)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        '''
+        Закрытие без сохранения. Временный файл удаляется, целевой не изменяется.
+        '''
+        if self.file is not None:
+            self.file.close()
+
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+@register_post_processor('terminal')
+class TerminalPostProcessor(PostProcessor):
+    '''
+    Последовательность команд для терминала (.tsc) с калибровками.
+    Калибровки расставляются так же, как в endoscope_motion.write_command_sequence.
+    '''
+    path_key = 'tsc'
+
+    def __init__(self, path: str, header: dict = None, precision: int = None, planner=None,
+                 scheduler=None, optimize: bool = False, **options):
+        '''
+        Parameters:
+        - planner: DelayPlanner.
+            Планировщик пауз (delay_planner.DelayPlanner) или None для фиксированных пауз.
+        - scheduler: CalibrationScheduler.
+            Планировщик калибровок или None для исходного цикла.
+        - optimize: bool.
+            Удалить избыточные команды (program_optimizer.TerminalOptimizer).
+        '''
+        PostProcessor.__init__(self, path, header, precision)
+
+        self.writer = TscWriter(path, planner=planner,
+                                optimizer=TerminalOptimizer() if optimize else None)
+        self.scheduler = scheduler if scheduler is not None else CalibrationScheduler()
+        self.texts = {'full': TscWriter.FULL_CALIBRATION_TEXT, 'light': TscWriter.LIGHT_CALIBRATION_TEXT}
+
+    def open(self):
+
+        self.scheduler.reset()
+        self.writer.open()
+
+        return self
+
+    def write_block(self, block: str):
+
+        # Калибровки по X Y Z и Q W перед измерением.
+        for kind in self.scheduler.due():
+            with stage('write_tsc'):
+                self.writer.write_text(self.texts[kind])
+            self.scheduler.record(kind, self.texts[kind])
+
+        with stage('write_tsc'):
+            self.writer.write_text(block)
+        self.scheduler.record('hole', block)
+
+    def write(self, table):
+
+        starts, stops = solution_arrays(table)
+
+        # Блоки таблицы формируются одной операцией, калибровки - между блоками.
+        with stage('format'):
+            blocks = render_hole_blocks(table.point_numbers, starts, stops, self.starting_height,
+                                        self.precision)
+
+        for block in blocks:
+            self.write_block(block)
+
+        self.count += len(table)
+
+    def close(self):
+
+        self.writer.close()
+
+    def abort(self):
+
+        self.writer.abort()
+
+
+@register_post_processor('gcode')
+class GCodePostProcessor(PostProcessor):
+    '''
+    Программа ISO G-code (GCodeMaker.make_gcode) для всех отверстий с завершением M30.
+    При optimize=True избыточные модальные слова удаляются, повторяющиеся блоки выносятся
+    в подпрограммы (program_optimizer.GCodeOptimizer).
+    '''
+    path_key = 'gcode'
+
+    def __init__(self, path: str, header: dict = None, precision: int = None, optimize: bool = False,
+                 **options):
+
+        PostProcessor.__init__(self, path, header, precision)
+
+        self.optimizer = GCodeOptimizer() if optimize else None
+
+    def open(self):
+
+        self.open_file()
+
+        if self.optimizer is not None:
+            self.optimizer.reset()
+
+        return self
+
+    def write(self, table):
+
+        starts, stops = solution_arrays(table)
+
+        with stage('write_gcode'):
+            if self.optimizer is None:
+                render_hole_blocks(table.point_numbers, starts, stops, self.starting_height,
+                                   self.precision, file=self.file, kind='gcode')
+            else:
+                blocks = render_hole_blocks(table.point_numbers, starts, stops, self.starting_height,
+                                            self.precision, kind='gcode')
+                self.file.write(self.optimizer.optimize_text(''.join(blocks)))
+
+        self.count += len(table)
+
+    def close(self):
+
+        self.file.write('M30\n' if self.optimizer is None else self.optimizer.finish('M30\n'))
+        self.replace_file()
+
+
+@register_post_processor('json')
+class JsonPostProcessor(PostProcessor):
+    '''
+    Координаты эндоскопа в формате endoscope_coordinates_for_*.json.
+    '''
+    path_key = 'coordinates'
+
+    def open(self):
+
+        self.points = JsonObjectWriter(self.open_file())
+
+        return self
+
+    def write(self, table):
+
+        with stage('write_json'):
+            for point_number, start, stop in iter_solutions([table]):
+                self.points.write_member('hole_' + point_number, hole_solution(start, stop))
+
+        self.count += len(table)
+
+    def close(self):
+
+        self.points.close()
+        self.replace_file()
+
+
+@register_post_processor('csv')
+class CsvPostProcessor(PostProcessor):
+    '''
+    Координаты эндоскопа в виде таблицы CSV.
+    Столбцы: номер отверстия, начальное положение и углы, конечное положение.
+    '''
+    path_key = 'csv'
+
+    FIELDS = ('hole', 'X1', 'Y1', 'Z1', 'phi', 'psi', 'X2', 'Y2', 'Z2')
+
+    def open(self):
+
+        self.writer = csv.writer(self.open_file(newline=''))
+        self.writer.writerow(self.FIELDS)
+
+        return self
+
+    def write(self, table):
+
+        with stage('write_csv'):
+            for point_number, start, stop in iter_solutions([table]):
+                values = start + stop
+                if self.precision is not None:
+                    values = [f'{value:.{self.precision}f}' for value in values]
+                self.writer.writerow([point_number] + values)
+
+        self.count += len(table)
+
+    def close(self):
+
+        self.replace_file()
+
+
+@register_post_processor('binary')
+class BinaryPostProcessor(PostProcessor):
+    '''
+    Двоичная таблица отверстий и решений (.holetab) без округления.
+    '''
+    path_key = 'binary'
+
+    def open(self):
+
+        self.writer = HoleTableWriter(self.temp_path, self.header).open()
+        self.file = self.writer.file
+
+        return self
+
+    def write(self, table):
+
+        with stage('write_binary'):
+            self.writer.write(table)
+
+        self.count += len(table)
+
+    def close(self):
+
+        self.writer.close()
+        self.replace_file()
+
+
+def solution_arrays(table) -> tuple:
+    '''
+    Округленные до 3 знаков массивы N x 5 [x, y, z, phi, psi] начальных и N x 3 [x, y, z]
+    конечных положений таблицы (как в iter_solutions).
+    '''
+    starts = np.column_stack([table.mount_start, table.phi, table.psi])
+
+    return np.round(starts, 3), np.round(table.mount_stop, 3)
+
+
+def open_post_processors(outputs, paths: dict, header: dict = None, **options) -> list:
+    '''
+    Создание постпроцессоров outputs с путями из paths (endoscope_motion.result_paths).
+    '''
+    return [create_post_processor(name, paths[POST_PROCESSORS[name].path_key], header, **options)
+            for name in outputs]
+
+
+def write_outputs(tables, processors: list) -> int:
+    '''
+    Один проход по потоку решенных таблиц с передачей каждой таблицы всем постпроцессорам.
+    При ошибке все постпроцессоры прерываются (abort).
+
+    Returns:
+    - int.
+        Количество обработанных отверстий.
+    '''
+    count = 0
+    opened = []
+
+    try:
+        for processor in processors:
+            opened.append(processor.open())
+
+        for table in tables:
+            if logger.isEnabledFor(logging.DEBUG):
+                for point_number, start, stop in iter_solutions([table]):
+                    logger.debug('Отверстие №%s (начало) %s, (конец) %s', point_number, start, stop)
+
+            for processor in opened:
+                processor.write(table)
+            count += len(table)
+    except BaseException:
+        for processor in opened:
+            processor.abort()
+        raise
+
+    for processor in opened:
+        processor.close()
+
+    return count
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    from endoscope_motion import process_part
+
+    parser = argparse.ArgumentParser(description='Расчет детали с записью результатов в нескольких форматах.')
+    parser.add_argument('path', nargs='?', help='JSON файл детали')
+    parser.add_argument('--outputs', nargs='+', default=list(DEFAULT_OUTPUTS),
+                        help=f"форматы результатов: {', '.join(POST_PROCESSORS)}")
+    parser.add_argument('--result-dir', default='result', help='папка для записи результатов')
+    parser.add_argument('--precision', type=int, default=None,
+                        help='знаков после запятой в командах (по умолчанию без изменения)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='удалить избыточные команды программ .tsc и G-code')
+    parser.add_argument('--list', action='store_true', help='вывести список постпроцессоров')
+    args = parser.parse_args()
+
+    if args.list or args.path is None:
+        for name, cls in POST_PROCESSORS.items():
+            print(f'{name:<10} {cls.__doc__.strip().splitlines()[0]}')
+    else:
+        os.makedirs(args.result_dir, exist_ok=True)
+        count = process_part(args.path, args.result_dir, precision=args.precision, outputs=args.outputs,
+                             optimize=args.optimize)
+        name = os.path.splitext(os.path.basename(args.path))[0]
+        paths = result_paths(args.result_dir, name)
+        print(f'Отверстий: {count}')
+        for output in args.outputs:
+            print(f'{output:<10} {paths[POST_PROCESSORS[output].path_key]}')
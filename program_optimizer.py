@@ -0,0 +1,515 @@
+#program_optimizer.py
+
+'''
+Сокращение размера программ станка без изменения движений. Поток команд просматривается
+с отслеживанием модального состояния станка (положение осей, подача, режим координат,
+единицы, рабочая плоскость, поворот системы координат), избыточные команды удаляются:
+- перемещения в текущее положение (например, G1 Z0 после обнуления координат G10,
+поворот Q-91 при уже опущенной линзе) и паузы Delay, ожидающие только удаленные
+перемещения;
+- повторные калибровки, между которыми не было перемещений вне калибровок;
+- в G-code - повторные G90 G21, G17/G18/G19, подача F и отмена поворота G69 без G68.
+
+Подача модальна: если удаленное перемещение задавало подачу, она добавляется к следующему
+перемещению без F.
+
+Положение осей отслеживается так же, как в cycle_time.CycleSimulator: перемещение до
+концевика (флаг O) и команда G10 обнуляют координаты. До первой такой команды положение
+неизвестно и перемещения не удаляются.
+
+Повторяющиеся блоки G-code (от комментария до следующего комментария) выносятся в
+подпрограммы O<n> ... M99 после M30 и вызываются M98 P<n>. В последовательностях команд
+для терминала (.tsc) подпрограмм нет, поэтому блоки не выносятся.
+
+Пример:
+    python program_optimizer.py result/commands_sequence_for_cube.tsc result/cube_optimized.tsc
+'''
+
+import hashlib
+import re
+
+from cycle_time import COMSEND_PATTERN
+from machine_model import AXES
+
+
+_WORD = re.compile(r'([A-Z])\s*([-+]?\d*\.?\d+)?')
+_STATEMENT = re.compile(r"^(\s*)(?:ComSendmacro\('(.*?)(\$0A)?'\);|Delay\((\d+)\);)(.*?)(\r?\n)?$")
+_TOKEN = re.compile(r'\S+')
+
+
+def parse_words(command: str) -> list:
+    '''
+    Слова команды G-code [(буква, значение или None)].
+    '''
+    return [(letter, float(value) if value else None) for letter, value in _WORD.findall(command.upper())]
+
+
+class ModalState():
+    '''
+    Модальное состояние станка: положение осей (None - неизвестно), подача, режим
+    координат, единицы, плоскость и активный поворот системы координат.
+    '''
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self):
+
+        self.position = dict.fromkeys(AXES)
+        self.feed = None
+        self.absolute = None
+        self.units = None
+        self.plane = None
+        self.rotation = None
+
+    def invalidate(self):
+
+        self.position = dict.fromkeys(AXES)
+
+    def targets(self, words: list) -> dict:
+
+        return {letter: value for letter, value in words if letter in AXES and value is not None}
+
+    def is_noop(self, targets: dict) -> bool:
+        '''
+        Перемещение не изменяет положение осей.
+        '''
+        if not targets:
+            return False
+        if self.absolute is False:
+            return all(value == 0 for value in targets.values())
+
+        return all(self.position[axis] is not None and self.position[axis] == value
+                   for axis, value in targets.items())
+
+    def move(self, targets: dict, homing: bool = False):
+
+        for axis, value in targets.items():
+            if homing:
+                # Перемещение до концевика: координата обнуляется (cycle_time).
+                self.position[axis] = 0.0
+            elif self.absolute is False:
+                if self.position[axis] is not None:
+                    self.position[axis] += value
+            else:
+                self.position[axis] = value
+
+
+class TerminalOptimizer():
+    '''
+    Сокращение последовательности команд для терминала (.tsc). Текст передается блоками
+    в порядке записи (блок отверстия или калибровки, как в TscWriter.write_text);
+    состояние станка сохраняется между вызовами. Перед новой программой вызывается reset.
+    '''
+    def __init__(self, strip_comments: bool = False):
+        '''
+        Parameters:
+        - strip_comments: bool.
+            Удалять комментарии // (в том числе разделители и номера отверстий).
+        '''
+        self.strip_comments = strip_comments
+
+        self.reset()
+
+    def reset(self):
+
+        self.state = ModalState()
+        # Подача, фактически заданная станку (отличается от state.feed после удаления
+        # перемещения с подачей).
+        self.machine_feed = None
+
+        # Калибровки, выполненные после последнего перемещения вне калибровок.
+        self.calibrated = set()
+
+        # Перемещения, отправленные и удаленные после последней паузы (команды без
+        # перемещения, например G10, паузы не требуют).
+        self.sent = False
+        self.elided = False
+
+        self.stats = {'commands': 0, 'dropped_commands': 0, 'delays': 0, 'dropped_delays': 0,
+                      'dropped_delay_ms': 0, 'dropped_calibrations': 0, 'lines': 0, 'output_lines': 0}
+
+    def is_calibration(self, text: str) -> bool:
+        '''
+        Блок калибровки содержит перемещения до концевиков (флаг O).
+        '''
+        return any(letter == 'O' for command in COMSEND_PATTERN.findall(text)
+                   for letter, _ in parse_words(command))
+
+    def optimize_text(self, text: str) -> str:
+        '''
+        Сокращенный текст блока.
+        '''
+        lines = text.splitlines(keepends=True)
+        self.stats['lines'] += len(lines)
+
+        calibration = self.is_calibration(text)
+        if calibration and text in self.calibrated:
+            self.stats['dropped_calibrations'] += 1
+            return ''
+
+        moved = False
+        output = []
+
+        for line in lines:
+            result, motion = self.optimize_line(line)
+            moved |= motion
+            if result:
+                output.append(result)
+
+        if calibration:
+            self.calibrated.add(text)
+        elif moved:
+            self.calibrated = set()
+
+        self.stats['output_lines'] += len(output)
+
+        return ''.join(output)
+
+    def comment(self, text: str, newline: str) -> str:
+        '''
+        Комментарий в конце строки, оставшийся после удаления команды.
+        '''
+        if self.strip_comments or not text.strip():
+            return ''
+
+        return text.lstrip() + newline
+
+    def optimize_line(self, line: str) -> tuple:
+        '''
+        Returns:
+        - tuple.
+            Строка результата ('' - строка удалена) и признак отправленного перемещения.
+        '''
+        if line.lstrip().startswith('//'):
+            return ('' if self.strip_comments else line), False
+
+        match = _STATEMENT.match(line)
+        if match is None:
+            # Неизвестная инструкция: состояние станка больше не известно.
+            if line.strip():
+                self.state.invalidate()
+            return line, False
+
+        indent, command, suffix, delay, rest, newline = match.groups()
+        newline = newline or ''
+        if self.strip_comments and rest.lstrip().startswith('//'):
+            rest = ''
+
+        if delay is not None:
+            self.stats['delays'] += 1
+
+            # Пауза ожидает только удаленные перемещения.
+            drop = self.elided and not self.sent
+            self.sent = self.elided = False
+
+            if drop:
+                self.stats['dropped_delays'] += 1
+                self.stats['dropped_delay_ms'] += int(delay)
+                return self.comment(rest, newline), False
+
+            return f'{indent}Delay({delay});{rest}{newline}', False
+
+        self.stats['commands'] += 1
+        command, motion = self.optimize_command(command)
+
+        if command is None:
+            self.stats['dropped_commands'] += 1
+            self.elided = True
+            return self.comment(rest, newline), False
+
+        self.sent |= motion
+
+        return f"{indent}ComSendmacro('{command}{suffix or ''}');{rest}{newline}", motion
+
+    def optimize_command(self, command: str) -> tuple:
+        '''
+        Returns:
+        - tuple.
+            Команда (None - команда удалена) и признак перемещения.
+        '''
+        state = self.state
+        words = parse_words(command)
+        codes = {int(value) for letter, value in words if letter == 'G' and value is not None}
+        feeds = [value for letter, value in words if letter == 'F']
+        feed = feeds[-1] if feeds else None
+
+        if 90 in codes:
+            state.absolute = True
+        if 91 in codes:
+            state.absolute = False
+
+        if codes & {0, 1}:
+            targets = state.targets(words)
+            homing = any(letter == 'O' for letter, _ in words)
+
+            if not homing and state.is_noop(targets) and codes <= {0, 1, 90, 91}:
+                if feed is not None:
+                    state.feed = feed
+                return None, False
+
+            if feed is not None:
+                state.feed = self.machine_feed = feed
+            elif state.feed is not None and state.feed != self.machine_feed:
+                # Подача удаленного перемещения.
+                command = f'{command} F{state.feed:g}'
+                self.machine_feed = state.feed
+
+            state.move(targets, homing)
+
+            return command, bool(targets)
+
+        if 10 in codes:
+            state.position = dict.fromkeys(AXES, 0.0)
+        elif not codes & {90, 91}:
+            state.invalidate()
+
+        return command, False
+
+    def finish(self) -> str:
+
+        return ''
+
+    def report(self) -> dict:
+
+        return dict(self.stats)
+
+
+class GCodeOptimizer():
+    '''
+    Сокращение программы G-code (GCodeMaker.make_gcode): удаление модальных слов, уже
+    действующих в состоянии станка, и вынос повторяющихся блоков в подпрограммы. Текст
+    передается частями в порядке записи, подпрограммы возвращает finish.
+    '''
+    def __init__(self, subroutines: bool = True, min_lines: int = 3, first_number: int = 1000,
+                 strip_comments: bool = False):
+        '''
+        Parameters:
+        - subroutines: bool.
+            Выносить повторяющиеся блоки в подпрограммы.
+        - min_lines: int.
+            Наименьшее количество строк блока для выноса в подпрограмму.
+        - first_number: int.
+            Номер первой подпрограммы.
+        - strip_comments: bool.
+            Удалять комментарии (...) (блоки при этом не выделяются).
+        '''
+        self.subroutines = subroutines
+        self.min_lines = min_lines
+        self.first_number = first_number
+        self.strip_comments = strip_comments
+
+        self.reset()
+
+    def reset(self):
+
+        self.state = ModalState()
+
+        self.label = None
+        self.block = []
+        self.seen = {}
+        self.bodies = []
+        self.pending = ''
+
+        self.stats = {'lines': 0, 'output_lines': 0, 'dropped_words': 0, 'dropped_lines': 0,
+                      'subroutines': 0, 'calls': 0}
+
+    def is_redundant(self, letter: str, value: float) -> bool:
+        '''
+        Модальное слово уже действует в состоянии станка.
+        '''
+        state = self.state
+
+        if value is None:
+            return False
+        if letter == 'F':
+            return value == state.feed
+        if letter != 'G':
+            return False
+
+        code = int(value)
+
+        return (code in (90, 91) and state.absolute == (code == 90)
+                or code in (20, 21) and state.units == code
+                or code in (17, 18, 19) and state.plane == code
+                or code == 69 and state.rotation is False)
+
+    def optimize_line(self, line: str) -> str:
+        '''
+        Строка без избыточных модальных слов ('' - строка удалена).
+        '''
+        state = self.state
+        command = re.sub(r'\(.*?\)|;.*', '', line).strip()
+        if not command:
+            return line
+
+        tokens = _TOKEN.findall(command)
+        words = parse_words(command)
+        codes = {int(value) for letter, value in words if letter == 'G' and value is not None}
+
+        # Слова по одному в токене (токены вида 'G90G21' не изменяются).
+        single = [parse_words(token) for token in tokens]
+        single = [parsed[0] if len(parsed) == 1 else (None, None) for parsed in single]
+
+        keep = [token for token, word in zip(tokens, single) if not self.is_redundant(*word)]
+
+        for code in codes:
+            if code in (90, 91):
+                state.absolute = code == 90
+            elif code in (20, 21):
+                state.units = code
+            elif code in (17, 18, 19):
+                state.plane = code
+
+        feeds = [value for letter, value in words if letter == 'F' and value is not None]
+        targets = state.targets(words)
+
+        if codes & {0, 1} and not codes & {10, 28, 53, 68, 92}:
+            if state.is_noop(targets):
+                # Перемещения нет: остаются только модальные слова (например, подача).
+                motion = {token for token, (letter, value) in zip(tokens, single)
+                          if letter in AXES or letter == 'G' and value in (0, 1)}
+                keep = [token for token in keep if token not in motion]
+            state.move(targets)
+        elif codes & {68, 69}:
+            state.rotation = 68 in codes
+            # Координаты задаются в повернутой системе.
+            state.invalidate()
+        elif targets or codes - {17, 18, 19, 20, 21, 90, 91}:
+            state.invalidate()
+
+        if feeds:
+            state.feed = feeds[-1]
+
+        self.stats['dropped_words'] += len(tokens) - len(keep)
+
+        if len(keep) == len(tokens):
+            return line
+        if not keep:
+            self.stats['dropped_lines'] += 1
+            return ''
+
+        return ' '.join(keep) + '\n'
+
+    def flush_block(self) -> list:
+        '''
+        Строки завершенного блока: повторный блок заменяется вызовом подпрограммы.
+        '''
+        label, body = self.label, self.block
+        self.label, self.block = None, []
+
+        lines = [label] if label is not None else []
+
+        if not self.subroutines or label is None or len(body) < self.min_lines:
+            return lines + body
+
+        text = ''.join(body)
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+        if key not in self.seen:
+            self.seen[key] = None
+            return lines + body
+
+        number = self.seen[key]
+        if number is None:
+            number = self.seen[key] = self.first_number + len(self.bodies)
+            self.bodies.append(f'O{number}\n' + text + 'M99\n')
+            self.stats['subroutines'] += 1
+
+        self.stats['calls'] += 1
+
+        return lines + [f'M98 P{number}\n']
+
+    def optimize_text(self, text: str) -> str:
+
+        output = []
+        text = self.pending + text
+        lines = text.splitlines(keepends=True)
+
+        # Незавершенная строка обрабатывается со следующей частью текста.
+        self.pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+
+        for line in lines:
+            self.stats['lines'] += 1
+
+            if line.lstrip().startswith('(') and not re.sub(r'\(.*?\)', '', line).strip():
+                if self.strip_comments:
+                    continue
+                output.extend(self.flush_block())
+                self.label = line
+                continue
+
+            line = self.optimize_line(line)
+            if line:
+                self.block.append(line)
+
+        self.stats['output_lines'] += len(output)
+
+        return ''.join(output)
+
+    def finish(self, end: str = '') -> str:
+        '''
+        Оставшийся текст, завершение программы end (например, 'M30\\n') и подпрограммы.
+        '''
+        text = self.optimize_text(self.pending + ('\n' if self.pending else ''))
+        lines = self.flush_block()
+
+        self.stats['output_lines'] += len(lines) + end.count('\n') + sum(body.count('\n') for body in self.bodies)
+
+        return text + ''.join(lines) + end + ''.join(self.bodies)
+
+    def report(self) -> dict:
+
+        return dict(self.stats)
+
+
+def optimize_program(lines, optimizer) -> str:
+    '''
+    Сокращение готовой программы. Для .tsc текст передается оптимизатору блоками,
+    разделенными строками '// ......'.
+    '''
+    output = []
+    block = []
+
+    for line in lines:
+        block.append(line + '\n')
+        if isinstance(optimizer, TerminalOptimizer) and '// ......' in line:
+            output.append(optimizer.optimize_text(''.join(block)))
+            block = []
+
+    output.append(optimizer.optimize_text(''.join(block)))
+    output.append(optimizer.finish())
+
+    return ''.join(output)
+
+
+def format_report(report: dict) -> str:
+
+    return ', '.join(f'{key}: {value}' for key, value in report.items())
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    from cycle_time import read_program
+
+    parser = argparse.ArgumentParser(description='Сокращение программы .tsc или G-code.')
+    parser.add_argument('source', help='исходная программа')
+    parser.add_argument('target', help='сокращенная программа')
+    parser.add_argument('--strip-comments', action='store_true', help='удалить комментарии')
+    parser.add_argument('--no-subroutines', action='store_true',
+                        help='не выносить повторяющиеся блоки G-code в подпрограммы')
+    args = parser.parse_args()
+
+    if args.source.endswith('.tsc'):
+        optimizer = TerminalOptimizer(args.strip_comments)
+    else:
+        optimizer = GCodeOptimizer(not args.no_subroutines, strip_comments=args.strip_comments)
+
+    text = optimize_program(read_program(args.source), optimizer)
+
+    with open(args.target, 'w') as file:
+        file.write(text)
+
+    print(format_report(optimizer.report()))
@@ -0,0 +1,186 @@
+#solution_cache.py
+
+'''
+Постоянный кэш решений для отверстий. Ключ - хэш геометрии отверстия (input, output),
+длины эндоскопа, стартовой высоты и типа решателя. Значение - результаты find_angles
+(начальное положение и углы) и find_point (конечное положение).
+'''
+
+import hashlib
+import sqlite3
+
+import numpy as np
+
+
+class SolutionCache():
+    '''
+    Кэш решений в базе SQLite с вытеснением давно не использованных записей (LRU) при
+    превышении max_entries и статистикой попаданий/промахов.
+
+    Пример:
+        with SolutionCache('result/solutions.sqlite') as cache:
+            keys = cache.make_keys(inputs, outputs, e_len, starting_height, 'closed_form')
+            found = cache.get_many(keys)
+    '''
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        '''
+        Parameters:
+        - path: str.
+            Путь до файла базы данных (':memory:' - кэш в памяти).
+        - max_entries: int.
+            Максимальное количество записей в кэше.
+        '''
+        self.path = path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS solutions (
+                key TEXT PRIMARY KEY,
+                start BLOB NOT NULL,
+                stop BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            )''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)')
+        self.connection.commit()
+
+        # Счетчик обращений, по которому определяется давность использования записи.
+        self.clock = self.connection.execute(
+            'SELECT COALESCE(MAX(last_used), 0) FROM solutions').fetchone()[0]
+
+    @staticmethod
+    def make_keys(inputs: np.ndarray, outputs: np.ndarray, e_len: float,
+                  starting_height: float, solver_kind: str) -> list:
+        '''
+        Ключи кэша для набора отверстий.
+
+        Parameters:
+        - inputs: np.ndarray.
+            Массив N x 3 координат входных отверстий.
+        - outputs: np.ndarray.
+            Массив N x 3 координат выходных отверстий.
+        - e_len: float.
+            Длина эндоскопа.
+        - starting_height: float.
+            Высота стартовой плоскости.
+        - solver_kind: str.
+            Тип решателя.
+
+        Returns:
+        - list.
+            Строки sha256 для каждого отверстия.
+        '''
+        # Прибавление 0.0 приводит -0.0 к 0.0, чтобы знак нуля не влиял на ключ.
+        rows = np.hstack([np.asarray(inputs, dtype=np.float64).reshape(-1, 3),
+                          np.asarray(outputs, dtype=np.float64).reshape(-1, 3)]) + 0.0
+        suffix = np.array([e_len, starting_height], dtype=np.float64).tobytes() + \
+            solver_kind.encode()
+
+        return [hashlib.sha256(row.tobytes() + suffix).hexdigest() for row in rows]
+
+    def get_many(self, keys: list) -> dict:
+        '''
+        Поиск решений по списку ключей.
+
+        Returns:
+        - dict.
+            {key: (start, stop)} для найденных ключей, где start - массив
+            [x, y, z, phi, psi], stop - массив [x, y, z].
+        '''
+        found = {}
+        unique = list(dict.fromkeys(keys))
+
+        # Запросы порциями, чтобы не превышать ограничение SQLite на число параметров.
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = self.connection.execute(
+                f"SELECT key, start, stop FROM solutions WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk)
+            for key, start, stop in rows:
+                found[key] = (np.frombuffer(start, dtype=np.float64),
+                              np.frombuffer(stop, dtype=np.float64))
+
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+
+        # Обновление давности использования найденных записей.
+        self.clock += 1
+        self.connection.executemany('UPDATE solutions SET last_used = ? WHERE key = ?',
+                                    [(self.clock, key) for key in found])
+        self.connection.commit()
+
+        return found
+
+    def put_many(self, keys: list, starts: np.ndarray, stops: np.ndarray):
+        '''
+        Сохранение решений и вытеснение давно не использованных записей.
+
+        Parameters:
+        - keys: list.
+            Ключи make_keys.
+        - starts: np.ndarray.
+            Массив N x 5 [x, y, z, phi, psi] начальных положений.
+        - stops: np.ndarray.
+            Массив N x 3 [x, y, z] конечных положений.
+        '''
+        self.clock += 1
+        starts = np.asarray(starts, dtype=np.float64)
+        stops = np.asarray(stops, dtype=np.float64)
+
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO solutions (key, start, stop, last_used) VALUES (?, ?, ?, ?)',
+            [(key, start.tobytes(), stop.tobytes(), self.clock)
+             for key, start, stop in zip(keys, starts, stops)])
+
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        '''
+        Удаление записей сверх max_entries в порядке давности использования.
+        '''
+        count = self.connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+        excess = count - self.max_entries
+
+        if excess > 0:
+            self.connection.execute(
+                'DELETE FROM solutions WHERE key IN '
+                '(SELECT key FROM solutions ORDER BY last_used LIMIT ?)', (excess,))
+            self.evictions += excess
+
+    def __len__(self):
+
+        return self.connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def stats(self) -> dict:
+        '''
+        Статистика кэша.
+
+        Returns:
+        - dict.
+            {'hits', 'misses', 'hit_rate', 'evictions', 'entries'}.
+        '''
+        total = self.hits + self.misses
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self)}
+
+    def close(self):
+
+        self.connection.close()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
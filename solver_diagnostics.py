@@ -0,0 +1,148 @@
+#solver_diagnostics.py
+
+'''
+Диагностика решателей положений эндоскопа. Для каждого отверстия и положения (start,
+stop) записывается состояние решения, норма невязки, количество итераций и вычислений
+системы и время решения. Записи хранятся в памяти и выгружаются в CSV или JSON.
+
+Сообщения пишутся в журнал 'new_animate' модуля logging и по умолчанию не выводятся.
+Вывод включается configure_logging:
+    configure_logging('DEBUG')    # каждое решение
+    configure_logging('WARNING')  # только неудачные решения
+'''
+
+import csv
+import json
+import logging
+
+import numpy as np
+
+
+LOGGER_NAME = 'new_animate'
+
+# Без настройки журнала сообщения не выводятся (в том числе предупреждения).
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+logger = logging.getLogger(LOGGER_NAME + '.solver')
+
+
+def configure_logging(level='INFO', stream=None) -> logging.Logger:
+    '''
+    Вывод сообщений журнала 'new_animate' уровня level и выше в stream (по умолчанию stderr).
+
+    Parameters:
+    - level: str | int.
+        Уровень журнала ('DEBUG', 'INFO', 'WARNING', ...).
+    - stream: file.
+        Поток вывода.
+
+    Returns:
+    - logging.Logger.
+        Журнал 'new_animate'.
+    '''
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    if not any(getattr(handler, '_new_animate', False) for handler in root.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handler._new_animate = True
+        root.addHandler(handler)
+
+    return root
+
+
+class SolverDiagnostics():
+    '''
+    Таблица диагностики решений. Одна запись - одно решение для отверстия и положения.
+    '''
+    FIELDS = ('hole', 'position', 'solver', 'success', 'residual', 'iterations', 'nfev',
+              'njev', 'seconds', 'message')
+
+    def __init__(self):
+
+        self.records = []
+
+    def __len__(self):
+
+        return len(self.records)
+
+    def record(self, hole: str = '', position: str = '', solver: str = '', success: bool = True,
+               residual: float = 0.0, iterations: int = None, nfev: int = 0, njev: int = 0,
+               seconds: float = 0.0, message: str = ''):
+        '''
+        Запись одного решения.
+        '''
+        row = {'hole': hole, 'position': position, 'solver': solver, 'success': bool(success),
+               'residual': float(residual), 'iterations': iterations, 'nfev': int(nfev),
+               'njev': int(njev), 'seconds': float(seconds), 'message': message}
+        self.records.append(row)
+
+        if not row['success']:
+            logger.warning('Отверстие %s (%s): решение не найдено, невязка %.3g - %s',
+                           hole, position, row['residual'], message)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Отверстие %s (%s): %s, невязка %.3g, итераций %s, время %.6f с',
+                         hole, position, solver, row['residual'], iterations, row['seconds'])
+
+    def record_batch(self, holes: list, position: str, solver: str, residuals: np.ndarray,
+                     seconds: float, success: np.ndarray = None):
+        '''
+        Запись решений, найденных одним векторным расчетом. Время расчета делится поровну
+        между отверстиями.
+        '''
+        if not len(holes):
+            return
+
+        if success is None:
+            success = np.ones(len(holes), dtype=bool)
+
+        share = seconds / len(holes)
+        for hole, residual, solved in zip(holes, np.asarray(residuals).tolist(), success.tolist()):
+            self.record(hole, position, solver, solved, residual, 0, 0, 0, share)
+
+    def failures(self) -> list:
+
+        return [row for row in self.records if not row['success']]
+
+    def summary(self) -> dict:
+        '''
+        Итоги диагностики.
+
+        Returns:
+        - dict.
+            {'solutions', 'failed', 'max_residual', 'seconds', 'solvers'}: количество
+            решений и неудачных решений, наибольшая невязка, суммарное время и
+            количество решений по решателям.
+        '''
+        solvers = {}
+        for row in self.records:
+            solvers[row['solver']] = solvers.get(row['solver'], 0) + 1
+
+        return {'solutions': len(self.records),
+                'failed': len(self.failures()),
+                'max_residual': max([row['residual'] for row in self.records] + [0.0]),
+                'seconds': sum(row['seconds'] for row in self.records),
+                'solvers': solvers}
+
+    def to_csv(self, path: str):
+
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def to_json(self, path: str):
+
+        with open(path, 'w') as file:
+            json.dump({'summary': self.summary(), 'records': self.records}, file, indent=4,
+                      ensure_ascii=False)
+
+    def save(self, path: str):
+        '''
+        Запись таблицы в CSV или JSON (по расширению файла).
+        '''
+        if path.endswith('.json'):
+            self.to_json(path)
+        else:
+            self.to_csv(path)
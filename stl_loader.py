@@ -0,0 +1,223 @@
+#stl_loader.py
+
+'''
+Загрузка STL моделей детали. Двоичный и текстовый (ASCII) STL разбираются NumPy целиком,
+совпадающие вершины объединяются, результат кэшируется в компактном двоичном виде (.npz)
+по хэшу содержимого файла. Для интерактивного просмотра доступно упрощение сетки
+(level of detail) методом кластеризации вершин.
+'''
+
+import hashlib
+import os
+import re
+
+import numpy as np
+
+
+# Версия формата кэша. Меняется при изменении алгоритмов разбора/упрощения.
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'new_animate', 'stl')
+
+# Запись треугольника двоичного STL.
+_BINARY_TRIANGLE = np.dtype([('normal', '<f4', (3,)),
+                             ('vertices', '<f4', (3, 3)),
+                             ('attribute', '<u2')])
+
+_ASCII_VERTEX = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+
+def read_stl(path: str) -> np.ndarray:
+    '''
+    Чтение вершин треугольников STL файла.
+
+    Parameters:
+    - path: str.
+        Путь до STL файла (двоичного или ASCII).
+
+    Returns:
+    - np.ndarray.
+        Массив T x 3 x 3 (float32) координат вершин треугольников.
+    '''
+    with open(path, 'rb') as file:
+        content = file.read()
+
+    return parse_stl(content)
+
+
+def parse_stl(content: bytes) -> np.ndarray:
+    '''
+    Разбор содержимого STL файла. Формат определяется по размеру: двоичный файл содержит
+    ровно 84 + 50 * T байт, где T - количество треугольников из заголовка.
+    '''
+    if len(content) >= 84:
+        count = int(np.frombuffer(content, dtype='<u4', count=1, offset=80)[0])
+        if len(content) == 84 + count * _BINARY_TRIANGLE.itemsize:
+            triangles = np.frombuffer(content, dtype=_BINARY_TRIANGLE, count=count, offset=84)
+            return triangles['vertices'].copy()
+
+    if content.lstrip()[:5].lower() != b'solid':
+        raise ValueError('Файл не является STL (двоичным или ASCII)')
+
+    vertices = np.array(_ASCII_VERTEX.findall(content), dtype=np.float32)
+    if len(vertices) % 3:
+        raise ValueError('Количество вершин ASCII STL не кратно трем')
+
+    return vertices.reshape(-1, 3, 3)
+
+
+def weld_vertices(triangle_vertices: np.ndarray, tolerance: float = 0.0) -> tuple:
+    '''
+    Объединение совпадающих вершин.
+
+    Parameters:
+    - triangle_vertices: np.ndarray.
+        Массив T x 3 x 3 координат вершин треугольников.
+    - tolerance: float.
+        Допуск совпадения координат (0 - точное совпадение).
+
+    Returns:
+    - tuple.
+        Массив уникальных вершин V x 3 и массив индексов треугольников T x 3.
+    '''
+    points = triangle_vertices.reshape(-1, 3)
+    keys = np.round(points / tolerance) if tolerance > 0 else points
+
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+
+    return points[first], inverse.reshape(-1, 3).astype(np.uint32)
+
+
+def remove_degenerate(triangles: np.ndarray) -> np.ndarray:
+    '''
+    Удаление вырожденных (с повторяющимися вершинами) и дублирующихся треугольников.
+    '''
+    valid = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+             (triangles[:, 0] != triangles[:, 2]))
+    triangles = triangles[valid]
+
+    # Дубликаты определяются без учета порядка обхода вершин.
+    _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+
+    return triangles[np.sort(first)]
+
+
+def decimate(vertices: np.ndarray, triangles: np.ndarray, resolution: int) -> tuple:
+    '''
+    Упрощение сетки кластеризацией вершин: габаритный куб модели делится на resolution
+    ячеек по наибольшей стороне, вершины одной ячейки заменяются их средним.
+
+    Parameters:
+    - vertices: np.ndarray.
+        Массив вершин V x 3.
+    - triangles: np.ndarray.
+        Массив индексов треугольников T x 3.
+    - resolution: int.
+        Количество ячеек по наибольшей стороне габарита.
+
+    Returns:
+    - tuple.
+        Упрощенные массивы вершин и треугольников.
+    '''
+    lower = vertices.min(axis=0)
+    size = (vertices.max(axis=0) - lower).max()
+    cell = size / resolution if size > 0 else 1.0
+
+    cells = np.floor((vertices - lower) / cell).astype(np.int64)
+    _, cluster = np.unique(cells, axis=0, return_inverse=True)
+    cluster = cluster.ravel()
+
+    count = cluster.max() + 1
+    sums = np.zeros((count, 3))
+    np.add.at(sums, cluster, vertices)
+    new_vertices = (sums / np.bincount(cluster, minlength=count)[:, None]).astype(np.float32)
+
+    new_triangles = remove_degenerate(cluster[triangles].astype(np.uint32))
+
+    # Удаление вершин, не вошедших ни в один треугольник.
+    used, remap = np.unique(new_triangles, return_inverse=True)
+
+    return new_vertices[used], remap.reshape(-1, 3).astype(np.uint32)
+
+
+def vertex_normals(vertices: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    '''
+    Нормали вершин как сумма нормалей прилегающих треугольников, взвешенных по площади.
+    '''
+    corners = vertices[triangles]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+    normals = np.zeros_like(vertices, dtype=np.float64)
+    for k in range(3):
+        np.add.at(normals, triangles[:, k], face_normals)
+
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+
+    return (normals / np.where(length > 0, length, 1)).astype(np.float32)
+
+
+def file_hash(path: str) -> str:
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_stl(path: str, lod: int = None, cache_dir: str = DEFAULT_CACHE_DIR) -> tuple:
+    '''
+    Загрузка сетки STL модели с кэшированием.
+
+    Parameters:
+    - path: str.
+        Путь до STL файла.
+    - lod: int.
+        Разрешение упрощения (см. decimate) или None для полной сетки.
+    - cache_dir: str.
+        Папка кэша или None, чтобы не использовать кэш.
+
+    Returns:
+    - tuple.
+        Массивы вершин V x 3, индексов треугольников T x 3 и нормалей вершин V x 3.
+    '''
+    cache_path = None
+
+    if cache_dir is not None:
+        key = f'{file_hash(path)}_v{CACHE_VERSION}_lod{lod or 0}'
+        cache_path = os.path.join(cache_dir, key + '.npz')
+
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached['vertices'], cached['triangles'], cached['normals']
+
+    vertices, triangles = weld_vertices(read_stl(path))
+    triangles = remove_degenerate(triangles)
+
+    if lod:
+        vertices, triangles = decimate(vertices, triangles, lod)
+
+    normals = vertex_normals(vertices, triangles)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Запись через временный файл, чтобы параллельные запуски не читали неполный кэш.
+        temp_path = cache_path + f'.{os.getpid()}.tmp.npz'
+        np.savez(temp_path, vertices=vertices, triangles=triangles, normals=normals)
+        os.replace(temp_path, cache_path)
+
+    return vertices, triangles, normals
+
+
+def load_model(path: str, lod: int = None, cache_dir: str = DEFAULT_CACHE_DIR):
+    '''
+    Модель ursina.Mesh из STL файла (см. load_stl).
+    '''
+    import ursina
+
+    vertices, triangles, normals = load_stl(path, lod, cache_dir)
+
+    return ursina.Mesh(vertices=vertices.tolist(),
+                       triangles=triangles.tolist(),
+                       normals=normals.tolist())
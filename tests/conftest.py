@@ -0,0 +1,14 @@
+#conftest.py
+
+'''
+Модули проекта лежат в корне репозитория: корень добавляется в sys.path.
+'''
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Пример детали для тестов.
+CUBE_PATH = os.path.join(ROOT, 'src', 'json', 'cube.json')
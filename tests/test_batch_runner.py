@@ -0,0 +1,35 @@
+#test_batch_runner.py
+
+'''
+Пакетный запуск по папке обрабатывает только JSON файлы деталей.
+'''
+
+import json
+import os
+import shutil
+
+from batch_runner import collect_part_files, run_batch, run_part
+from conftest import CUBE_PATH
+
+
+def test_directory_skips_non_part_files(tmp_path):
+
+    parts = tmp_path / 'parts'
+    parts.mkdir()
+    shutil.copy(CUBE_PATH, parts / 'cube.json')
+    (parts / 'points.json').write_text(json.dumps({'hole_1': {'X': 1, 'Y': 2, 'Z': 3}}))
+    (parts / 'list.json').write_text(json.dumps([1, 2, 3]))
+
+    assert collect_part_files([str(parts)]) == [os.path.join(str(parts), 'cube.json')]
+
+    reports = run_batch([str(parts)], str(tmp_path / 'result'), workers=1)
+    assert [report['error'] for report in reports] == [None]
+
+
+def test_non_part_file_is_reported(tmp_path):
+
+    path = tmp_path / 'points.json'
+    path.write_text(json.dumps({'hole_1': {'X': 1, 'Y': 2, 'Z': 3}}))
+
+    report = run_part(str(path), str(tmp_path))
+    assert 'не является деталью' in report['error']
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from command_sender import CommandSender, MockController, open_tcp
+
+
+async def send(port, commands, **options):
+
+    reader, writer = await open_tcp('127.0.0.1', port)
+    try:
+        return await CommandSender(reader, writer, **options).run(commands)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def test_timeout_without_answers():
+
+    async def main():
+        async def silent(reader, writer):
+            while await reader.readline():
+                pass
+            writer.close()
+
+        server = await asyncio.start_server(silent, '127.0.0.1', 0)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            with pytest.raises(TimeoutError):
+                await asyncio.wait_for(send(port, ['G0 X1', 'G0 X2', 'G0 X3'], flow='ack',
+                                            window=2, timeout=1.0), 5.0)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('sender_buffer, overflow', [(64, False), (256, True)])
+def test_mock_overflow(sender_buffer, overflow):
+
+    async def main():
+        controller = await MockController(rx_buffer=64, planner_size=1,
+                                          execution_time=0.01).start()
+        try:
+            commands = [f'G1 X{i}' for i in range(30)]
+            report = await send(controller.port, commands, flow='chars',
+                                rx_buffer=sender_buffer, timeout=5.0)
+        finally:
+            await controller.stop()
+
+        assert report['acknowledged'] == len(commands)
+        assert controller.overflow == overflow
+
+    asyncio.run(main())
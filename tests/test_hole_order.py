@@ -0,0 +1,55 @@
+#test_hole_order.py
+
+'''
+Оптимизация порядка обхода не должна увеличивать время цикла по моделированию программы.
+'''
+
+import numpy as np
+import pytest
+
+from calibration_scheduler import parse_policy
+from conftest import CUBE_PATH
+from cycle_time import simulate_file
+from endoscope_motion import process_part, result_paths
+from hole_order import calibration_blocks, calibration_plan, optimize_order
+
+
+def test_legacy_plan():
+
+    blocks = calibration_blocks(calibration_plan(30, parse_policy('holes:10:0')))
+    assert [block.stop - block.start for block in blocks] == [10, 10, 10]
+
+    plan = calibration_plan(30, parse_policy('legacy'))
+    blocks = calibration_blocks([['full'] if 'full' in kinds else [] for kinds in plan])
+    assert [block.stop - block.start for block in blocks] == [10, 9, 9, 2]
+
+
+def test_motion_policy_is_not_planned():
+
+    with pytest.raises(ValueError):
+        calibration_plan(10, parse_policy('travel:2000:500'))
+
+
+def test_order_is_deterministic():
+
+    rng = np.random.default_rng(0)
+    starts = np.column_stack([rng.uniform(-200, 200, (300, 3)), rng.uniform(0, 180, 300),
+                              rng.uniform(-90, 90, 300)])
+
+    orders = [optimize_order(starts, 50.0, scheduler=parse_policy('holes:40:0')) for _ in range(2)]
+    assert np.array_equal(*orders)
+
+
+@pytest.mark.parametrize('calibration', ['legacy', 'holes:10:0', 'holes:4:0', 'holes:10:5',
+                                         'travel:2000:500'])
+def test_order_is_not_slower(tmp_path, calibration):
+
+    totals = {}
+    for optimize_order in (False, True):
+        result_dir = tmp_path / str(optimize_order)
+        result_dir.mkdir()
+        process_part(CUBE_PATH, str(result_dir), optimize_order=optimize_order,
+                     scheduler=parse_policy(calibration))
+        totals[optimize_order] = simulate_file(result_paths(str(result_dir), 'cube')['tsc'])['total']
+
+    assert totals[True] <= totals[False]
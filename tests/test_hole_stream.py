@@ -0,0 +1,60 @@
+#test_hole_stream.py
+
+'''
+Потоковый разбор JSON не должен зависеть от того, где граница блока чтения разрезает
+значение.
+'''
+
+import io
+import json
+
+from hole_stream import JsonStream, iter_holes, read_header
+
+
+DOCUMENT = {
+    'holes': {
+        'hole_1': {'start': {'X': 12.5, 'Y': -3e-2, 'Z': 100}, 'end': {'X': 1.25E+2, 'Y': 0, 'Z': -7.125}},
+        'hole_2': {'start': {'X': -0.5, 'Y': 1e3, 'Z': 3.0}, 'end': {'X': 4, 'Y': 5.75, 'Z': 6}},
+    },
+    'flags': [True, False, None, 'text, with: delimiters'],
+    'endoscope_length': 254.5,
+    'starting_height': 12.75,
+}
+
+
+def read_stream(stream: JsonStream):
+    '''
+    Полный разбор значения через iter_object / read_value.
+    '''
+    if stream.peek() == '{':
+        return {key: read_stream(stream) for key in stream.iter_object()}
+
+    return stream.read_value()
+
+
+def test_every_chunk_boundary():
+
+    for indent in (None, 4):
+        text = json.dumps(DOCUMENT, indent=indent)
+        for chunk_size in range(1, len(text) + 1):
+            stream = JsonStream(io.StringIO(text), chunk_size)
+            assert read_stream(stream) == DOCUMENT, chunk_size
+
+
+def test_split_numbers():
+
+    for chunk_size in (1, 3, 9):
+        stream = JsonStream(io.StringIO('{"a": 12.5, "b": 3}'), chunk_size)
+        assert read_stream(stream) == {'a': 12.5, 'b': 3}
+
+
+def test_header_after_holes(tmp_path):
+
+    path = tmp_path / 'part.json'
+    path.write_text(json.dumps(DOCUMENT, indent=4))
+
+    assert read_header(str(path)) == {'endoscope_length': 254.5, 'starting_height': 12.75}
+
+    expected = list(iter_holes(str(path)))
+    for chunk_size in range(1, 200):
+        assert list(iter_holes(str(path), chunk_size)) == expected, chunk_size
@@ -0,0 +1,56 @@
+#test_post_processor.py
+
+'''
+Постпроцессоры заменяют файлы результатов только при успешном завершении записи.
+'''
+
+import os
+
+import pytest
+
+from conftest import CUBE_PATH
+from endoscope_motion import process_part, result_paths
+from hole_table import HoleTable
+from post_processor import POST_PROCESSORS, open_post_processors, write_outputs
+
+
+OUTPUTS = tuple(POST_PROCESSORS)
+
+
+def read_files(paths: list) -> dict:
+
+    results = {}
+    for path in paths:
+        with open(path, 'rb') as file:
+            results[path] = file.read()
+
+    return results
+
+
+def test_abort_keeps_previous_results(tmp_path):
+
+    process_part(CUBE_PATH, str(tmp_path), outputs=OUTPUTS)
+
+    all_paths = result_paths(str(tmp_path), 'cube')
+    paths = [all_paths[POST_PROCESSORS[name].path_key] for name in OUTPUTS]
+    previous = read_files(paths)
+
+    table = HoleTable.load(all_paths['binary'], mmap=False)
+
+    def tables():
+        yield table[:5]
+        raise RuntimeError('ошибка расчета')
+
+    processors = open_post_processors(OUTPUTS, all_paths, {'starting_height': 0})
+    with pytest.raises(RuntimeError):
+        write_outputs(tables(), processors)
+
+    assert read_files(paths) == previous
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_close_replaces_results(tmp_path):
+
+    process_part(CUBE_PATH, str(tmp_path), outputs=OUTPUTS)
+
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
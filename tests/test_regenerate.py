@@ -0,0 +1,78 @@
+#test_regenerate.py
+
+'''
+Инкрементальный пересчет (regenerate_part) должен давать те же результаты, что и полный
+расчет (process_part) с теми же параметрами.
+'''
+
+import json
+import os
+
+import pytest
+
+from calibration_scheduler import parse_policy
+from conftest import CUBE_PATH
+from delay_planner import DelayPlanner
+from endoscope_motion import process_part, regenerate_part, result_paths
+
+
+OUTPUTS = ('terminal', 'json', 'gcode')
+
+
+def edited_part(path: str):
+    '''
+    Копия детали cube с измененным, удаленным и добавленным отверстием.
+    '''
+    with open(CUBE_PATH) as file:
+        part = json.load(file)
+
+    holes = part['holes']
+    holes['hole_4']['start']['X'] = holes['hole_4']['end']['X'] = -26.0
+    holes['hole_99'] = holes.pop('hole_7')
+
+    with open(path, 'w') as file:
+        json.dump(part, file, indent=4)
+
+
+def read_results(result_dir: str, name: str) -> dict:
+
+    paths = result_paths(result_dir, name)
+
+    results = {}
+    for key in ('tsc', 'coordinates', 'gcode'):
+        with open(paths[key]) as file:
+            results[key] = file.read()
+
+    return results
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'planner': True, 'calibration': 'holes:10:5', 'precision': 3},
+    {'planner': True, 'calibration': 'holes:10:5', 'precision': 3, 'optimize_order': True},
+    {'calibration': 'travel:2000:500', 'optimize': True},
+])
+def test_regenerate_matches_full_run(tmp_path, options):
+
+    options = dict(options)
+    planner = options.pop('planner', False)
+    calibration = options.pop('calibration', 'legacy')
+
+    def run(function, json_path, result_dir):
+        os.makedirs(result_dir, exist_ok=True)
+        return function(json_path, str(result_dir), planner=DelayPlanner() if planner else None,
+                        scheduler=parse_policy(calibration), outputs=OUTPUTS, **options)
+
+    part_path = tmp_path / 'cube.json'
+
+    # Предыдущий запуск по исходной детали, затем пересчет измененной.
+    with open(CUBE_PATH) as source, open(part_path, 'w') as target:
+        target.write(source.read())
+    run(process_part, str(part_path), tmp_path / 'incremental')
+
+    edited_part(part_path)
+    run(regenerate_part, str(part_path), tmp_path / 'incremental')
+
+    run(process_part, str(part_path), tmp_path / 'full')
+
+    assert read_results(tmp_path / 'incremental', 'cube') == read_results(tmp_path / 'full', 'cube')
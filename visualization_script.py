@@ -9,10 +9,14 @@ import numpy as np
 
 from endoscope import Endoscope
 from hole_center import Hole_center
+from hole_table import HoleTable
+from stl_loader import load_model
 
 '''Установка путей'''
 # Путь до модели
 model_path = 'src/stl/ImageToStl.com_p60k_301.stl'
+# Упрощение модели для интерактивного просмотра (None - полная сетка)
+model_lod = None
 # Путь до json файла(центры отверстия)
 hole_center_coordinate_path = 'src\json\hole_coordinate.json'
 # Путь до json файла(Координат положения эндоскопа)
@@ -32,19 +36,22 @@ ursina.window.fps_counter.enable = False
 ursina.window.fullscreen = False
 
 
+'''Общая таблица отверстий и положений эндоскопа (загружается один раз)'''
+hole_table = HoleTable.from_json(hole_center_coordinate_path, poses_path=endoscope_coordinate_path)
+
 '''Центы отверстий'''
-hc = Hole_center(json_path=hole_center_coordinate_path)
+hc = Hole_center(hole_table=hole_table, batched=True)
 object_point_list = hc.main()
 
 #encp = Endoscope(input_coordinate_dict={'start':[{'X':0, 'Y':0, 'Z':0}],
 #                                        'end':  [{'X':0, 'Y':20, 'Z':0}]})
 
 # Эндоскоп
-encp = Endoscope(json_path=endoscope_coordinate_path, point_objects_list=object_point_list)
+encp = Endoscope(hole_table=hole_table, point_objects_list=object_point_list)
 encp.main()
 
 # Деталь
-detail = ursina.Entity(model=model_path, color = ursina.color.hsv(0, 0, 1, .5))
+detail = ursina.Entity(model=load_model(model_path, lod=model_lod), color = ursina.color.hsv(0, 0, 1, .5))
 
 # Камера 
 ursina.EditorCamera()